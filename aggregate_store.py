@@ -0,0 +1,232 @@
+"""
+集計状態の保存（増分集計）
+
+明細CSVごとの集計の途中結果（AggregateState）とその合計を1つの状態ファイルに保存し、
+ファイルのサイズ・更新日時・内容のハッシュ値を記録します。次回以降は追加されたファイルの集計を合計に加え、
+削除・変更されたファイルの集計を合計から差し引くため、取引先ごと・カテゴリごと・期間ごとの集計は
+新しいデータの量に比例した時間で作れます。
+
+集計の前提（データディレクトリ、分析対象期間、取引先マスターデータ、取引先名の正規化、期間ごとの集計の単位）が
+変わった場合は、保存した状態を破棄してすべてのファイルを集計し直します。
+
+明細をまたいだ重複取引を除く場合は、ファイルごとに残した取引のフィンガープリントも保存し、追加されたファイルは
+それと照合します。削除・変更されたファイルと重複していたため取引を除いていたファイルは、集計し直します。
+"""
+
+import os
+
+import pandas as pd
+
+from aggregation import AggregateState
+from dedup import TransactionDeduplicator
+from ingest_cache import file_digest
+
+# 状態ファイルの形式を変更したら上げる（既存の状態は破棄される）
+STATE_VERSION = 2
+
+
+class AggregateStore:
+    """
+    明細CSVごとの集計結果と、その合計の保存先
+    """
+
+    def __init__(self, path, settings, periods=(), deduplicate=False):
+        """
+        Args:
+            path (str): 状態ファイルのパス。None の場合は保存しません
+            settings (dict): 集計の前提。保存時と異なる場合は状態を破棄する
+            periods (Iterable[str]): 期間ごとの集計の単位（"month", "week"）
+            deduplicate (bool): 明細をまたいで重複する取引を除くかどうか
+        """
+        self.path = path
+        self.settings = {**settings, "deduplicate": deduplicate}
+        self.periods = tuple(periods)
+        # 集計する前の取引データに deduplicator.begin / filter / commit を適用する（重複を除かない場合は None）
+        self.deduplicator = TransactionDeduplicator() if deduplicate else None
+        # ファイル名 -> {"size", "mtime_ns", "sha256"}
+        self.files = {}
+        # ファイル名 -> AggregateState（対象期間の行がないファイルは None）
+        self.contributions = {}
+        self.total = None
+        self._pending = {}
+        self.reused = 0
+        self.added = 0
+        self.subtracted = 0
+
+    @classmethod
+    def load(cls, path, settings, periods=(), deduplicate=False):
+        """
+        状態ファイルを読み込みます。ファイルがない場合や、壊れている・集計の前提が異なる場合は空の状態を返します。
+        """
+        store = cls(path, settings, periods, deduplicate)
+        if not path or not os.path.exists(path):
+            return store
+
+        try:
+            data = pd.read_pickle(path)
+            reason = None
+            if data.get("version") != STATE_VERSION:
+                reason = "状態ファイルの形式が変更されました"
+            elif tuple(data["periods"]) != store.periods:
+                reason = "期間ごとの集計の単位が変更されました"
+            else:
+                changed = [key for key in store.settings if data["settings"].get(key) != store.settings[key]]
+                if changed:
+                    reason = f"集計の前提が変更されました: {changed}"
+            if reason is not None:
+                print(f"集計状態 {path} を作り直します: {reason}")
+                return store
+            store.files = data["files"]
+            store.contributions = {
+                file: None if base is None else AggregateState(base, store.periods)
+                for file, base in data["contributions"].items()
+            }
+            if data["total"] is not None:
+                store.total = AggregateState(data["total"], store.periods)
+            if deduplicate:
+                store.deduplicator = TransactionDeduplicator(data["fingerprints"], data["duplicates"])
+        except Exception as e:
+            print(f"警告: 集計状態の読み込み中にエラーが発生しました: {e}")
+            return cls(path, settings, periods, deduplicate)
+        return store
+
+    def refresh(self, data_dir, files):
+        """
+        記録したファイルを現在のファイル一覧と照合し、集計が必要なファイルを返します。
+
+        削除されたファイルと内容が変わったファイルの集計は、この時点で合計から差し引きます。
+        サイズと更新日時が同じファイルはそのまま再利用し、異なる場合は内容のハッシュ値を比較します。
+        重複取引を除いている場合は、削除・変更されたファイルと重複していたため取引を除いていたファイルも集計し直します。
+
+        Args:
+            data_dir (str): 明細CSVが格納されているディレクトリ
+            files (list): 明細CSVのファイル名
+
+        Returns:
+            list: 集計が必要なファイル名（add で集計結果を加える）
+        """
+        removed = sorted(set(self.files) - set(files))
+        for file in removed:
+            print(f"集計状態から削除されたファイルの集計を差し引きます: {file}")
+
+        stale = []
+        for file in files:
+            path = os.path.join(data_dir, file)
+            stat = os.stat(path)
+            entry = self.files.get(file)
+            if entry is not None and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                self.reused += 1
+                continue
+
+            digest = file_digest(path)
+            if entry is not None and entry["sha256"] == digest:
+                # 内容は同じで更新日時だけが変わった
+                entry["size"] = stat.st_size
+                entry["mtime_ns"] = stat.st_mtime_ns
+                self.reused += 1
+                continue
+
+            self._pending[file] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+            stale.append(file)
+
+        released = self._release(removed + stale)
+        dependents = sorted(set(released) - set(removed) - set(stale))
+        if dependents:
+            print(f"重複取引を除いていたファイルを集計し直します: {dependents}")
+        for file in dependents:
+            self._pending[file] = released[file]
+            self.reused -= 1
+        return sorted(stale + dependents)
+
+    def add(self, file, state):
+        """
+        refresh が返したファイルの集計結果を合計に加えます。
+
+        Args:
+            file (str): 明細CSVのファイル名
+            state (AggregateState): ファイルの集計結果（海外取引の行は保持しない）。対象期間の行がない場合は None
+        """
+        if state is not None:
+            state = AggregateState(state.base, self.periods)
+            self.total = state if self.total is None else AggregateState.merge([self.total, state])
+        self.files[file] = self._pending.pop(file)
+        self.contributions[file] = state
+        self.added += 1
+
+    def result(self):
+        """
+        合計の集計結果を返します。集計する行がない場合は None を返します。
+        """
+        if self.total is None or self.total.base.empty:
+            return None
+        return self.total
+
+    def save(self):
+        """
+        状態をファイルに保存します。書き込み途中のファイルが残らないよう一時ファイル経由で置き換えます。
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        data = {
+            "version": STATE_VERSION,
+            "settings": self.settings,
+            "periods": list(self.periods),
+            "files": self.files,
+            "contributions": {
+                file: None if state is None else state.base for file, state in self.contributions.items()
+            },
+            "total": None if self.total is None else self.total.base,
+            "fingerprints": None if self.deduplicator is None else self.deduplicator.fingerprints,
+            "duplicates": None if self.deduplicator is None else self.deduplicator.duplicates,
+        }
+        tmp_path = f"{self.path}.tmp"
+        pd.to_pickle(data, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def report(self):
+        """
+        再利用・追加・差し引いたファイル数を表示します。
+        """
+        print(f"集計状態: 再利用 {self.reused}件 / 追加 {self.added}件 / 差し引き {self.subtracted}件")
+
+    def _release(self, files):
+        """
+        記録したファイルの集計を合計から差し引きます。
+
+        Returns:
+            dict: 差し引いたファイル名 -> ファイルの記録。重複取引を除いている場合は、差し引いたファイルと
+                重複していたため取引を除いていたファイルを含む
+        """
+        released = {}
+        pending = list(files)
+        while pending:
+            file = pending.pop()
+            if file in released or file not in self.files:
+                continue
+            released[file] = self.files.pop(file)
+            state = self.contributions.pop(file)
+            if state is not None:
+                self.total = self.total.subtract(state)
+            self.subtracted += 1
+            if self.deduplicator is not None:
+                pending.extend(self.deduplicator.remove(file))
+        return released
+
+
+def same_results(state, other):
+    """
+    2つの集計結果から書き出す内容（grouped / corporate_summary / 期間ごとの集計）が同じかどうかを返します。
+
+    途中結果の型（カテゴリ型かどうかなど）は結合の順序によって変わることがあるため、CSV の内容で比較します。
+    """
+    if state is None or other is None:
+        return state is None and other is None
+    frames = [lambda s: s.transaction_frequency(), lambda s: s.corporate_summary()]
+    frames += [lambda s, period=period: s.rollup(period) for period in state.periods]
+    return state.periods == other.periods and all(
+        frame(state).to_csv() == frame(other).to_csv() for frame in frames
+    )
@@ -0,0 +1,215 @@
+"""
+集計エンジン
+
+法人取引判定済みの取引データを1回の groupby で「取引内容 × カテゴリ × 法人取引フラグ × 期間」の単位に集計し、
+その結果から取引先ごとの集計（grouped）、カテゴリごとの法人取引の集計（corporate_summary）、
+月・週ごとの集計（rollup_month / rollup_week）を作ります。
+
+集計の途中結果（AggregateState）は結合できるため、ファイルやチャンク、ワーカーごとに集計した結果を
+まとめても、全体を一度に集計した場合と同じ結果になります。
+"""
+
+import pandas as pd
+
+# 期間ごとの集計に使える単位と、対応する pandas の期間の頻度
+ROLLUP_FREQUENCIES = {"month": "M", "week": "W-SUN"}
+
+KEY_COLUMNS = ["ご利用内容", "merchant_category", "is_corporate"]
+PERIOD_COLUMN = "期間"
+
+
+class AggregateState:
+    """
+    取引データの集計の途中結果
+    """
+
+    def __init__(self, base, periods=(), foreign=None):
+        """
+        Args:
+            base (pd.DataFrame): 取引内容・カテゴリ・法人取引フラグ・各期間をインデックスとし、
+                回数と合計金額を列に持つ集計結果
+            periods (Iterable[str]): 期間ごとの集計の単位（"month", "week"）
+            foreign (pd.DataFrame): 海外取引の行（保持しない場合は None）
+        """
+        self.base = base
+        self.periods = tuple(periods)
+        self.foreign = foreign
+
+    @classmethod
+    def from_frame(cls, df, periods=(), keep_foreign=True):
+        """
+        法人取引判定済みの取引データを集計します。
+
+        Args:
+            df (pd.DataFrame): 法人取引判定済みの取引データ
+            periods (Iterable[str]): 期間ごとの集計の単位（"month", "week"）
+            keep_foreign (bool): 海外取引の行を保持するかどうか（ストリーミングモードでは別途書き出すため保持しない）
+
+        Returns:
+            AggregateState: 集計の途中結果
+        """
+        periods = tuple(periods)
+        # カテゴリやフラグの欠損値も1つのグループとして残し、取引内容の欠損値だけを後で除く（従来の集計と同じ扱い）
+        base = (
+            df["金額"]
+            .groupby(_group_keys(df, periods), observed=True, dropna=False, sort=True)
+            .agg(["size", "sum"])
+            .set_axis(["回数", "合計金額"], axis=1)
+        )
+        base = base[base.index.get_level_values("ご利用内容").notna()]
+
+        foreign = None
+        if keep_foreign:
+            foreign = df[df["現地通貨建て金額"].notnull()].copy()
+        return cls(base, periods, foreign)
+
+    @classmethod
+    def from_totals(cls, totals, periods=()):
+        """
+        取引内容・カテゴリ・法人取引フラグ・ご利用日ごとに集計済みの回数と合計金額（取引データストアで
+        集計した結果など）から、途中結果を作ります。海外取引の行は保持しません。
+
+        Args:
+            totals (pd.DataFrame): ご利用内容・merchant_category・is_corporate・ご利用日・回数・合計金額の列を持つ集計結果
+            periods (Iterable[str]): 期間ごとの集計の単位（"month", "week"）
+
+        Returns:
+            AggregateState: from_frame で取引データを集計した場合と同じ途中結果
+        """
+        periods = tuple(periods)
+        base = (
+            totals[["回数", "合計金額"]]
+            .groupby(_group_keys(totals, periods), observed=True, dropna=False, sort=True)
+            .sum()
+        )
+        base = base[base.index.get_level_values("ご利用内容").notna()]
+        return cls(base, periods)
+
+    @classmethod
+    def merge(cls, states):
+        """
+        複数の途中結果を結合します。海外取引の行は states の順に結合されます。
+
+        Args:
+            states (list): AggregateState のリスト（期間の単位が同じであること）
+
+        Returns:
+            AggregateState: 結合した途中結果
+        """
+        states = list(states)
+        periods = states[0].periods
+        if any(state.periods != periods for state in states):
+            raise ValueError("期間の単位が異なる集計結果は結合できません")
+        # 空の途中結果はインデックスがカテゴリ型にならないため、結合結果の型が変わらないよう除く
+        bases = [state.base for state in states if not state.base.empty] or [states[0].base]
+        base = pd.concat(bases)
+        base = base.groupby(
+            level=list(range(base.index.nlevels)), observed=True, dropna=False, sort=True
+        ).sum()
+
+        foreign = None
+        if all(state.foreign is not None for state in states):
+            foreign = pd.concat([state.foreign for state in states])
+        return cls(base, periods, foreign)
+
+    def subtract(self, other):
+        """
+        途中結果から other の集計を差し引きます。海外取引の行は保持しません。
+
+        Args:
+            other (AggregateState): self に結合済みの途中結果（期間の単位が同じであること）
+
+        Returns:
+            AggregateState: 差し引いた途中結果。回数が0になったグループは除く
+        """
+        if other.periods != self.periods:
+            raise ValueError("期間の単位が異なる集計結果は差し引けません")
+        if other.base.empty:
+            return AggregateState(self.base, self.periods)
+        negated = AggregateState(-other.base, self.periods)
+        base = AggregateState.merge([self, negated]).base
+        return AggregateState(base[base["回数"] != 0], self.periods)
+
+    def _flat(self):
+        return self.base.reset_index()
+
+    def transaction_frequency(self, top=None, by="回数"):
+        """
+        取引先ごとの利用回数、合計金額、法人フラグ、カテゴリを返します（grouped.csv）。
+
+        Args:
+            top (int): 指定した場合は、by の大きい順に top 件の取引先だけを返す（すべて返した場合の先頭 top 件と同じ）
+            by (str): 並べ替える列（"回数" または "合計金額"）
+
+        Returns:
+            pd.DataFrame: by の大きい順に並んだ取引先ごとの集計結果。同じ値の取引先は取引内容の順に並ぶ
+        """
+        grouped = (
+            self._flat()
+            .groupby("ご利用内容", observed=True, sort=True)
+            .agg(
+                回数=("回数", "sum"),
+                合計金額=("合計金額", "sum"),
+                法人取引=("is_corporate", "first"),
+                カテゴリ=("merchant_category", "first"),
+            )
+        )
+        if top is not None:
+            # 選んだ取引先も、すべて返す場合と同じく取引内容の順から安定に並べ替える
+            grouped = grouped.nlargest(top, by, keep="first").sort_index()
+        return grouped.sort_values(by, ascending=False, kind="stable")
+
+    def corporate_summary(self):
+        """
+        法人取引（is_corporate=3）のカテゴリごとの取引回数と合計金額を返します（corporate_summary.csv）。
+        """
+        flat = self._flat()
+        return (
+            flat[flat["is_corporate"] == 3]
+            .groupby("merchant_category", observed=True, sort=True)
+            .agg(取引回数=("回数", "sum"), 合計金額=("合計金額", "sum"))
+        )
+
+    def foreign_transactions(self):
+        """
+        海外取引の行を返します（foreign.csv）。
+        """
+        if self.foreign is None:
+            raise ValueError("海外取引の行を保持していない集計結果です")
+        return self.foreign
+
+    def rollup(self, period):
+        """
+        期間 × 取引内容 × カテゴリ × 法人取引フラグごとの回数と合計金額を返します。
+
+        Args:
+            period (str): 期間の単位（"month", "week"）。from_frame で指定した単位であること
+
+        Returns:
+            pd.DataFrame: 期間の順に並んだ集計結果。期間は "2024-01"（月）、"2024-01-01/2024-01-07"（週）の形式
+        """
+        if period not in self.periods:
+            raise ValueError(f"集計していない期間です: {period}")
+        rollup = (
+            self._flat()
+            .groupby([period] + KEY_COLUMNS, observed=True, dropna=False, sort=True)[["回数", "合計金額"]]
+            .sum()
+        )
+        # 期間の文字列への変換は集計後の（重複のない）値にだけ行う
+        labels = rollup.index.levels[0].astype(str)
+        return rollup.set_axis(
+            rollup.index.set_levels(labels, level=0).rename(PERIOD_COLUMN, level=0), axis=0
+        )
+
+
+def _group_keys(df, periods):
+    """
+    集計の単位（取引内容・カテゴリ・法人取引フラグと、期間ごとの集計の単位の期間）の列を返します。
+    """
+    for period in periods:
+        if period not in ROLLUP_FREQUENCIES:
+            raise ValueError(f"未対応の集計期間です: {period}")
+    keys = [df[column] for column in KEY_COLUMNS]
+    for period in periods:
+        keys.append(df["ご利用日"].dt.to_period(ROLLUP_FREQUENCIES[period]).rename(period))
+    return keys
@@ -0,0 +1,73 @@
+"""
+CSV の読み込み方法のベンチマーク
+
+合成データの大きな明細CSV（1ファイル）を、CSV_READER の各方法（pandas / pyarrow）で読み込み、
+読み込みだけの時間と、読み込み・前処理（read_transaction_file）の時間を比較します。
+各方法で読み込んだ結果が同じであることも確認します。
+
+実行方法:
+    python benchmarks/bench_csv_reader.py [行数]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from csv_reader import PYARROW_AVAILABLE, READER_BACKENDS
+from synthetic_data import generate_dataset
+
+DEFAULT_ROWS = 1_000_000
+REPEAT = 3
+
+
+def best_time(func, *args, **kwargs):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main_benchmark():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    if not PYARROW_AVAILABLE:
+        print("pyarrow がインストールされていないため、pandas だけを計測します。")
+    backends = [backend for backend in READER_BACKENDS if backend == "pandas" or PYARROW_AVAILABLE]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir, _ = generate_dataset(tmp_dir, rows, files=1)
+        path = os.path.join(data_dir, os.listdir(data_dir)[0])
+        size_mb = os.path.getsize(path) / 2**20
+
+        results = {}
+        for backend in backends:
+            with patch("main.CSV_READER", backend):
+                read_time, _ = best_time(main.read_transaction_csv, path)
+                total_time, (df, error) = best_time(
+                    main.read_transaction_file, path, preprocess=True, period=None
+                )
+            if error is not None:
+                raise RuntimeError(error)
+            results[backend] = (read_time, total_time, df)
+
+    # 読み込み方法によらず同じ結果になることを確認する
+    expected = results["pandas"][2]
+    for backend, (_, _, df) in results.items():
+        pd.testing.assert_frame_equal(df, expected)
+
+    print(f"行数: {rows:,}件 / ファイルサイズ: {size_mb:.1f}MB / CPU: {os.cpu_count()}")
+    print(f"{'方法':>8} {'読み込み[s]':>12} {'読み込み+前処理[s]':>20} {'読み込みの高速化':>16}")
+    base_read = results["pandas"][0]
+    for backend, (read_time, total_time, _) in results.items():
+        print(f"{backend:>8} {read_time:>12.3f} {total_time:>20.3f} {base_read / read_time:>15.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
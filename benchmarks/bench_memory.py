@@ -0,0 +1,80 @@
+"""
+取引データのメモリ使用量のベンチマーク
+
+前処理・法人取引判定後の取引データについて、従来の型（文字列は object、整数は int64）と
+compact_transaction_data で変換した型の列ごとのメモリ使用量と、集計にかかる時間を比較します。
+
+実行方法:
+    python benchmarks/bench_memory.py [行数]
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from synthetic_data import generate_dataset
+
+DEFAULT_ROWS = 1_000_000
+MERCHANTS = 5000
+REPEAT = 5
+
+
+def load(rows, tmp_dir):
+    data_dir, merchant_config = generate_dataset(tmp_dir, rows, merchants=MERCHANTS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        merchants_df = main.load_merchant_config(path=merchant_config)
+        df = main.preprocess_transaction_data(main.load_transaction_data(data_dir, period=None), None)
+    return df, merchants_df
+
+
+def best_time(func, df):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(df)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main_benchmark():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        df, merchants_df = load(rows, tmp_dir)
+
+    legacy_df = main.identify_corporate_transactions(df.copy(), merchants_df)
+    compact_df = main.identify_corporate_transactions(main.compact_transaction_data(df), merchants_df)
+
+    legacy_memory = legacy_df.memory_usage(deep=True, index=False)
+    compact_memory = compact_df.memory_usage(deep=True, index=False)
+    print(f"行数: {rows:,}件 / 取引内容: {MERCHANTS:,}種類")
+    print(f"{'列':>16} {'従来の型':>16} {'[MB]':>8} {'変換後の型':>16} {'[MB]':>8}")
+    for column in legacy_df.columns:
+        print(
+            f"{column:>16} {str(legacy_df[column].dtype):>16} {legacy_memory[column] / 2**20:>8.1f} "
+            f"{str(compact_df[column].dtype):>16} {compact_memory[column] / 2**20:>8.1f}"
+        )
+    print(
+        f"{'合計':>16} {'':>16} {legacy_memory.sum() / 2**20:>8.1f} {'':>16} {compact_memory.sum() / 2**20:>8.1f}"
+        f"  ({legacy_memory.sum() / compact_memory.sum():.1f}x)"
+    )
+
+    print(f"\n{'集計':>32} {'従来の型[s]':>12} {'変換後の型[s]':>14} {'高速化':>8}")
+    for func in (main.analyze_transaction_frequency, main.analyze_corporate_transactions):
+        # 結果が変換前と同じであることを確認する
+        pd.testing.assert_frame_equal(
+            func(compact_df).reset_index().astype(object), func(legacy_df).reset_index().astype(object)
+        )
+        legacy_time = best_time(func, legacy_df)
+        compact_time = best_time(func, compact_df)
+        print(f"{func.__name__:>32} {legacy_time:>12.3f} {compact_time:>14.3f} {legacy_time / compact_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
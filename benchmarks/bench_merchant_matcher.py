@@ -0,0 +1,84 @@
+"""
+法人取引判定のベンチマーク
+
+従来の iterrows による判定と MerchantMatcher による判定の処理時間を、
+ルール数を変えながら比較します。
+
+実行方法:
+    python benchmarks/bench_merchant_matcher.py
+"""
+
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+
+RULE_COUNTS = [10, 100, 1000, 3000]
+TRANSACTION_COUNT = 200
+UNIQUE_DESCRIPTION_COUNT = 100
+
+
+def legacy_identify_corporate_transactions(df, merchants_df):
+    """変更前の iterrows による判定"""
+
+    def match_merchant(transaction):
+        for _, merchant in merchants_df.iterrows():
+            if merchant["merchant_name"] in transaction:
+                return pd.Series([merchant["is_corporate"], merchant["category"]])
+        return pd.Series([0, ""])
+
+    df[["is_corporate", "merchant_category"]] = df["ご利用内容"].apply(match_merchant)
+    df["is_corporate"] = df["is_corporate"].astype(int)
+    return df
+
+
+def make_merchants(rule_count, rng):
+    names = [f"MERCHANT {i:05d} {rng.choice(['INC', 'LTD', '店'])}" for i in range(rule_count)]
+    return pd.DataFrame(
+        {
+            "merchant_name": names,
+            "is_corporate": [rng.choice([0, 1, 2, 3]) for _ in names],
+            "category": [f"category_{i % 20}" for i in range(rule_count)],
+        }
+    )
+
+
+def make_transactions(merchants_df, rng):
+    names = merchants_df["merchant_name"].tolist()
+    # 半分程度はどのルールにも一致しない取引内容にする
+    vocabulary = [
+        f"{rng.choice(names)} TOKYO" if i % 2 else f"UNKNOWN SHOP {i}"
+        for i in range(UNIQUE_DESCRIPTION_COUNT)
+    ]
+    return pd.DataFrame({"ご利用内容": [rng.choice(vocabulary) for _ in range(TRANSACTION_COUNT)]})
+
+
+def measure(func, df, merchants_df):
+    start = time.perf_counter()
+    result = func(df.copy(), merchants_df)
+    return time.perf_counter() - start, result
+
+
+def main_benchmark():
+    rng = random.Random(0)
+    print(f"取引件数: {TRANSACTION_COUNT}件 (取引内容 {UNIQUE_DESCRIPTION_COUNT}種類)")
+    print(f"{'ルール数':>8} {'iterrows[s]':>12} {'matcher[s]':>12} {'高速化':>8}")
+    for rule_count in RULE_COUNTS:
+        merchants_df = make_merchants(rule_count, rng)
+        df = make_transactions(merchants_df, rng)
+
+        legacy_time, legacy_result = measure(legacy_identify_corporate_transactions, df, merchants_df)
+        new_time, new_result = measure(main.identify_corporate_transactions, df, merchants_df)
+
+        # 照合したルールの列は従来の実装にないため、比較しない
+        pd.testing.assert_frame_equal(legacy_result, new_result.drop(columns="matched_rule"), check_dtype=False)
+        print(f"{rule_count:>8} {legacy_time:>12.3f} {new_time:>12.3f} {legacy_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,68 @@
+"""
+結果ファイルの書き出しのベンチマーク
+
+合成データを読み込み・法人取引判定まで済ませた取引データについて、write_analysis_results の実行時間と
+結果ファイルの合計サイズを、圧縮方法（OUTPUT_COMPRESSION）と並列数（OUTPUT_WORKERS）の組み合わせごとに比較します。
+
+実行方法:
+    python benchmarks/bench_outputs.py [行数]
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from instrumentation import RunProfiler
+from outputs import ZSTD_AVAILABLE
+from synthetic_data import generate_dataset
+
+DEFAULT_ROWS = 1_000_000
+REPEAT = 3
+
+
+def prepare(data_dir, merchant_config):
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = main.load_transaction_data(data_dir, period=None)
+        df = main.preprocess_transaction_data(df, None)
+        df = main.compact_transaction_data(df)
+        return main.identify_corporate_transactions(df, main.load_merchant_config(path=merchant_config))
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main_benchmark():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    compressions = [None, "gzip"] + (["zstd"] if ZSTD_AVAILABLE else [])
+    if not ZSTD_AVAILABLE:
+        print("zstandard がインストールされていないため、zstd は計測しません。")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir, merchant_config = generate_dataset(tmp_dir, rows)
+        df = prepare(data_dir, merchant_config)
+
+        print(f"行数: {rows:,}件 / CPU: {os.cpu_count()}")
+        print(f"{'圧縮':>6} {'並列数':>6} {'書き出し[s]':>12} {'合計サイズ[MB]':>16}")
+        for compression in compressions:
+            for workers in (1, 4):
+                result_dir = os.path.join(tmp_dir, f"results_{compression}_{workers}")
+                os.makedirs(result_dir)
+                times = []
+                with patch("main.OUTPUT_COMPRESSION", compression), patch("main.OUTPUT_WORKERS", workers):
+                    for _ in range(REPEAT):
+                        start = time.perf_counter()
+                        main.write_analysis_results(df, result_dir, {}, RunProfiler())
+                        times.append(time.perf_counter() - start)
+                size_mb = directory_size(result_dir) / 2**20
+                print(f"{str(compression):>6} {workers:>6} {min(times):>12.3f} {size_mb:>16.1f}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,170 @@
+"""
+処理全体のベンチマーク
+
+合成データ（synthetic_data.py）を複数の規模で生成し、処理の段階ごとに実行時間とメモリ使用量の
+ピーク（tracemalloc で計測した、その段階で新たに確保した量）を計測します。
+結果は JSON ファイルに保存されるため、--compare で別のコミットの結果と比較できます。
+
+実行方法:
+    python benchmarks/bench_pipeline.py [--scales 10000 100000 1000000] [--output 結果.json]
+        [--compare 比較対象.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from outputs import ResultWriter
+from synthetic_data import generate_dataset
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+FILES = 12
+MERCHANTS = 5000
+FOREIGN_RATIO = 0.05
+# 前年の明細も含め、対象年での絞り込みが効く状態で計測する
+YEARS = [2023, 2024]
+TARGET_YEAR = "2024"
+
+
+def measure(stages, name, func, *args):
+    """
+    func を実行し、実行時間とメモリ使用量のピークを stages に記録して戻り値を返します。
+
+    tracemalloc は小さなオブジェクトを多く確保する処理を遅くするため、実行時間を計測する実行と
+    メモリ使用量を計測する実行を分けます（各段階は同じ入力に対して何度実行しても同じ結果になります）。
+    """
+    # 各段階が表示するメッセージは計測結果の表示の妨げになるため捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    stages[name] = {"seconds": round(seconds, 4), "peak_mb": round(peak / 2**20, 2)}
+    return result
+
+
+def write_results(result_dir, df, frequency, corporate, foreign):
+    writer = ResultWriter(result_dir)
+    writer.write("concatenated", df, index=False, partitioned=True)
+    writer.write("grouped", frequency)
+    writer.write("corporate_summary", corporate)
+    writer.write("foreign", foreign, index=False, partitioned=True)
+    writer.close()
+
+
+def run_scale(rows, tmp_dir):
+    """
+    1つの規模で合成データを生成し、各段階を計測します。
+    """
+    data_dir, merchant_config = generate_dataset(
+        os.path.join(tmp_dir, f"rows_{rows}"), rows, FILES, MERCHANTS, FOREIGN_RATIO, YEARS
+    )
+    result_dir = os.path.join(tmp_dir, f"results_{rows}")
+    os.makedirs(result_dir)
+    period = main.analysis_period(TARGET_YEAR)
+
+    stages = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        merchants_df = main.load_merchant_config(path=merchant_config)
+    df = measure(stages, "load_transaction_data", main.load_transaction_data, data_dir, 1, False, None, period)
+    df = measure(stages, "preprocess_transaction_data", main.preprocess_transaction_data, df, period)
+    df = measure(stages, "identify_corporate_transactions", main.identify_corporate_transactions, df, merchants_df)
+    frequency = measure(stages, "analyze_transaction_frequency", main.analyze_transaction_frequency, df)
+    corporate = measure(stages, "analyze_corporate_transactions", main.analyze_corporate_transactions, df)
+    foreign = measure(stages, "get_foreign_transactions", main.get_foreign_transactions, df)
+    measure(stages, "write_csv", write_results, result_dir, df, frequency, corporate, foreign)
+
+    total = sum(stage["seconds"] for stage in stages.values())
+    print(f"\n行数: {rows:,}件 (対象年 {TARGET_YEAR} の行: {len(df):,}件) 合計 {total:.3f}s")
+    print(f"{'':>32} {'時間[s]':>10} {'ピーク[MB]':>12}")
+    for name, stage in stages.items():
+        print(f"{name:>32} {stage['seconds']:>10.3f} {stage['peak_mb']:>12.1f}")
+    return {"rows": rows, "analyzed_rows": len(df), "files": FILES, "merchants": MERCHANTS, "stages": stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """
+    保存済みの結果と規模・段階ごとの実行時間を比較して表示します。
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    baseline_scales = {scale["rows"]: scale for scale in baseline["scales"]}
+    print(f"\n比較対象: {baseline_path} (コミット {baseline.get('commit')})")
+    for scale in results["scales"]:
+        base = baseline_scales.get(scale["rows"])
+        if base is None:
+            continue
+        print(f"\n行数: {scale['rows']:,}件")
+        print(f"{'':>32} {'比較対象[s]':>12} {'今回[s]':>10} {'比率':>8}")
+        for name, stage in scale["stages"].items():
+            if name not in base["stages"]:
+                continue
+            before = base["stages"][name]["seconds"]
+            ratio = stage["seconds"] / before if before else float("nan")
+            print(f"{name:>32} {before:>12.3f} {stage['seconds']:>10.3f} {ratio:>7.2f}x")
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="処理の段階ごとの実行時間とメモリ使用量を計測します。")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="明細の行数")
+    parser.add_argument("--output", help="結果の保存先（既定: benchmarks/results/pipeline_<コミット>_<日時>.json）")
+    parser.add_argument("--compare", help="比較対象の結果ファイル")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "scales": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in args.scales:
+            results["scales"].append(run_scale(rows, tmp_dir))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"pipeline_{commit or 'unknown'}_{timestamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main_benchmark()
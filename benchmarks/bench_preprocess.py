@@ -0,0 +1,95 @@
+"""
+明細の読み込み・前処理のベンチマーク
+
+変更前の処理（金額を文字列で読み込み、複数回の置換と split で解析してから対象年で絞り込む）と、
+現在の処理（読み込み時に金額を数値化し、対象年で絞り込んでから1回の抽出で海外通貨を解析する）を比較します。
+
+実行方法:
+    python benchmarks/bench_preprocess.py [行数]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+
+DEFAULT_ROWS = 1_000_000
+YEARS = ["2020", "2021", "2022", "2023", "2024"]
+TARGET_YEAR = "2024"
+FOREIGN_RATIO = 0.05
+
+
+def legacy_read(path):
+    """変更前の読み込み"""
+    return pd.read_csv(path, encoding="cp932", dtype={"金額": str, "海外通貨利用金額": str})
+
+
+def legacy_preprocess(df):
+    """変更前の前処理"""
+    df["ご利用内容"] = df["ご利用内容"].str.strip()
+    df["金額"] = df["金額"].str.replace('"', "").str.replace(",", "").astype(int)
+    df["海外通貨利用金額"] = df["海外通貨利用金額"].str.replace('"', "").str.replace(",", "")
+    df["現地通貨建て金額"] = df["海外通貨利用金額"].str.split().str[0]
+    df["通貨"] = df["海外通貨利用金額"].str.split().str[1]
+    df = df.drop(columns=["海外通貨利用金額"])
+    return df[df["ご利用日"].str.contains(TARGET_YEAR)]
+
+
+def write_statement(path, rows):
+    rng = random.Random(0)
+    merchants = [f"MERCHANT {i:04d} " for i in range(2000)] + ["セブンイレブン ", "まいばすけっと "]
+    with open(path, "w", encoding="cp932", newline="") as f:
+        f.write("ご利用日,ご利用内容,金額,海外通貨利用金額\n")
+        for _ in range(rows):
+            date = f"{rng.choice(YEARS)}/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}"
+            amount = f"{rng.randint(100, 500000):,}"
+            foreign = ""
+            if rng.random() < FOREIGN_RATIO:
+                foreign = f'"{rng.randint(1, 5000):,}.{rng.randint(0, 99):02d} {rng.choice(["USD", "EUR"])}"'
+            f.write(f'{date},{rng.choice(merchants)},"{amount}",{foreign}\n')
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main_benchmark():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "statement.csv")
+        write_statement(path, rows)
+
+        legacy_read_time, legacy_df = timed(legacy_read, path)
+        legacy_preprocess_time, legacy_result = timed(legacy_preprocess, legacy_df)
+
+        new_read_time, new_df = timed(main.read_transaction_csv, path)
+        with patch("main.TARGET_YEAR", TARGET_YEAR):
+            new_preprocess_time, new_result = timed(main.preprocess_transaction_data, new_df)
+
+    # ご利用日が日付型、現地通貨建て金額が数値型になった以外は同じ結果になることを確認する
+    legacy_result = legacy_result.assign(
+        ご利用日=pd.to_datetime(legacy_result["ご利用日"], format="%Y/%m/%d"),
+        現地通貨建て金額=pd.to_numeric(legacy_result["現地通貨建て金額"]),
+    )
+    pd.testing.assert_frame_equal(legacy_result, new_result, check_dtype=False)
+
+    print(f"行数: {rows:,}件 (対象年 {TARGET_YEAR} の行: {len(new_result):,}件)")
+    print(f"{'':>8} {'読み込み[s]':>12} {'前処理[s]':>12} {'合計[s]':>10}")
+    legacy_total = legacy_read_time + legacy_preprocess_time
+    new_total = new_read_time + new_preprocess_time
+    print(f"{'変更前':>8} {legacy_read_time:>12.3f} {legacy_preprocess_time:>12.3f} {legacy_total:>10.3f}")
+    print(f"{'現在':>8} {new_read_time:>12.3f} {new_preprocess_time:>12.3f} {new_total:>10.3f}")
+    print(f"前処理の高速化: {legacy_preprocess_time / new_preprocess_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
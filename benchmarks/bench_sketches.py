@@ -0,0 +1,96 @@
+"""
+上位の取引先と取引先の種類数の集計のベンチマーク
+
+合成データを読み込み・法人取引判定まで済ませた取引データについて、次の集計の実行時間と誤差を比較します。
+
+- 取引先ごとの集計の並べ替え: 全体の並べ替えと上位 K 件だけの選択（TOP_MERCHANTS）
+- 利用回数の多い取引先: 正確な集計と近似集計（HeavyHitters）
+- カテゴリ × 月ごとの取引先の種類数: 正確な集計（nunique）と近似集計（HyperLogLog）
+
+実行方法:
+    python benchmarks/bench_sketches.py [行数] [取引先の数]
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from aggregation import AggregateState
+from sketches import MerchantSketches
+from synthetic_data import generate_dataset
+
+DEFAULT_ROWS = 1_000_000
+DEFAULT_MERCHANTS = 100_000
+TOP_K = 50
+CAPACITY = 1000
+REPEAT = 3
+
+
+def prepare(data_dir, merchant_config):
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = main.load_transaction_data(data_dir, period=None)
+        df = main.preprocess_transaction_data(df, None)
+        df = main.compact_transaction_data(df)
+        return main.identify_corporate_transactions(df, main.load_merchant_config(path=merchant_config))
+
+
+def measure(func):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def exact_distinct(df):
+    months = df["ご利用日"].dt.to_period("M").astype(str)
+    return df.groupby([df["merchant_category"].astype(object).fillna(""), months])["ご利用内容"].nunique()
+
+
+def approximate(df):
+    sketches = MerchantSketches(CAPACITY)
+    sketches.update(df)
+    return sketches
+
+
+def main_benchmark():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    merchants = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MERCHANTS
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir, merchant_config = generate_dataset(tmp_dir, rows, merchants=merchants)
+        df = prepare(data_dir, merchant_config)
+        state = AggregateState.from_frame(df, keep_foreign=False)
+
+        full_seconds, full = measure(state.transaction_frequency)
+        top_seconds, top = measure(lambda: state.transaction_frequency(TOP_K))
+        exact_seconds, exact = measure(lambda: (df.groupby("ご利用内容", observed=True).size(), exact_distinct(df)))
+        sketch_seconds, sketches = measure(lambda: approximate(df))
+
+        counts, distinct = exact
+        estimated_top = sketches.by_count.top(TOP_K)
+        truth = counts.reindex(estimated_top.index)
+        estimated = sketches.distinct_merchants()["取引先数"].to_numpy()
+        relative = abs(estimated - distinct.to_numpy()) / distinct.to_numpy()
+
+        print(f"行数: {rows:,}件 / 取引先: {len(counts):,}件 / 上位: {TOP_K}件")
+        print(f"{'集計':<28} {'実行時間[s]':>12}")
+        print(f"{'取引先ごとの集計（全体の並べ替え）':<28} {full_seconds:>12.3f}")
+        print(f"{'取引先ごとの集計（上位の選択）':<28} {top_seconds:>12.3f}")
+        print(f"{'正確な集計（回数・種類数）':<28} {exact_seconds:>12.3f}")
+        print(f"{'近似集計（回数・金額・種類数）':<28} {sketch_seconds:>12.3f}")
+        print()
+        print(f"上位の選択が全体の並べ替えの先頭と一致: {top.index.equals(full.index[:TOP_K])}")
+        print(f"上位の取引先の誤差の上限: {sketches.by_count.error:,}件（保証: {len(df) // (CAPACITY + 1):,}件以下）")
+        print(f"上位の取引先の推定値と真の値の差の最大: {int((truth - estimated_top['推定値']).max()):,}件")
+        print(f"種類数の相対誤差: 平均 {relative.mean():.2%} / 最大 {relative.max():.2%}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,53 @@
+"""
+起動時間のベンチマーク
+
+コマンドラインの --help / --check と、ライブラリとしての main の読み込みにかかる時間を
+別プロセスで計測します。--help と --check は pandas を読み込まないため、
+main の読み込みより大幅に短い時間で終わるはずです。
+
+実行方法:
+    python benchmarks/bench_startup.py [繰り返し回数]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_REPEAT = 10
+
+COMMANDS = {
+    "python -c pass": [sys.executable, "-c", "pass"],
+    "cli.py --help": [sys.executable, "cli.py", "--help"],
+    "cli.py --check": [sys.executable, "cli.py", "--check"],
+    "import main": [sys.executable, "-c", "import main"],
+}
+
+
+def measure(command, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main_benchmark():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPEAT
+    # 初回はバイトコードのコンパイルを含むため計測しない
+    for command in COMMANDS.values():
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, check=False)
+
+    results = {name: measure(command, repeat) for name, command in COMMANDS.items()}
+    print(f"繰り返し回数: {repeat}回（中央値）")
+    print(f"{'':>16} {'時間[ms]':>10}")
+    for name, seconds in results.items():
+        print(f"{name:>16} {seconds * 1000:>10.1f}")
+    print(f"--help の高速化（import main との比較）: {results['import main'] / results['cli.py --help']:.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
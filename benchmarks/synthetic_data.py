@@ -0,0 +1,181 @@
+"""
+ベンチマーク用の合成データの生成
+
+AMEXの明細CSVと同じ形式（CP932、金額は桁区切りのカンマ付き）の明細ファイルと、
+取引先マスターデータを生成します。明細は期間を分割してファイルごとにご利用日順に書き出すため、
+実際の明細と同じく各ファイルは連続した期間の取引になります。
+
+実行方法:
+    python benchmarks/synthetic_data.py 出力先 [--rows 1000000] [--files 12] [--merchants 5000]
+        [--foreign-ratio 0.05] [--years 2023 2024] [--seed 0]
+
+出力先に data/（明細CSV）と merchants.csv（取引先マスターデータ）を作成します。
+"""
+
+import argparse
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+HEADER = ["ご利用日", "ご利用内容", "金額", "海外通貨利用金額"]
+MERCHANT_HEADER = ["merchant_name", "is_corporate", "category"]
+
+CATEGORIES = [
+    "cloud_services",
+    "developer_tools",
+    "business_media",
+    "travel",
+    "restaurant",
+    "grocery",
+    "convenience_store",
+    "entertainment",
+]
+CURRENCIES = ["USD", "EUR", "GBP", "SGD"]
+SUFFIXES = ["", " TOKYO", " JP", " 東京", " ｵﾝﾗｲﾝ", " 店"]
+LATIN_WORDS = ["CLOUD", "SOFT", "DATA", "NET", "LABS", "MEDIA", "TRAVEL", "MART", "CAFE", "SHOP"]
+JAPANESE_WORDS = ["さくら", "みどり", "ひかり", "スーパー", "カフェ", "書店", "ストア", "マート", "食堂", "電機"]
+
+# 取引先マスターデータに登録されている取引先の割合（残りはどのルールにも一致しない）
+MATCHED_RATIO = 0.7
+
+
+def merchant_names(count, rng):
+    """
+    重複しない取引先名を count 件生成します。英字名と日本語名が半々になります。
+    """
+    names = []
+    for i in range(count):
+        if i % 2:
+            words = rng.choice(LATIN_WORDS, size=2)
+            names.append(f"{words[0]} {words[1]} {i:06d}")
+        else:
+            words = rng.choice(JAPANESE_WORDS, size=2)
+            names.append(f"{words[0]}{words[1]}{i:06d}")
+    return names
+
+
+def generate_merchants(path, merchant_count, seed=0):
+    """
+    取引先マスターデータを生成し、取引内容の語彙を返します。
+
+    Args:
+        path (str): 取引先マスターデータの出力先
+        merchant_count (int): 取引内容の種類数
+        seed (int): 乱数のシード
+
+    Returns:
+        list: 明細に使う取引内容
+    """
+    rng = np.random.default_rng(seed)
+    names = merchant_names(merchant_count, rng)
+    registered = names[: max(1, int(merchant_count * MATCHED_RATIO))]
+    pd.DataFrame(
+        {
+            "merchant_name": registered,
+            "is_corporate": rng.integers(0, 4, size=len(registered)),
+            "category": rng.choice(CATEGORIES, size=len(registered)),
+        },
+        columns=MERCHANT_HEADER,
+    ).to_csv(path, index=False, encoding="cp932")
+
+    # 実際の明細と同じく、取引内容には店舗名などが付き、末尾に空白が残る場合がある
+    suffixes = rng.choice(SUFFIXES, size=len(names))
+    padding = np.where(rng.random(len(names)) < 0.3, " ", "")
+    return [f"{name}{suffix}{pad}" for name, suffix, pad in zip(names, suffixes, padding)]
+
+
+def generate_statements(data_dir, rows, files, vocabulary, foreign_ratio=0.05, years=(2024,), seed=0):
+    """
+    明細CSVを生成します。
+
+    Args:
+        data_dir (str): 明細CSVの出力先ディレクトリ
+        rows (int): 全ファイルの合計行数
+        files (int): ファイル数
+        vocabulary (list): 取引内容の語彙
+        foreign_ratio (float): 海外取引の割合
+        years (Iterable[int]): 取引の年
+        seed (int): 乱数のシード
+
+    Returns:
+        list: 生成したファイルのパス
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(seed + 1)
+    years = sorted(years)
+    first_day = np.datetime64(date(years[0], 1, 1))
+    days = (np.datetime64(date(years[-1] + 1, 1, 1)) - first_day).astype(int)
+
+    # 期間をファイル数で分割し、各ファイルにはその期間の取引をご利用日順に書き出す
+    day_bounds = np.linspace(0, days, files + 1).astype(int)
+    # 日付の文字列は日ごとに一度だけ作る
+    day_labels = pd.date_range(pd.Timestamp(first_day), periods=days).strftime("%Y/%m/%d").to_numpy()
+    row_bounds = np.linspace(0, rows, files + 1).astype(int)
+    vocabulary = np.asarray(vocabulary, dtype=object)
+    paths = []
+    for i in range(files):
+        count = row_bounds[i + 1] - row_bounds[i]
+        high = max(day_bounds[i + 1], day_bounds[i] + 1)
+        offsets = np.sort(rng.integers(day_bounds[i], high, size=count))
+        # 少数の取引先に取引が集中するよう、ジップ分布で取引内容を選ぶ
+        descriptions = vocabulary[(rng.zipf(1.1, size=count) - 1) % len(vocabulary)]
+        amounts = rng.lognormal(mean=8, sigma=1.2, size=count).astype(np.int64) + 1
+        foreign = np.full(count, None, dtype=object)
+        is_foreign = rng.random(count) < foreign_ratio
+        foreign_amounts = rng.lognormal(mean=3, sigma=1.2, size=is_foreign.sum())
+        foreign_currencies = rng.choice(CURRENCIES, size=is_foreign.sum())
+        foreign[is_foreign] = [
+            f"{amount:,.2f} {currency}" for amount, currency in zip(foreign_amounts, foreign_currencies)
+        ]
+
+        path = os.path.join(data_dir, f"statement_{i + 1:04d}.csv")
+        pd.DataFrame(
+            {
+                "ご利用日": day_labels[offsets],
+                "ご利用内容": descriptions,
+                "金額": [f"{amount:,}" for amount in amounts],
+                "海外通貨利用金額": foreign,
+            },
+            columns=HEADER,
+        ).to_csv(path, index=False, encoding="cp932")
+        paths.append(path)
+    return paths
+
+
+def generate_dataset(output_dir, rows, files=12, merchants=5000, foreign_ratio=0.05, years=(2024,), seed=0):
+    """
+    出力先に明細CSV（data/）と取引先マスターデータ（merchants.csv）を生成します。
+
+    Returns:
+        tuple: (明細CSVのディレクトリ, 取引先マスターデータのパス)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    data_dir = os.path.join(output_dir, "data")
+    merchant_config = os.path.join(output_dir, "merchants.csv")
+    vocabulary = generate_merchants(merchant_config, merchants, seed)
+    generate_statements(data_dir, rows, files, vocabulary, foreign_ratio, years, seed)
+    return data_dir, merchant_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用の明細CSVと取引先マスターデータを生成します。")
+    parser.add_argument("output_dir", help="出力先ディレクトリ")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="明細の合計行数")
+    parser.add_argument("--files", type=int, default=12, help="明細CSVのファイル数")
+    parser.add_argument("--merchants", type=int, default=5000, help="取引内容の種類数")
+    parser.add_argument("--foreign-ratio", type=float, default=0.05, help="海外取引の割合")
+    parser.add_argument("--years", type=int, nargs="+", default=[2024], help="取引の年")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    args = parser.parse_args()
+
+    data_dir, merchant_config = generate_dataset(
+        args.output_dir, args.rows, args.files, args.merchants, args.foreign_ratio, args.years, args.seed
+    )
+    print(f"明細CSV: {data_dir} ({args.rows:,}行 / {args.files}ファイル)")
+    print(f"取引先マスターデータ: {merchant_config}")
+
+
+if __name__ == "__main__":
+    main()
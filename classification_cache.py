@@ -0,0 +1,328 @@
+"""
+法人取引判定結果の永続キャッシュ
+
+ご利用内容ごとの判定結果（is_corporate, merchant_category）を、判定に使ったルールと一緒に
+JSON ファイルへ保存します。マスターデータが変更された場合は、追加・削除・並べ替えされた
+ルールの影響を受けるエントリだけを無効化します。取引先名の正規化の設定が変わった場合はすべて破棄します。
+"""
+
+import bisect
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from merchant_matcher import NO_MATCH, MerchantMatcher, build_matcher, match_types
+
+# キャッシュファイルの形式が変わったら上げる
+CACHE_VERSION = 2
+
+
+def rule_key(merchant_name, is_corporate, category, match_type="contains"):
+    """
+    マスターデータの1ルールを識別するキーを返します。
+
+    Args:
+        merchant_name (str): 取引先名
+        is_corporate (int): 法人取引フラグ
+        category (str): カテゴリ
+        match_type (str): 照合方法（"exact" または "contains"）
+
+    Returns:
+        str: ルールの内容から計算したハッシュ値
+    """
+    payload = json.dumps(
+        [
+            _to_json_value(merchant_name),
+            _to_json_value(is_corporate),
+            _to_json_value(category),
+            match_type,
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def master_rule_keys(merchants_df):
+    """
+    マスターデータの各行のルールキーをファイル順に返します。
+    """
+    return [
+        rule_key(name, flag, category, match_type)
+        for name, flag, category, match_type in zip(
+            merchants_df["merchant_name"],
+            merchants_df["is_corporate"],
+            merchants_df["category"],
+            match_types(merchants_df),
+        )
+    ]
+
+
+def master_hash(rule_keys):
+    """
+    ルールキーの並びからマスターデータ全体のハッシュ値を計算します。
+    """
+    return hashlib.sha256("\n".join(rule_keys).encode("utf-8")).hexdigest()
+
+
+class ClassificationCache:
+    """
+    ご利用内容から判定結果へのキャッシュ
+
+    エントリは最近使われた順に保持し、max_entries を超えた場合は最も古いものから削除します。
+    """
+
+    def __init__(self, path=None, max_entries=100000, normalizer=None):
+        """
+        Args:
+            path (str): キャッシュファイルのパス。None の場合は保存しません
+            max_entries (int): 保持するエントリ数の上限
+            normalizer (MerchantNormalizer): 判定に使う取引先名の正規化（None の場合は正規化しない）
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.normalizer = normalizer
+        # description -> (is_corporate, category, rule_key)。一致なしの場合 rule_key は None
+        self._entries = OrderedDict()
+        self._rule_keys = []
+        self._master_hash = None
+        self._key_index = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @classmethod
+    def load(cls, path, max_entries=100000, normalizer=None):
+        """
+        キャッシュファイルを読み込みます。ファイルがない場合や壊れている場合は空のキャッシュを返します。
+        """
+        cache = cls(path, max_entries, normalizer)
+        if not path or not os.path.exists(path):
+            return cache
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CACHE_VERSION:
+                print(f"警告: 分類キャッシュ {path} の形式が古いため破棄します。")
+                return cache
+            if data.get("normalization") != cache._normalization():
+                print(f"分類キャッシュ {path} を破棄します: 取引先名の正規化の設定が変更されました")
+                return cache
+            cache._rule_keys = data["rules"]
+            cache._master_hash = data["master_hash"]
+            for description, flag, category, key in data["entries"]:
+                cache._entries[description] = (flag, category, key)
+        except Exception as e:
+            print(f"警告: 分類キャッシュの読み込み中にエラーが発生しました: {e}")
+            return cls(path, max_entries, normalizer)
+
+        cache._evict()
+        return cache
+
+    def _normalization(self):
+        return None if self.normalizer is None else self.normalizer.signature
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sync_master(self, merchants_df):
+        """
+        キャッシュを現在のマスターデータに合わせます。
+
+        マスターデータの内容が前回と同じ場合は何もしません。変更されている場合は、
+        追加されたルールと並び順が変わったルールのうち、判定結果を変えうるものに
+        一致するエントリと、判定に使われたルールが削除・移動されたエントリを無効化します。
+
+        Args:
+            merchants_df (pd.DataFrame): 法人取引マスターデータ
+        """
+        new_keys = master_rule_keys(merchants_df)
+        new_hash = master_hash(new_keys)
+        new_index = _first_positions(new_keys)
+        if new_hash == self._master_hash:
+            self._key_index = new_index
+            return
+
+        old_index = _first_positions(self._rule_keys)
+        # 新旧両方に存在し、相対的な並び順が保たれているルール
+        common = sorted((key for key in new_index if key in old_index), key=new_index.get)
+        stable = set(_longest_increasing_subsequence(common, old_index))
+        # 追加されたか、並び順が変わったルール（新しいマスターでの順）
+        suspects = sorted((key for key in new_index if key not in stable), key=new_index.get)
+        new_types = match_types(merchants_df)
+        suspect_matcher = MerchantMatcher(
+            [merchants_df["merchant_name"].iloc[new_index[key]] for key in suspects],
+            [new_types[new_index[key]] for key in suspects],
+            self.normalizer,
+        )
+
+        invalid = []
+        for description, (_, _, key) in self._entries.items():
+            if key is None:
+                limit = None
+            elif key in stable:
+                limit = new_index[key]
+            else:
+                # 判定に使われたルールが削除または移動された
+                invalid.append(description)
+                continue
+            suspect = suspect_matcher.find_first(description)
+            if suspect != NO_MATCH and (limit is None or new_index[suspects[suspect]] < limit):
+                invalid.append(description)
+
+        for description in invalid:
+            del self._entries[description]
+        self.invalidated += len(invalid)
+        self._rule_keys = new_keys
+        self._master_hash = new_hash
+        self._key_index = new_index
+
+    def get(self, description):
+        """
+        キャッシュされた判定結果を返します。
+
+        Returns:
+            tuple: (is_corporate, merchant_category)。キャッシュにない場合は None
+        """
+        entry = self._entries.get(description)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(description)
+        flag, category, _ = entry
+        return flag, _from_json_category(category)
+
+    def match_all(self, descriptions, merchants_df):
+        """
+        取引内容ごとに一致するルールの行番号を返します。キャッシュにない取引内容だけを判定します。
+
+        Args:
+            descriptions (Iterable[str]): 重複を除いた取引内容
+            merchants_df (pd.DataFrame): 法人取引マスターデータ
+
+        Returns:
+            np.ndarray: 取引内容ごとのルールの行番号（一致なしは NO_MATCH）
+        """
+        self.sync_master(merchants_df)
+
+        rule_indices = np.full(len(descriptions), NO_MATCH, dtype=np.int64)
+        missing = []
+        for position, description in enumerate(descriptions):
+            if not isinstance(description, str):
+                continue
+            if self.get(description) is None:
+                missing.append(position)
+                continue
+            key = self._entries[description][2]
+            if key is not None:
+                rule_indices[position] = self._key_index[key]
+
+        if missing:
+            matcher = build_matcher(merchants_df, self.normalizer)
+            for position in missing:
+                description = descriptions[position]
+                index = matcher.find_first(description)
+                rule_indices[position] = index
+                self._put(description, merchants_df, index)
+            self._evict()
+
+        return rule_indices
+
+    def _put(self, description, merchants_df, index):
+        if index == NO_MATCH:
+            self._entries[description] = (0, "", None)
+        else:
+            self._entries[description] = (
+                int(merchants_df["is_corporate"].iloc[index]),
+                _to_json_value(merchants_df["category"].iloc[index]),
+                self._rule_keys[index],
+            )
+        self._entries.move_to_end(description)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """
+        キャッシュをファイルに保存します。書き込み途中のファイルが残らないよう一時ファイル経由で置き換えます。
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        data = {
+            "version": CACHE_VERSION,
+            "normalization": self._normalization(),
+            "master_hash": self._master_hash,
+            "rules": self._rule_keys,
+            "entries": [
+                [description, flag, category, key]
+                for description, (flag, category, key) in self._entries.items()
+            ],
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def report(self):
+        """
+        ヒット数とミス数を表示します（重複を除いた取引内容単位）。
+        """
+        print(
+            f"分類キャッシュ: ヒット {self.hits}件 / ミス {self.misses}件 / "
+            f"無効化 {self.invalidated}件 / 保持 {len(self._entries)}件"
+        )
+
+
+def _to_json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value
+
+
+def _from_json_category(category):
+    return np.nan if category is None else category
+
+
+def _first_positions(keys):
+    positions = {}
+    for index, key in enumerate(keys):
+        positions.setdefault(key, index)
+    return positions
+
+
+def _longest_increasing_subsequence(keys, old_index):
+    """
+    新しい並び順の keys のうち、旧マスターでの位置が単調増加する最長の部分列を返します。
+    """
+    tails = []
+    tail_positions = []
+    previous = [None] * len(keys)
+    for i, key in enumerate(keys):
+        position = old_index[key]
+        slot = bisect.bisect_left(tails, position)
+        if slot == len(tails):
+            tails.append(position)
+            tail_positions.append(i)
+        else:
+            tails[slot] = position
+            tail_positions[slot] = i
+        previous[i] = tail_positions[slot - 1] if slot else None
+
+    result = []
+    i = tail_positions[-1] if tail_positions else None
+    while i is not None:
+        result.append(keys[i])
+        i = previous[i]
+    return result[::-1]
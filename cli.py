@@ -0,0 +1,166 @@
+"""
+amex csv analyzer のコマンドライン
+
+    python cli.py --data-dir data --merchants merchants/merchants.csv --year 2024
+
+省略したオプションには config.py の設定値を使用します。pandas などの重い依存関係は分析を実行するときに
+初めて読み込むため、--help や入力ファイルの確認だけを行う --check はすぐに終了します。
+"""
+
+import argparse
+import sys
+
+import config
+from environment import check_production_environment, print_mode
+
+
+def build_parser():
+    """
+    コマンドライン引数のパーサーを作成します。
+    """
+    parser = argparse.ArgumentParser(
+        description="AMEXの明細CSVを結合し、法人取引を判定・集計します。",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--test",
+        dest="mode_test",
+        action="store_true",
+        default=None,
+        help="サンプルデータを使用するテストモードで実行する",
+    )
+    mode.add_argument(
+        "--production",
+        dest="mode_test",
+        action="store_false",
+        help="実データモードで実行する",
+    )
+    parser.add_argument("--data-dir", help="明細CSVが格納されているディレクトリ")
+    parser.add_argument("--merchants", dest="merchant_config", help="取引先マスターデータのパス")
+    parser.add_argument("--result-dir", help=f"結果を出力するディレクトリ（既定: {config.RESULT_DIR}）")
+    parser.add_argument(
+        "--year",
+        dest="target_year",
+        help=f"分析対象年（既定: {config.TARGET_YEAR!r}、空文字列を指定するとすべての年）",
+    )
+    parser.add_argument(
+        "--years",
+        dest="partitions",
+        nargs="+",
+        metavar="YEAR",
+        help="複数の年をまとめて分析し、年ごとの結果を結果ディレクトリのサブディレクトリに書き出す",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="データディレクトリと取引先マスターデータを監視し、変更があるたびに結果を更新する（Ctrl+C で終了）",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="明細を読み込んだまま、期間や条件を指定した集計に HTTP（JSON）で答える（Ctrl+C で終了）",
+    )
+    parser.add_argument("--port", type=int, help=f"--serve で待ち受けるポート（既定: {config.QUERY_PORT}）")
+    parser.add_argument(
+        "--profile",
+        dest="profile_stage",
+        metavar="STAGE",
+        help="cProfile / tracemalloc で詳しく調べる段階（run_report.json の name。例: preprocess）",
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=["cprofile", "tracemalloc"],
+        help=f"--profile で調べる方法（既定: {config.PROFILE_MODE}）",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="分析を行わずに入力ファイルの有無だけを確認する",
+    )
+    return parser
+
+
+def resolve_paths(args):
+    """
+    オプションから (テストモードかどうか, データディレクトリ, 取引先マスターデータ) を求めます。
+    """
+    mode_test = config.MODE_TEST if args.mode_test is None else args.mode_test
+    data_dir, merchant_config = config.default_paths(mode_test)
+    return mode_test, args.data_dir or data_dir, args.merchant_config or merchant_config
+
+
+def valid_year(year):
+    """
+    分析対象年が4桁以内の数字かどうかを返します（5桁以上の年は日付として扱えない）。
+    """
+    return year.isdigit() and 1 <= len(year) <= 4
+
+
+def run(argv=None):
+    """
+    コマンドライン引数を解釈して分析を実行します。
+
+    Args:
+        argv (list): コマンドライン引数（None の場合は sys.argv）
+
+    Returns:
+        int: 終了コード
+    """
+    args = build_parser().parse_args(argv)
+    if args.target_year and not valid_year(args.target_year):
+        print(f"エラー: 分析対象年は数字で指定してください: {args.target_year}")
+        return 2
+    invalid_years = [year for year in args.partitions or [] if not valid_year(year)]
+    if invalid_years:
+        print(f"エラー: 分析対象年は数字で指定してください: {', '.join(invalid_years)}")
+        return 2
+
+    if args.check:
+        mode_test, data_dir, merchant_config = resolve_paths(args)
+        print_mode(mode_test)
+        if not check_production_environment(data_dir, merchant_config):
+            return 1
+        print("入力ファイルを確認しました。")
+        return 0
+
+    if (args.watch or args.serve) and args.partitions:
+        print("エラー: --watch / --serve と --years は同時に指定できません")
+        return 2
+    if args.serve:
+        import query_service
+
+        return query_service.serve(
+            data_dir=args.data_dir,
+            merchant_config=args.merchant_config,
+            target_year=args.target_year,
+            mode_test=args.mode_test,
+            port=args.port,
+        )
+    if args.watch:
+        import watcher
+
+        return watcher.watch(
+            data_dir=args.data_dir,
+            merchant_config=args.merchant_config,
+            result_dir=args.result_dir,
+            target_year=args.target_year,
+            mode_test=args.mode_test,
+        )
+
+    # 分析を実行する場合だけ pandas などを読み込む
+    import main
+
+    return main.main(
+        data_dir=args.data_dir,
+        merchant_config=args.merchant_config,
+        result_dir=args.result_dir,
+        target_year=args.target_year,
+        mode_test=args.mode_test,
+        profile_stage=args.profile_stage,
+        profile_mode=args.profile_mode,
+        partitions=args.partitions,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(run())
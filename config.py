@@ -10,10 +10,157 @@ MODE_TEST = True
 # その他の設定
 TARGET_YEAR = "2024"  # 分析対象年
 
+# 分析対象期間（"YYYY/MM/DD" 形式、両端を含む）
+# どちらかを指定すると TARGET_YEAR の代わりにこの期間で絞り込みます
+DATE_FROM = None
+DATE_TO = None
+
+# 複数期間の一括分析
+# 明細の読み込みと法人取引判定を1回だけ行い、期間ごとの結果を結果ディレクトリのサブディレクトリ（results/2023/ など）に
+# 書き出します。年のリスト（["2023", "2024"]）、または {"名前": ("開始日", "終了日")} の辞書で指定します
+# （None の場合は TARGET_YEAR / DATE_FROM / DATE_TO の期間の結果を結果ディレクトリに書き出す）
+PARTITIONS = None
+PARTITION_WORKERS = 1  # 2以上にすると、期間ごとの集計・書き出しを並列に実行します
+PARTITION_EXECUTOR = "process"  # "process": プロセスプール / "thread": スレッドプール
+
+# 明細がご利用日順に並んでいる前提で、先頭行と末尾行の日付が対象期間外のファイルを読み込まずにスキップします
+# （取込キャッシュを使う場合は、キャッシュに記録された日付の範囲で常にスキップします）
+SKIP_FILES_OUTSIDE_PERIOD = False
+
+# 明細をまたいだ重複取引の除外
+# 期間が重なる明細（月次の明細と年初からの明細など）に含まれる同じ取引（ご利用日・ご利用内容・金額・海外通貨の金額が同じ）を、
+# ファイル名順で先に読み込んだ明細の分だけ残します。同じ明細の中で同じ内容の利用が繰り返された場合は、すべて残します。
+# 有効にすると、期間が重なる明細を置いている場合は集計結果（grouped.csv・corporate_summary.csv など）が変わります
+DEDUPLICATE_TRANSACTIONS = False
+
+# 為替レート表
+# 通貨・日付ごとの参照レート（1通貨単位あたりの円）の表を指定すると、foreign.csv の各行にご利用日以前で最も新しい
+# 参照レートと換算レート・乖離率を加え、通貨ごとの集計を foreign_summary.csv に書き出します（None にすると無効）。
+# CSV（CP932。date, currency, rate の列）、または Parquet / Feather（pyarrow が必要）で指定します
+FX_RATES_PATH = None
+FX_RATE_MAX_AGE_DAYS = 7  # ご利用日よりこの日数を超えて古いレートは使わない（None の場合は制限しない）
+FX_RATES_CACHE_DIR = "cache/fx_rates"  # 解析したレート表の保存先（None にすると毎回解析する）
+
+# 法人取引判定キャッシュ
+# 保存先を指定すると、ご利用内容ごとの判定結果を保存し、次回以降の実行で再利用します（例: "cache/classification_cache.json"。
+# None の場合は保存しない）
+CLASSIFICATION_CACHE_PATH = None
+CLASSIFICATION_CACHE_MAX_ENTRIES = 100000  # 保持する取引内容の上限（古いものから削除）
+
+# 取引先名の正規化
+# True にすると、ご利用内容とマスターデータの merchant_name の両方に NFKC 正規化（全角・半角の統一）と
+# 大文字・小文字の統一を行ってから照合します。大文字・小文字だけが異なるルールが同じルールとして扱われるなど、
+# 一致するルールが変わる場合があるため、有効にする場合は結果を確認してください
+MERCHANT_NORMALIZATION = False
+# 正規化の後に取り除く正規表現のリスト（例: 末尾の店舗番号 r"\s*#?\d+$"）
+MERCHANT_STRIP_PATTERNS = []
+
+# CSV の読み込み方法
+# "pandas": pandas の C パーサー / "pyarrow": pyarrow の CSV リーダー（複数のスレッドで解析するため大きな明細で速い。
+# pyarrow がない場合は pandas で読み込む）
+CSV_READER = "pandas"
+
+# 明細CSVの並列読み込み
+# 2以上にすると、ファイルごとの読み込みと前処理を並列に実行します
+LOAD_WORKERS = 1
+LOAD_EXECUTOR = "process"  # "process": プロセスプール / "thread": スレッドプール
+
+# 明細CSVの取込キャッシュ
+# 保存先を指定すると、前処理済みのデータをファイルごとに保存し、変更のないファイルは次回から解析せずに読み込みます
+# （例: "cache/ingest"。None の場合は保存しない）
+INGEST_CACHE_DIR = None
+INGEST_CACHE_REBUILD = False  # True にするとキャッシュを破棄してすべてのファイルを解析し直す
+
+# 取引データストア
+# 明細を SQLite のデータベースに一度だけ取り込み、分析はデータベースへの問い合わせで行います（None にすると無効）。
+# 取り込み済みのファイルは次回から解析せず、データディレクトリから削除したファイルの取引もデータベースに残ります
+TRANSACTION_STORE_PATH = None
+
+# 集計状態の保存（増分集計）
+# 明細CSVごとの集計結果と合計を保存し、次回からは追加されたファイルの集計を加え、削除・変更されたファイルの集計を
+# 差し引いて grouped / corporate_summary / 期間ごとの集計を作ります（None にすると無効）。
+# OUTPUTS で concatenated と foreign を書き出さない場合は、全期間の明細を読み込みません
+AGGREGATE_STATE_PATH = None
+AGGREGATE_STATE_VERIFY = False  # True にすると全体を集計し直した結果と照合し、異なる場合は集計し直した結果で置き換える
+
+# ストリーミングモード
+# True にすると明細をチャンク単位で処理し、全データをメモリに保持せずに結果を書き出します
+STREAMING = False
+STREAMING_CHUNK_SIZE = 100000  # 1回に読み込む行数
+
+# ウォッチモード（python cli.py --watch）
+# データディレクトリと取引先マスターデータを監視し、追加・変更されたファイルだけを読み込んで結果ファイルを更新します
+WATCH_INTERVAL = 5  # 変更を確認する間隔（秒）
+
+# 問い合わせサービス（python cli.py --serve）
+# 明細を一度だけ読み込み・判定して索引を作り、期間や取引先・カテゴリ・通貨を指定した集計に HTTP（JSON）で答えます。
+# データの変更はウォッチモードと同じく WATCH_INTERVAL 秒ごとに確認します
+QUERY_HOST = "127.0.0.1"  # 待ち受けるアドレス（既定ではこのコンピューターからの接続だけを受け付ける）
+QUERY_PORT = 8765
+QUERY_CACHE_SIZE = 256  # 保持する問い合わせ結果の件数（データが変わると破棄）
+
+# メモリ使用量の少ない型
+# True にすると、前処理後の取引内容・通貨・カテゴリをカテゴリ型、法人取引フラグを int8、
+# 金額を値の範囲に収まる最小の整数型で保持します（出力される内容は変わりません）
+COMPACT_DTYPES = True
+
+# 期間ごとの集計
+# 指定した単位（"month": 月, "week": 週）ごとに、取引内容・カテゴリ・法人取引フラグ別の回数と合計金額を
+# rollup_month.csv / rollup_week.csv に書き出します（空のリストの場合は書き出さない）
+ROLLUP_PERIODS = []
+
+# grouped.csv に書き出す取引先を、利用回数の多い順にこの件数に限る（None の場合はすべて書き出す）。
+# 同じ回数の取引先は取引内容の順に並び、すべて書き出した場合の先頭と同じ結果になります
+TOP_MERCHANTS = None
+
+# 近似集計（大量の明細の探索用）
+# True にすると、取引先の種類数によらない少ないメモリで作れる近似的な集計を書き出します
+# （ストリーミングモードではチャンクごとに更新します）。
+# top_merchants.csv: 利用回数・合計金額の多い取引先。真の値は「推定値」以上「上限」以下で、その差は
+#   合計 / (SKETCH_CAPACITY + 1) 以下（合計金額には返金を含めない）
+# distinct_merchants.csv: カテゴリ × 月ごとの取引先の種類数（HyperLogLog。相対標準誤差は約 1.04 / sqrt(2^HLL_PRECISION)）
+APPROXIMATE_SUMMARIES = False
+SKETCH_CAPACITY = 1000  # 上位の取引先の要約で保持する取引先の数
+SKETCH_TOP_K = 50  # top_merchants.csv に書き出す件数
+HLL_PRECISION = 12  # 種類数の推定に使うレジスタ数の指数（12 で相対標準誤差は約 1.6%、4KB / カテゴリ × 月）
+
+# 出力形式
+# "csv" に加えて "parquet" / "feather" を指定すると、型情報を保持した列指向形式でも書き出します
+# （pyarrow が必要です）。取引明細は年・月ごとのディレクトリに分割されます
+OUTPUT_FORMATS = ["csv"]
+
+# 結果ファイルの書き出し
+# 書き出す結果のリスト（"concatenated", "grouped", "corporate_summary", "foreign", "foreign_summary", "rollup_month",
+# "rollup_week", "top_merchants", "distinct_merchants"）。None の場合はすべて書き出します。書き出さない結果は集計も行いません
+OUTPUTS = None
+# CSV の圧縮方法（None: 圧縮しない / "gzip": .csv.gz / "zstd": .csv.zst。zstd は zstandard が必要で、ない場合は gzip）
+OUTPUT_COMPRESSION = None
+OUTPUT_WORKERS = 1  # 2以上にすると、結果ファイルをスレッドで並列に書き出します
+
+# 実行レポート
+# True にすると、処理の段階ごとの実行時間・CPU時間・行数・メモリ使用量を結果ディレクトリの run_report.json に書き出します
+# （PROFILE_STAGE を指定した場合は常に書き出す）
+RUN_REPORT = False
+# 指定した段階（"preprocess" など、run_report.json の name）を詳しく調べます（None の場合は調べない）
+PROFILE_STAGE = None
+PROFILE_MODE = "cprofile"  # "cprofile": 関数ごとの実行時間 / "tracemalloc": メモリ確保の多い箇所
+
 # 以下は編集の必要はありません
-# ディレクトリ設定
-DATA_DIR = "samples/data" if MODE_TEST else "data"
+# ディレクトリ設定（テストモード・実データモードそれぞれの既定値）
+SAMPLE_DATA_DIR = "samples/data"
+SAMPLE_MERCHANT_CONFIG = "samples/merchants/merchants_sample.csv"
+PRODUCTION_DATA_DIR = "data"
+PRODUCTION_MERCHANT_CONFIG = "merchants/merchants.csv"
 RESULT_DIR = "results"
-MERCHANT_CONFIG = (
-    "samples/merchants/merchants_sample.csv" if MODE_TEST else "merchants/merchants.csv"
-)
+
+
+def default_paths(mode_test):
+    """
+    実行モードに応じた (データディレクトリ, 取引先マスターデータ) の既定値を返します。
+    """
+    if mode_test:
+        return SAMPLE_DATA_DIR, SAMPLE_MERCHANT_CONFIG
+    return PRODUCTION_DATA_DIR, PRODUCTION_MERCHANT_CONFIG
+
+
+DATA_DIR, MERCHANT_CONFIG = default_paths(MODE_TEST)
@@ -0,0 +1,122 @@
+"""
+CSV の読み込み
+
+明細CSVと取引先マスターデータを、指定したバックエンドで読み込みます。
+
+- "pandas": pandas の C パーサー（既定）
+- "pyarrow": pyarrow の CSV リーダー。CP932 の変換と解析を複数のスレッドで行うため、大きな明細で速くなります
+
+pyarrow がインストールされていない場合は、警告を表示して pandas で読み込みます。
+"""
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+READER_BACKENDS = ("pandas", "pyarrow")
+
+# pyarrow で読み込む場合の1回の読み込み単位（バイト）。スレッドごとにこの単位で解析する
+PYARROW_BLOCK_SIZE = 1 << 22
+
+# pyarrow が使えない旨の警告は1回だけ表示する
+_fallback_warned = False
+
+
+def resolve_backend(backend):
+    """
+    使用できるバックエンドの名前を返します。pyarrow が使えない場合は pandas を返します。
+
+    Args:
+        backend (str): "pandas" または "pyarrow"
+
+    Returns:
+        str: 使用するバックエンドの名前
+    """
+    if backend not in READER_BACKENDS:
+        raise ValueError(f"未対応の CSV 読み込み方法です: {backend}")
+    global _fallback_warned
+    if backend == "pyarrow" and not PYARROW_AVAILABLE:
+        if not _fallback_warned:
+            _fallback_warned = True
+            print("警告: pyarrow がインストールされていないため、pandas で CSV を読み込みます。")
+        return "pandas"
+    return backend
+
+
+def read_csv(path, backend="pandas", columns=None, dtype=None, encoding="cp932", thousands=None, **kwargs):
+    """
+    CSV ファイルを読み込みます。
+
+    Args:
+        path (str): CSVファイルのパス
+        backend (str): "pandas" または "pyarrow"。chunksize を指定した場合は常に pandas で読み込む
+        columns (list or callable): 読み込む列（列名のリスト、または列名を受け取って真偽値を返す関数）。
+            None の場合はすべての列を読み込む
+        dtype (dict): 列名から型への対応（str を指定した列は文字列のまま読み込む）
+        encoding (str): 文字コード
+        thousands (str): 数値の桁区切り文字。型を指定していない列は、桁区切りを除いて整数に変換できれば変換する
+        **kwargs: pd.read_csv に渡す追加の引数（chunksize など）
+
+    Returns:
+        pd.DataFrame: 読み込んだデータ（chunksize を指定した場合は pandas のリーダー）
+    """
+    backend = resolve_backend(backend)
+    if backend == "pyarrow" and not kwargs:
+        return _read_csv_pyarrow(path, columns, dtype or {}, encoding, thousands)
+    return pd.read_csv(
+        path, encoding=encoding, usecols=columns, dtype=dtype, thousands=thousands, **kwargs
+    )
+
+
+def _read_csv_pyarrow(path, columns, dtype, encoding, thousands):
+    if columns is not None:
+        # pandas と同じくファイル上の順に列を並べるため、ヘッダー行だけを先に読む
+        header = pd.read_csv(path, encoding=encoding, nrows=0).columns
+        if callable(columns):
+            columns = [column for column in header if columns(column)]
+        else:
+            missing = [column for column in columns if column not in header]
+            if missing:
+                raise ValueError(f"必要な列がありません: {missing}")
+            columns = [column for column in header if column in columns]
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(
+            encoding=encoding, use_threads=True, block_size=PYARROW_BLOCK_SIZE
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.string() for column, kind in dtype.items() if kind is str},
+            # pandas と同じく、空欄の文字列は欠損値として扱う
+            strings_can_be_null=True,
+        ),
+    )
+    if thousands:
+        table = _parse_thousands(table, dtype, thousands)
+    df = table.to_pandas()
+    # 文字列の列の欠損値は pandas で読み込んだ場合と同じ NaN にする
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), float("nan"))
+    return df
+
+
+def _parse_thousands(table, dtype, thousands):
+    """
+    型を指定していない文字列の列のうち、桁区切りを除いて整数に変換できる列を変換します。
+    """
+    for index, field in enumerate(table.schema):
+        if field.name in dtype or not pa.types.is_string(field.type):
+            continue
+        try:
+            values = pc.cast(pc.replace_substring(table.column(index), thousands, ""), pa.int64())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            continue
+        table = table.set_column(index, field.name, values)
+    return table
@@ -0,0 +1,321 @@
+"""
+明細をまたいだ重複取引の除外
+
+月次の明細と年初からの明細のように期間が重なる明細を一緒に読み込むと、同じ取引が2回集計されます。
+取引ごとに「ご利用日・ご利用内容・金額・海外通貨の金額」と、同じ明細の中で同じ内容の取引が何件目かを表す番号から
+フィンガープリント（64ビットのハッシュ値）を作り、先に読み込んだ明細にあるフィンガープリントの取引を除きます。
+同じ明細の中で同じ日に同じ金額の利用が繰り返された場合は番号が異なるため、どちらも残ります。
+
+明細はファイル単位（ストリーミングモードではチャンク単位）で処理するため、全データを結合した後で
+重複を探す必要はありません。
+
+判定結果（明細ごとに残した取引のフィンガープリントと除いた行の位置）はファイルに保存でき、次回は前回と同じ順に処理する
+内容の変わっていない明細のフィンガープリントを計算し直さずに、保存した結果で重複を除きます。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# フィンガープリントに使う列（前処理後）。前処理前のデータでは海外通貨の金額に 海外通貨利用金額 を使う
+FINGERPRINT_COLUMNS = ["ご利用日", "ご利用内容", "金額", "現地通貨建て金額", "通貨"]
+
+# 保存する判定結果の形式、またはフィンガープリントの計算方法を変更したら上げる（保存した結果は使わない）
+STATE_VERSION = 1
+
+
+def row_hashes(df):
+    """
+    取引ごとの内容のハッシュ値（同じ内容の取引は同じ値）を返します。
+
+    Args:
+        df (pd.DataFrame): 取引データ（前処理の前後どちらでもよい。同じ実行の中では同じ形式であること）
+
+    Returns:
+        np.ndarray: uint64 のハッシュ値
+    """
+    if "海外通貨利用金額" in df.columns:
+        columns = {
+            "ご利用日": df["ご利用日"],
+            "ご利用内容": df["ご利用内容"].str.strip(),
+            "金額": df["金額"],
+            "海外通貨利用金額": df["海外通貨利用金額"].str.strip(),
+        }
+    else:
+        columns = {column: df[column] for column in FINGERPRINT_COLUMNS}
+    # ハッシュ値が型（カテゴリ型かどうか、整数のビット数など）で変わらないよう、値の型をそろえてから計算する
+    frame = pd.DataFrame({name: _canonical(column) for name, column in columns.items()})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def _canonical(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype(column.cat.categories.dtype)
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.astype("datetime64[ns]")
+    if pd.api.types.is_integer_dtype(column):
+        return column.astype(np.int64)
+    if pd.api.types.is_float_dtype(column):
+        return column.astype(np.float64)
+    return column.astype(object)
+
+
+def row_fingerprints(df, counts=None):
+    """
+    取引ごとのフィンガープリント（内容のハッシュ値と、同じ明細の中で同じ内容の何件目かの組み合わせ）を返します。
+
+    Args:
+        df (pd.DataFrame): 1つの明細の取引データ（明細の先頭から順に、チャンクに分けて渡してよい）
+        counts (pd.Series): 前のチャンクまでの内容のハッシュ値ごとの件数（明細の最初のチャンクでは None）
+
+    Returns:
+        tuple: (uint64 のフィンガープリントの np.ndarray, このチャンクまでの件数の pd.Series)
+    """
+    hashes = pd.Series(row_hashes(df))
+    ordinals = hashes.groupby(hashes.to_numpy()).cumcount().to_numpy()
+    if counts is not None and len(counts):
+        ordinals += hashes.map(counts).fillna(0).to_numpy(dtype=np.int64)
+        counts = counts.add(hashes.value_counts(), fill_value=0).astype(np.int64)
+    else:
+        counts = hashes.value_counts()
+    fingerprints = pd.util.hash_pandas_object(
+        pd.DataFrame({"hash": hashes.to_numpy(), "ordinal": ordinals}), index=False
+    ).to_numpy()
+    return fingerprints, counts
+
+
+class TransactionDeduplicator:
+    """
+    明細ごとのフィンガープリントを保持し、先に読み込んだ明細と重複する取引を除く
+    """
+
+    def __init__(self, fingerprints=None, duplicates=None):
+        """
+        Args:
+            fingerprints (dict): 明細のファイル名 -> 残した取引のフィンガープリント（保存した状態から再開する場合）
+            duplicates (dict): 明細のファイル名 -> 重複していた取引の読み込み元のファイル名の集合
+        """
+        self.fingerprints = dict(fingerprints or {})
+        self.duplicates = {file: set(owners) for file, owners in (duplicates or {}).items()}
+        # 明細のファイル名 -> 処理したときのサイズと更新日時 / 重複として除いた行の位置（保存した結果の再利用に使う）
+        self.signatures = {}
+        self.duplicate_rows = {}
+        # 明細を処理した順（後の明細の重複は、それより前の明細と照合している）
+        self.order = list(self.fingerprints)
+        self.dropped = 0
+        self.reused = 0
+        self.path = None
+        self.settings = None
+        # 保存した結果から再開した場合に、今回の実行で前回と同じ順に処理した明細の数（再開していない場合は None）
+        self._restored = None
+        self._reusing = False
+        self._index = None
+        self._file = None
+        self._signature = None
+        self._counts = None
+        self._kept = []
+        self._offset = 0
+        self._dropped_rows = []
+
+    @classmethod
+    def load(cls, path, settings, rebuild=False):
+        """
+        save で保存した判定結果から再開します。ファイルがない場合や、壊れている・前提が異なる場合は空の状態から始めます。
+
+        Args:
+            path (str): 判定結果の保存先（None の場合は保存しない）
+            settings (dict): 判定の前提（データディレクトリ・分析対象期間など）。保存時と異なる場合は保存した結果を使わない
+            rebuild (bool): True の場合は保存した結果を使わない（保存はする）
+
+        Returns:
+            TransactionDeduplicator: 判定結果
+        """
+        deduplicator = cls()
+        if path and not rebuild and os.path.exists(path):
+            try:
+                data = pd.read_pickle(path)
+                if data.get("version") == STATE_VERSION and data.get("settings") == settings:
+                    deduplicator = cls(data["fingerprints"], data["duplicates"])
+                    deduplicator.signatures = data["signatures"]
+                    deduplicator.duplicate_rows = data["duplicate_rows"]
+                    deduplicator.order = data["order"]
+                    deduplicator._restored = 0
+            except Exception as e:
+                print(f"警告: 重複取引の判定結果の読み込み中にエラーが発生しました: {e}")
+                deduplicator = cls()
+        deduplicator.path = path
+        deduplicator.settings = settings
+        return deduplicator
+
+    def save(self):
+        """
+        判定結果を load で指定した保存先に保存します（保存先がない場合は何もしない）。
+        今回の実行で処理しなかった明細（削除された明細など）の結果は保存しません。
+        """
+        self.commit()
+        self._stop_restoring()
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        pd.to_pickle(
+            {
+                "version": STATE_VERSION,
+                "settings": self.settings,
+                "order": self.order,
+                "fingerprints": self.fingerprints,
+                "duplicates": self.duplicates,
+                "signatures": self.signatures,
+                "duplicate_rows": self.duplicate_rows,
+            },
+            tmp_path,
+        )
+        os.replace(tmp_path, self.path)
+
+    def begin(self, file, signature=None):
+        """
+        明細の処理を開始します。前の明細の処理が終わっていない場合は、そこまでの結果を確定します。
+
+        保存した結果から再開していて、前回と同じ順に処理している明細のサイズと更新日時が前回と同じ場合は、
+        フィンガープリントを計算せずに前回の結果で重複を除きます。
+
+        Args:
+            file (str): 明細のファイル名
+            signature (tuple): 明細のサイズと更新日時（None の場合は保存した結果を使わない）
+        """
+        self.commit()
+        position = self._restored
+        self._reusing = (
+            position is not None
+            and signature is not None
+            and position < len(self.order)
+            and self.order[position] == file
+            and self.signatures.get(file) == tuple(signature)
+        )
+        if self._reusing:
+            self._restored += 1
+        else:
+            # 前回と異なる明細を処理したため、これより後の明細の前回の結果は使えない
+            self._stop_restoring()
+            self.remove(file)
+        self._file = file
+        self._signature = None if signature is None else tuple(signature)
+        self._counts = None
+        self._kept = []
+        self._offset = 0
+        self._dropped_rows = []
+
+    def filter(self, df):
+        """
+        処理中の明細の取引（明細の先頭から順に、チャンクに分けて渡してよい）から、ほかの明細と重複する取引を除きます。
+
+        Returns:
+            pd.DataFrame: 重複を除いた取引データ
+        """
+        if df.empty:
+            return df
+        start = self._offset
+        self._offset += len(df)
+        if self._reusing:
+            rows = self.duplicate_rows.get(self._file, np.empty(0, np.int64))
+            rows = rows[(rows >= start) & (rows < self._offset)] - start
+            if not len(rows):
+                return df
+            self.dropped += len(rows)
+            keep = np.ones(len(df), dtype=bool)
+            keep[rows] = False
+            return df[keep]
+
+        fingerprints, self._counts = row_fingerprints(df, self._counts)
+        fps, owners = self._lookup()
+        positions = np.searchsorted(fps, fingerprints)
+        duplicated = np.zeros(len(fingerprints), dtype=bool)
+        if len(fps):
+            positions[positions == len(fps)] = 0
+            duplicated = fps[positions] == fingerprints
+        self._kept.append(fingerprints[~duplicated])
+        if not duplicated.any():
+            return df
+        self._dropped_rows.append(np.flatnonzero(duplicated) + start)
+        self.duplicates.setdefault(self._file, set()).update(owners[positions[duplicated]].tolist())
+        self.dropped += int(duplicated.sum())
+        return df[~duplicated]
+
+    def commit(self):
+        """
+        処理中の明細のフィンガープリントを記録し、後から処理する明細の重複の判定に使います。
+        """
+        if self._file is not None and self._reusing:
+            self.reused += 1
+        elif self._file is not None:
+            self.fingerprints[self._file] = np.concatenate(self._kept) if self._kept else np.empty(0, np.uint64)
+            self.duplicate_rows[self._file] = (
+                np.concatenate(self._dropped_rows) if self._dropped_rows else np.empty(0, np.int64)
+            )
+            if self._signature is not None:
+                self.signatures[self._file] = self._signature
+            self.order.append(self._file)
+            self._index = None
+        self._file = None
+
+    def rollback(self):
+        """
+        処理中の明細の結果を破棄します（読み込みに失敗した場合）。
+        """
+        if self._file is not None:
+            file = self._file
+            self._file = None
+            self.remove(file)
+
+    def remove(self, file):
+        """
+        明細のフィンガープリントを破棄します（明細が削除・変更された場合）。
+
+        Returns:
+            set: この明細と重複していたため取引を除いた明細のファイル名（読み込み直す必要がある）
+        """
+        # 保存した結果の明細の順が変わるため、これより後の明細の前回の結果は使えない
+        self._stop_restoring()
+        self.duplicates.pop(file, None)
+        self.signatures.pop(file, None)
+        self.duplicate_rows.pop(file, None)
+        if file in self.order:
+            self.order.remove(file)
+        if self.fingerprints.pop(file, None) is not None:
+            self._index = None
+        return {other for other, owners in self.duplicates.items() if file in owners}
+
+    def report(self):
+        """
+        除外した重複取引の件数を表示します。
+        """
+        if self.dropped:
+            print(f"重複取引: 先に読み込んだ明細と重複する {self.dropped}件を除外しました")
+        if self.reused:
+            print(f"重複取引: {self.reused}件の明細は前回の判定結果を使用しました")
+
+    def _stop_restoring(self):
+        """
+        保存した結果からの再開を終え、今回の実行でまだ処理していない明細の前回の結果を破棄します。
+        """
+        if self._restored is None:
+            return
+        unconfirmed = self.order[self._restored :]
+        self._restored = None
+        for file in unconfirmed:
+            self.remove(file)
+
+    def _lookup(self):
+        """
+        記録済みのフィンガープリントを並べ替えた配列と、それぞれの明細のファイル名を返します。
+        """
+        if self._index is None:
+            files = sorted(self.fingerprints)
+            fps = np.concatenate([self.fingerprints[file] for file in files] or [np.empty(0, np.uint64)])
+            owners = np.repeat(np.array(files, dtype=object), [len(self.fingerprints[file]) for file in files])
+            order = np.argsort(fps, kind="stable")
+            self._index = (fps[order], owners[order])
+        return self._index
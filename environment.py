@@ -0,0 +1,75 @@
+"""
+実行環境の確認
+
+分析を始める前に入力ファイルの有無を確認します。コマンドラインの --check からも呼び出すため、
+pandas などの重い依存関係は読み込みません。
+"""
+
+import os
+
+from config import PRODUCTION_DATA_DIR, PRODUCTION_MERCHANT_CONFIG
+
+
+def print_mode(mode_test):
+    """
+    実行モードを表示します。
+    """
+    if mode_test:
+        print("※テストモードで実行しています。サンプルデータを使用します。")
+    else:
+        print("※実データモードで実行しています。")
+
+
+def check_production_environment(
+    data_dir=PRODUCTION_DATA_DIR, merchant_config=PRODUCTION_MERCHANT_CONFIG
+):
+    """
+    本番モードで必要なディレクトリとファイルの存在を確認します。
+    問題がある場合はエラーメッセージを表示します。
+
+    Args:
+        data_dir (str): 明細CSVを配置するディレクトリ
+        merchant_config (str): 取引先マスターデータのパス
+
+    Returns:
+        bool: 必要なファイルがそろっている場合は True
+    """
+    merchants_dir = os.path.dirname(merchant_config)
+
+    if not os.path.exists(data_dir):
+        print(f"エラー: '{data_dir}' ディレクトリが見つかりません。")
+        print(
+            f"実データモードで実行するには、'{data_dir}' ディレクトリを作成し、CSVファイルを配置してください。"
+        )
+        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
+        return False
+
+    if merchants_dir and not os.path.exists(merchants_dir):
+        print(f"エラー: '{merchants_dir}' ディレクトリが見つかりません。")
+        print(
+            f"実データモードで実行するには、'{merchants_dir}' ディレクトリを作成し、"
+            f"{os.path.basename(merchant_config)} を配置してください。"
+        )
+        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
+        return False
+
+    if not os.path.exists(merchant_config):
+        print(f"エラー: '{merchant_config}' ファイルが見つかりません。")
+        print(
+            f"実データモードで実行するには、{os.path.basename(merchant_config)} ファイルを作成してください。"
+        )
+        print("サンプルとして 'samples/merchants/merchants_sample.csv' を参考にしてください。")
+        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
+        return False
+
+    # データディレクトリ内にCSVファイルがあるか確認
+    csv_files = [f for f in os.listdir(data_dir) if f.endswith(".csv")]
+    if not csv_files:
+        print(f"エラー: '{data_dir}' ディレクトリにCSVファイルが見つかりません。")
+        print(
+            f"実データモードで実行するには、AMEXの明細CSVファイルを '{data_dir}' ディレクトリに配置してください。"
+        )
+        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
+        return False
+
+    return True
@@ -0,0 +1,257 @@
+"""
+為替レート表と海外取引の換算レートの照合
+
+ローカルの為替レート表（CSV / Parquet / Feather。列は date, currency, rate。rate は1通貨単位あたりの円）を
+「通貨 × 日付」の1つのキーで並べた配列に索引付けし、海外取引ごとにご利用日以前で最も新しい参照レートを
+1回の二分探索（as-of 結合）でまとめて求めます。取引ごとの換算レート（円の金額 ÷ 現地通貨建て金額）と
+参照レートとの乖離率を計算し、通貨ごとに集計します。
+
+解析したレート表は内容のハッシュ値ごとにキャッシュディレクトリへ保存し、変更がなければ次回以降は解析せずに読み込みます。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from csv_reader import read_csv
+from ingest_cache import file_digest
+
+# レート表から読み込む列
+RATE_COLUMNS = ("date", "currency", "rate")
+
+# キャッシュの形式を変更したら上げる（既存のキャッシュは使わない）
+CACHE_VERSION = 1
+
+# 索引のキー（通貨の番号 × KEY_STRIDE + 日付の通し日数 + KEY_OFFSET）。日付の通し日数は KEY_OFFSET より小さい範囲に収まる
+KEY_STRIDE = 1 << 32
+KEY_OFFSET = 1 << 31
+
+# 通貨ごとの集計で合計する列（チャンクごとの合計を足し合わせられる）
+TOTAL_COLUMNS = ["回数", "合計金額", "現地通貨建て金額", "照合済み金額", "参照レート換算額", "レート未登録"]
+
+
+class FxRateTable:
+    """
+    通貨・日付ごとの参照レートの索引
+    """
+
+    def __init__(self, currencies, keys, rates):
+        """
+        Args:
+            currencies (np.ndarray): 通貨コード（昇順）
+            keys (np.ndarray): 「通貨 × 日付」のキー（int64、昇順）
+            rates (np.ndarray): キーに対応する参照レート（float64）
+        """
+        self.currencies = currencies
+        self.keys = keys
+        self.rates = rates
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        date, currency, rate 列のデータフレームから索引を作ります。
+        同じ通貨・日付のレートが複数ある場合は、後の行を使います。
+        """
+        missing = [column for column in RATE_COLUMNS if column not in df.columns]
+        if missing:
+            raise ValueError(f"為替レート表に必要な列がありません: {missing}")
+
+        dates = df["date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = dates.astype(str).str.strip().str.replace("/", "-", regex=False)
+            dates = pd.to_datetime(dates, format="%Y-%m-%d")
+        table = pd.DataFrame(
+            {
+                "currency": df["currency"].astype(str).str.strip().str.upper().to_numpy(),
+                "day": _days(dates),
+                "rate": pd.to_numeric(df["rate"]).to_numpy(dtype=np.float64),
+            }
+        )
+        table = table[table["rate"].notna()].drop_duplicates(["currency", "day"], keep="last")
+
+        currencies, codes = np.unique(table["currency"].to_numpy(dtype=str), return_inverse=True)
+        keys = codes.astype(np.int64) * KEY_STRIDE + table["day"].to_numpy() + KEY_OFFSET
+        order = np.argsort(keys, kind="stable")
+        return cls(currencies.astype(object), keys[order], table["rate"].to_numpy()[order])
+
+    @classmethod
+    def load(cls, path, cache_dir=None, backend="pandas"):
+        """
+        為替レート表を読み込みます。拡張子が .parquet / .feather の場合は列指向形式（pyarrow が必要）、
+        それ以外は CSV（CP932）として読み込みます。
+
+        Args:
+            path (str): 為替レート表のパス
+            cache_dir (str): 解析した索引の保存先（None の場合は保存しない）
+            backend (str): CSV の読み込み方法（"pandas" または "pyarrow"）
+
+        Returns:
+            FxRateTable: 参照レートの索引
+        """
+        cache_path = None
+        if cache_dir:
+            cache_path = os.path.join(cache_dir, f"{file_digest(path)}.pkl")
+            table = _read_cache(cache_path)
+            if table is not None:
+                print(f"為替レート表をキャッシュから読み込みました: {len(table)}件")
+                return table
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".parquet":
+            df = pd.read_parquet(path, columns=list(RATE_COLUMNS))
+        elif extension == ".feather":
+            df = pd.read_feather(path, columns=list(RATE_COLUMNS))
+        else:
+            df = read_csv(path, backend, columns=RATE_COLUMNS.__contains__, dtype={"date": str, "currency": str})
+        table = cls.from_frame(df)
+        print(f"為替レート表を読み込みました: {len(table)}件")
+
+        if cache_path is not None:
+            _write_cache(table, cache_path)
+        return table
+
+    def lookup(self, currencies, dates, max_age_days=None):
+        """
+        取引ごとに、ご利用日以前で最も新しい参照レートを返します。
+
+        Args:
+            currencies (pd.Series): 通貨コード（レート表と同じく前後の空白を除き、大文字にして照合する）
+            dates (pd.Series): ご利用日
+            max_age_days (int): ご利用日よりこの日数を超えて古いレートは使わない（None の場合は制限しない）
+
+        Returns:
+            np.ndarray: 参照レート（float64。該当するレートがない取引は NaN）
+        """
+        result = np.full(len(currencies), np.nan)
+        if not len(self.keys) or not len(currencies):
+            return result
+
+        currencies = currencies.astype(object).fillna("").astype(str).str.strip().str.upper().to_numpy(dtype=str)
+        codes = np.searchsorted(self.currencies.astype(str), currencies)
+        codes = np.minimum(codes, len(self.currencies) - 1)
+        known = (self.currencies[codes] == currencies) & dates.notna().to_numpy()
+
+        days = _days(dates)
+        positions = np.searchsorted(self.keys, codes * KEY_STRIDE + days + KEY_OFFSET, side="right") - 1
+        found = known & (positions >= 0)
+        positions = np.maximum(positions, 0)
+        # 直前のキーが別の通貨のものであれば、その通貨にはご利用日以前のレートがない
+        found &= self.keys[positions] // KEY_STRIDE == codes
+        if max_age_days is not None:
+            found &= days - (self.keys[positions] % KEY_STRIDE - KEY_OFFSET) <= max_age_days
+        result[found] = self.rates[positions[found]]
+        return result
+
+    def annotate(self, foreign, max_age_days=None):
+        """
+        海外取引に換算レート・参照レート・乖離率の列を加えます。
+
+        Args:
+            foreign (pd.DataFrame): 海外取引の行（ご利用日・金額・現地通貨建て金額・通貨の列を含む）
+            max_age_days (int): lookup を参照
+
+        Returns:
+            pd.DataFrame: 列を加えた海外取引の行（現地通貨建て金額のない行の値は NaN）
+        """
+        reference = self.lookup(foreign["通貨"], foreign["ご利用日"], max_age_days)
+        local = foreign["現地通貨建て金額"].to_numpy(dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            implied = np.where(local != 0, foreign["金額"].to_numpy(dtype=np.float64) / local, np.nan)
+            deviation = implied / reference - 1
+        return foreign.assign(換算レート=implied, 参照レート=reference, 乖離率=deviation)
+
+
+def currency_totals(foreign):
+    """
+    annotate した海外取引を通貨ごとに合計します（チャンクごとの合計を足し合わせて currency_summary に渡せる）。
+
+    Returns:
+        pd.DataFrame: 通貨ごとの TOTAL_COLUMNS の合計
+    """
+    foreign = foreign[foreign["現地通貨建て金額"].notna()]
+    matched = foreign["参照レート"].notna()
+    frame = pd.DataFrame(
+        {
+            "通貨": foreign["通貨"].astype(object),
+            "回数": 1,
+            "合計金額": foreign["金額"].astype(np.int64),
+            "現地通貨建て金額": foreign["現地通貨建て金額"],
+            "照合済み金額": foreign["金額"].where(matched, 0).astype(np.int64),
+            "参照レート換算額": (foreign["現地通貨建て金額"] * foreign["参照レート"]).where(matched, 0.0),
+            "レート未登録": (~matched).astype(np.int64),
+        }
+    )
+    return frame.groupby("通貨", sort=True)[TOTAL_COLUMNS].sum()
+
+
+def merge_totals(totals):
+    """
+    currency_totals の戻り値（チャンクごとの合計）を足し合わせます。
+    """
+    return pd.concat(totals).groupby(level=0, sort=True).sum()
+
+
+def currency_summary(totals):
+    """
+    通貨ごとの合計から、平均換算レートと参照レートとの乖離を求めます（foreign_summary.csv）。
+
+    Args:
+        totals (pd.DataFrame): currency_totals の戻り値（複数のチャンクの合計でもよい）
+
+    Returns:
+        pd.DataFrame: 通貨ごとの回数・合計金額・現地通貨建て金額・平均換算レート・参照レート換算額・乖離額・乖離率・
+            レート未登録（参照レートがなかった取引の件数）
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average = totals["合計金額"] / totals["現地通貨建て金額"]
+        deviation = totals["照合済み金額"] - totals["参照レート換算額"]
+        ratio = deviation / totals["参照レート換算額"]
+    summary = totals[["回数", "合計金額", "現地通貨建て金額"]].assign(
+        平均換算レート=average.where(totals["現地通貨建て金額"] != 0),
+        参照レート換算額=totals["参照レート換算額"],
+        乖離額=deviation,
+        乖離率=ratio.where(totals["参照レート換算額"] != 0),
+        レート未登録=totals["レート未登録"],
+    )
+    return summary.astype({"回数": np.int64, "合計金額": np.int64, "レート未登録": np.int64})
+
+
+def _days(dates):
+    """
+    日付を 1970-01-01 からの通し日数（int64）に変換します。
+    """
+    return pd.DatetimeIndex(dates).to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+def _read_cache(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        data = pd.read_pickle(path)
+        if data.get("version") != CACHE_VERSION:
+            return None
+        return FxRateTable(data["currencies"], data["keys"], data["rates"])
+    except Exception as e:
+        print(f"警告: 為替レート表のキャッシュの読み込み中にエラーが発生しました: {e}")
+        return None
+
+
+def _write_cache(table, path):
+    """
+    索引を保存し、以前の内容のレート表のキャッシュを削除します。
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pd.to_pickle(
+        {"version": CACHE_VERSION, "currencies": table.currencies, "keys": table.keys, "rates": table.rates},
+        tmp_path,
+    )
+    os.replace(tmp_path, path)
+    for name in os.listdir(directory):
+        if name.endswith(".pkl") and name != os.path.basename(path):
+            os.remove(os.path.join(directory, name))
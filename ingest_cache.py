@@ -0,0 +1,281 @@
+"""
+明細CSVの取込キャッシュ
+
+明細CSVごとに前処理済み（対象年での絞り込み前）のデータを列指向形式で保存し、
+ファイルのサイズ・更新日時・内容のハッシュ値をマニフェストに記録します。
+次回以降は追加・変更されたファイルだけを解析し、それ以外はキャッシュから読み込みます。
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    CACHE_FORMAT = "parquet"
+except ImportError:
+    # pyarrow がない環境では pickle で保存する
+    CACHE_FORMAT = "pickle"
+
+# マニフェストの形式、または前処理の内容を変更したら上げる（既存のキャッシュはすべて作り直される）
+SCHEMA_VERSION = 3
+
+MANIFEST_NAME = "manifest.json"
+
+
+class IngestCache:
+    """
+    明細CSVごとの前処理済みデータのキャッシュ
+    """
+
+    def __init__(self, cache_dir, rebuild=False):
+        """
+        Args:
+            cache_dir (str): キャッシュとマニフェストを保存するディレクトリ
+            rebuild (bool): True の場合は既存のキャッシュを破棄してすべてのファイルを解析し直す
+        """
+        self.cache_dir = cache_dir
+        self.rebuild = rebuild
+        self.manifest = self._read_manifest()
+        self._pending = {}
+        self.reused = 0
+        self.parsed = 0
+        self.deleted = 0
+        self.skipped = 0
+
+    def _read_manifest(self):
+        path = os.path.join(self.cache_dir, MANIFEST_NAME)
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"警告: 取込キャッシュのマニフェストの読み込み中にエラーが発生しました: {e}")
+        return self._empty_manifest(None)
+
+    @staticmethod
+    def _empty_manifest(data_dir):
+        return {
+            "version": SCHEMA_VERSION,
+            "format": CACHE_FORMAT,
+            "data_dir": data_dir,
+            "schema": None,
+            "files": {},
+        }
+
+    def refresh(self, data_dir, files):
+        """
+        マニフェストを現在のファイル一覧と照合し、解析が必要なファイルを返します。
+
+        削除されたファイルのキャッシュは破棄します。サイズと更新日時が同じファイルはそのまま再利用し、
+        異なる場合は内容のハッシュ値を比較して、内容も変わっている場合だけ解析対象にします。
+
+        Args:
+            data_dir (str): 明細CSVが格納されているディレクトリ
+            files (list): 明細CSVのファイル名
+
+        Returns:
+            list: 解析が必要なファイル名
+        """
+        data_dir = os.path.abspath(data_dir)
+        reason = None
+        if self.rebuild:
+            reason = "再構築が指定されました"
+        elif self.manifest.get("version") != SCHEMA_VERSION:
+            reason = "キャッシュの形式が変更されました"
+        elif self.manifest.get("format") != CACHE_FORMAT:
+            reason = "キャッシュの保存形式が変更されました"
+        elif self.manifest.get("data_dir") not in (None, data_dir):
+            reason = "データディレクトリが変更されました"
+        if reason is not None:
+            if self.manifest["files"]:
+                print(f"取込キャッシュを作り直します: {reason}")
+            for file in list(self.manifest["files"]):
+                self._discard(file)
+            self.manifest = self._empty_manifest(data_dir)
+        self.manifest["data_dir"] = data_dir
+
+        entries = self.manifest["files"]
+        for file in sorted(set(entries) - set(files)):
+            print(f"取込キャッシュから削除されたファイルを除外します: {file}")
+            self._discard(file)
+            self.deleted += 1
+
+        stale = []
+        for file in files:
+            path = os.path.join(data_dir, file)
+            stat = os.stat(path)
+            entry = entries.get(file)
+            if entry is not None and not os.path.exists(self._cache_path(entry)):
+                entry = None
+            if entry is not None and (entry["size"], entry["mtime_ns"]) == (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                continue
+
+            digest = file_digest(path)
+            if entry is not None and entry["sha256"] == digest:
+                # 内容は同じで更新日時だけが変わった
+                entry["size"] = stat.st_size
+                entry["mtime_ns"] = stat.st_mtime_ns
+                continue
+
+            if entry is not None:
+                self._discard(file)
+            self._pending[file] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+            }
+            stale.append(file)
+        return stale
+
+    def store(self, file, df):
+        """
+        解析したファイルの前処理済みデータを保存します。
+
+        Args:
+            file (str): 明細CSVのファイル名
+            df (pd.DataFrame): 前処理済み（対象年での絞り込み前）の取引データ
+        """
+        entry = dict(self._pending.pop(file))
+        entry["cache"] = hashlib.sha1(file.encode("utf-8")).hexdigest()[:16] + _extension()
+        entry["rows"] = len(df)
+        entry["schema"] = frame_schema(df)
+        dates = df["ご利用日"].dropna()
+        entry["date_range"] = (
+            [dates.min().isoformat(), dates.max().isoformat()] if len(dates) else None
+        )
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(entry)
+        tmp_path = f"{path}.tmp"
+        _write_frame(df, tmp_path)
+        os.replace(tmp_path, path)
+
+        self.manifest["files"][file] = entry
+        if len(df):
+            # 行のないファイルは前処理されないため、列構成の基準にしない
+            self.manifest["schema"] = entry["schema"]
+        self.parsed += 1
+
+    def date_range(self, file):
+        """
+        キャッシュに記録されたファイルのご利用日の範囲を返します。
+
+        Returns:
+            tuple: (最初の日付, 最後の日付)。記録がない場合は None
+        """
+        date_range = self.manifest["files"][file].get("date_range")
+        if date_range is None:
+            return None
+        return pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+
+    def load(self, file):
+        """
+        キャッシュからファイルの前処理済みデータを読み込みます。
+
+        直近に解析したファイルと列構成が異なる場合や、キャッシュが読み込めない場合は None を返します。
+        その場合、呼び出し側はファイルを解析し直してください。
+        """
+        entry = self.manifest["files"][file]
+        schema = self.manifest["schema"]
+        if entry["rows"] and schema is not None and entry["schema"] != schema:
+            self._repend(file)
+            return None
+        try:
+            df = _read_frame(self._cache_path(entry))
+        except Exception as e:
+            print(f"警告: 取込キャッシュ {entry['cache']} の読み込み中にエラーが発生しました: {e}")
+            self._repend(file)
+            return None
+        self.reused += 1
+        return df
+
+    def save(self):
+        """
+        マニフェストを保存します。
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, MANIFEST_NAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def report(self):
+        """
+        再利用・解析・削除・期間外でスキップしたファイル数を表示します。
+        """
+        print(
+            f"取込キャッシュ: 再利用 {self.reused}件 / 解析 {self.parsed}件 / "
+            f"削除 {self.deleted}件 / 対象期間外 {self.skipped}件"
+        )
+
+    def _repend(self, file):
+        entry = self.manifest["files"][file]
+        self._pending[file] = {key: entry[key] for key in ("size", "mtime_ns", "sha256")}
+        self._discard(file)
+
+    def _discard(self, file):
+        entry = self.manifest["files"].pop(file)
+        path = self._cache_path(entry)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _cache_path(self, entry):
+        return os.path.join(self.cache_dir, entry["cache"])
+
+
+def file_signature(path):
+    """
+    ファイルのサイズと更新日時を返します。ファイルがない場合は None を返します。
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def file_digest(path):
+    """
+    ファイル内容の SHA-256 ハッシュ値を返します。
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_schema(df):
+    """
+    列名と型の対応を返します。
+    """
+    return {column: str(dtype) for column, dtype in df.dtypes.items()}
+
+
+def _extension():
+    return ".parquet" if CACHE_FORMAT == "parquet" else ".pkl"
+
+
+def _write_frame(df, path):
+    if CACHE_FORMAT == "parquet":
+        df.to_parquet(path)
+    else:
+        df.to_pickle(path)
+
+
+def _read_frame(path):
+    if CACHE_FORMAT == "parquet":
+        df = pd.read_parquet(path)
+        # Parquet では文字列列の欠損値が None になるため、解析直後と同じ NaN に戻す
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+        return df
+    return pd.read_pickle(path)
@@ -0,0 +1,212 @@
+"""
+処理の段階ごとの計測
+
+main() の各段階（読み込み、前処理、法人取引判定、各集計、各出力）の実行時間・CPU時間・入出力の行数・
+メモリ使用量を記録し、結果ディレクトリに実行レポート（JSON）として書き出します。
+指定した段階だけを cProfile または tracemalloc で詳しく調べることもできます。
+"""
+
+import cProfile
+import json
+import os
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Windows では resource モジュールが使えないため、メモリ使用量は記録しない
+    resource = None
+
+RUN_REPORT_NAME = "run_report.json"
+PROFILE_MODES = ("cprofile", "tracemalloc")
+
+# 詳しく調べた段階で記録する関数・箇所の数
+PROFILE_TOP = 20
+
+
+class RunProfiler:
+    """
+    処理の段階ごとの計測結果を集めます。
+
+    同じ名前の段階を複数回計測した場合（ストリーミングモードのチャンクごとの処理など）は、
+    時間と行数を合計し、呼び出し回数を記録します。詳しく調べる段階が複数回実行された場合、
+    cProfile はすべての呼び出しを合わせた統計、tracemalloc はメモリ使用量が最も多かった呼び出しを記録します。
+    """
+
+    def __init__(self, profile_stage=None, profile_mode="cprofile", profile_dir=None):
+        """
+        Args:
+            profile_stage (str): cProfile / tracemalloc で詳しく調べる段階の名前（None の場合は調べない）
+            profile_mode (str): "cprofile" または "tracemalloc"
+            profile_dir (str): cProfile の統計ファイルを書き出すディレクトリ
+        """
+        if profile_stage and profile_mode not in PROFILE_MODES:
+            raise ValueError(f"未対応のプロファイル方法です: {profile_mode}")
+        self.profile_stage = profile_stage
+        self.profile_mode = profile_mode
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self._cprofile = None
+        self._tracemalloc = None
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+
+    def measure(self, name, func, *args, **kwargs):
+        """
+        func を1つの段階として実行し、戻り値を返します。
+
+        入力の行数は最初の DataFrame の引数、出力の行数は戻り値が DataFrame の場合にその行数を記録します。
+        """
+        rows_in = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+        with self.stage(name, rows_in) as record:
+            result = func(*args, **kwargs)
+            if isinstance(result, pd.DataFrame):
+                record["rows_out"] = len(result)
+        return result
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        with ブロックを1つの段階として計測します。
+
+        ブロック内で、渡された辞書の "rows_out" に出力の行数を設定できます。
+        """
+        record = {"rows_out": None}
+        profiling = name == self.profile_stage
+        if profiling and self.profile_mode == "cprofile":
+            if self._cprofile is None:
+                self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif profiling:
+            tracemalloc.start()
+
+        rss_started = peak_rss_mb()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            if profiling and self.profile_mode == "cprofile":
+                self._cprofile.disable()
+            elif profiling:
+                self._record_tracemalloc()
+            rss_increase = None if rss_started is None else peak_rss_mb() - rss_started
+            self._add(name, wall, cpu, rows_in, record["rows_out"], rss_increase)
+
+    def _add(self, name, wall, cpu, rows_in, rows_out, rss_increase):
+        stage = self.stages.setdefault(
+            name,
+            {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows_in": None, "rows_out": None},
+        )
+        stage["calls"] += 1
+        stage["wall_seconds"] += wall
+        stage["cpu_seconds"] += cpu
+        if rows_in is not None:
+            stage["rows_in"] = (stage["rows_in"] or 0) + rows_in
+        if rows_out is not None:
+            stage["rows_out"] = (stage["rows_out"] or 0) + rows_out
+        # 段階の実行中に増えたプロセスのメモリ使用量の最大値（それまでの最大値を超えなかった段階は 0）
+        if rss_increase is not None:
+            stage["peak_rss_increase_mb"] = round(stage.get("peak_rss_increase_mb", 0.0) + rss_increase, 1)
+
+    def _record_tracemalloc(self):
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if self._tracemalloc is None or peak > self._tracemalloc[0]:
+            self._tracemalloc = (peak, snapshot)
+
+    def _profile_report(self):
+        if self._cprofile is not None:
+            stats = pstats.Stats(self._cprofile)
+            entry = {"stage": self.profile_stage, "mode": "cprofile"}
+            if self.profile_dir:
+                path = os.path.join(self.profile_dir, f"profile_{self.profile_stage}.prof")
+                stats.dump_stats(path)
+                entry["stats_file"] = os.path.basename(path)
+            # 累積時間の長い関数
+            top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            entry["top"] = [
+                {
+                    "function": f"{os.path.basename(file)}:{line}({function})",
+                    "calls": calls,
+                    "cumulative_seconds": round(cumulative, 6),
+                }
+                for (file, line, function), (_, calls, _, cumulative, _) in top[:PROFILE_TOP]
+            ]
+            return entry
+        if self._tracemalloc is not None:
+            peak, snapshot = self._tracemalloc
+            return {
+                "stage": self.profile_stage,
+                "mode": "tracemalloc",
+                "peak_mb": round(peak / 2**20, 3),
+                # メモリ確保の多い箇所
+                "top": [
+                    {
+                        "location": str(stat.traceback[0]),
+                        "size_mb": round(stat.size / 2**20, 3),
+                        "count": stat.count,
+                    }
+                    for stat in snapshot.statistics("lineno")[:PROFILE_TOP]
+                ],
+            }
+        return None
+
+    def report(self, metadata=None):
+        """
+        実行レポートを辞書で返します。
+        """
+        stages = [
+            {
+                "name": name,
+                **stage,
+                "wall_seconds": round(stage["wall_seconds"], 6),
+                "cpu_seconds": round(stage["cpu_seconds"], 6),
+            }
+            for name, stage in self.stages.items()
+        ]
+        return {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "argv": sys.argv,
+            **(metadata or {}),
+            "wall_seconds": round(time.perf_counter() - self._started, 6),
+            "cpu_seconds": round(time.process_time() - self._cpu_started, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+            "profile": self._profile_report(),
+        }
+
+    def save(self, path, metadata=None):
+        """
+        実行レポートを JSON ファイルに書き出します。
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(metadata), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+def peak_rss_mb():
+    """
+    プロセスのメモリ使用量（常駐セットサイズ）の最大値を MB で返します。取得できない環境では None を返します。
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト単位、Linux は KB 単位
+    if sys.platform == "darwin":
+        return round(peak / 2**20, 1)
+    return round(peak / 2**10, 1)
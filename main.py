@@ -6,168 +6,642 @@ using a merchant configuration file
 """
 
 import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
 
+import numpy as np
 import pandas as pd
 
-from config import DATA_DIR, MERCHANT_CONFIG, MODE_TEST, RESULT_DIR, TARGET_YEAR
+from aggregate_store import AggregateStore, same_results
+from aggregation import ROLLUP_FREQUENCIES, AggregateState
+from classification_cache import ClassificationCache, master_hash, master_rule_keys
+from config import (
+    AGGREGATE_STATE_PATH,
+    AGGREGATE_STATE_VERIFY,
+    APPROXIMATE_SUMMARIES,
+    CLASSIFICATION_CACHE_MAX_ENTRIES,
+    CLASSIFICATION_CACHE_PATH,
+    COMPACT_DTYPES,
+    CSV_READER,
+    DATE_FROM,
+    DATE_TO,
+    DEDUPLICATE_TRANSACTIONS,
+    FX_RATE_MAX_AGE_DAYS,
+    FX_RATES_CACHE_DIR,
+    FX_RATES_PATH,
+    HLL_PRECISION,
+    INGEST_CACHE_DIR,
+    INGEST_CACHE_REBUILD,
+    LOAD_EXECUTOR,
+    LOAD_WORKERS,
+    MERCHANT_CONFIG,
+    MERCHANT_NORMALIZATION,
+    MERCHANT_STRIP_PATTERNS,
+    MODE_TEST,
+    OUTPUT_COMPRESSION,
+    OUTPUT_FORMATS,
+    OUTPUT_WORKERS,
+    OUTPUTS,
+    PARTITION_EXECUTOR,
+    PARTITION_WORKERS,
+    PARTITIONS,
+    PROFILE_MODE,
+    PROFILE_STAGE,
+    ROLLUP_PERIODS,
+    RESULT_DIR,
+    RUN_REPORT,
+    SKETCH_CAPACITY,
+    SKETCH_TOP_K,
+    SKIP_FILES_OUTSIDE_PERIOD,
+    STREAMING,
+    STREAMING_CHUNK_SIZE,
+    TARGET_YEAR,
+    TOP_MERCHANTS,
+    TRANSACTION_STORE_PATH,
+    default_paths,
+)
+from csv_reader import read_csv
+from dedup import TransactionDeduplicator
+from environment import check_production_environment, print_mode
+from fx_rates import FxRateTable, currency_summary, currency_totals, merge_totals
+from ingest_cache import IngestCache, file_signature
+from instrumentation import RUN_REPORT_NAME, RunProfiler
+from merchant_matcher import NO_MATCH, MerchantNormalizer, build_matcher
+from outputs import CSV_DATE_FORMAT, ResultWriter
+from sketches import MerchantSketches
+from streaming import SortedRunWriter
+from transaction_store import TransactionStore
 
+# ご利用日の形式
+DATE_FORMAT = "%Y/%m/%d"
 
-def check_production_environment():
-    """
-    本番モードで必要なディレクトリとファイルの存在を確認します。
-    問題がある場合はエラーメッセージを表示して終了します。
-    """
-    if not os.path.exists("data"):
-        print("エラー: 'data' ディレクトリが見つかりません。")
-        print(
-            "実データモードで実行するには、'data' ディレクトリを作成し、CSVファイルを配置してください。"
-        )
-        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
-        return False
-
-    if not os.path.exists("merchants"):
-        print("エラー: 'merchants' ディレクトリが見つかりません。")
-        print(
-            "実データモードで実行するには、'merchants' ディレクトリを作成し、merchants.csv を配置してください。"
-        )
-        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
-        return False
-
-    if not os.path.exists("merchants/merchants.csv"):
-        print("エラー: 'merchants/merchants.csv' ファイルが見つかりません。")
-        print("実データモードで実行するには、merchants.csv ファイルを作成してください。")
-        print("サンプルとして 'samples/merchants/merchants_sample.csv' を参考にしてください。")
-        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
-        return False
-
-    # data ディレクトリ内にCSVファイルがあるか確認
-    csv_files = [f for f in os.listdir("data") if f.endswith(".csv")]
-    if not csv_files:
-        print("エラー: 'data' ディレクトリにCSVファイルが見つかりません。")
-        print(
-            "実データモードで実行するには、AMEXの明細CSVファイルを 'data' ディレクトリに配置してください。"
-        )
-        print("または、config.py の MODE_TEST = True に設定してテストモードで実行してください。")
-        return False
+# 海外通貨利用金額の形式: "<金額> <通貨>"（金額は桁区切りのカンマを含む場合がある）
+FOREIGN_AMOUNT_PATTERN = re.compile(r"^\s*(?P<amount>-?[\d,]*\.?\d+)\s+(?P<currency>\S+)")
 
-    return True
+# 明細CSVから読み込む列と、文字列として読み込む列（金額は桁区切りを除いて整数として読み込む）
+TRANSACTION_COLUMNS = ["ご利用日", "ご利用内容", "金額", "海外通貨利用金額"]
+TRANSACTION_DTYPES = {"ご利用日": str, "ご利用内容": str, "海外通貨利用金額": str}
 
+# 取引先マスターデータから読み込む列（match_type は任意）
+MERCHANT_COLUMNS = ("merchant_name", "is_corporate", "category", "match_type")
 
-# テストモードの表示
-if MODE_TEST:
-    print("※テストモードで実行しています。サンプルデータを使用します。")
-else:
-    print("※実データモードで実行しています。")
+# 結果ファイルの出力名（OUTPUTS で書き出す結果を選べる）
+OUTPUT_NAMES = (
+    ("concatenated", "grouped", "corporate_summary", "foreign", "foreign_summary")
+    + tuple(f"rollup_{period}" for period in ROLLUP_FREQUENCIES)
+    + ("top_merchants", "distinct_merchants")
+)
 
-    # 本番モードの場合、必要なディレクトリとファイルの存在チェック
-    if not check_production_environment():
-        sys.exit(1)
+# 分析対象期間を受け取る引数の既定値。config.py の設定から期間を求めることを表す
+# （並列読み込みのワーカーにもそのまま渡せるよう文字列にしている）
+CONFIGURED_PERIOD = "config"
 
-# create DATA_DIR and RESULT_DIR if they don't exist
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(RESULT_DIR, exist_ok=True)
+# 重複取引の判定結果の保存先（取込キャッシュのディレクトリ内のファイル名）
+DEDUP_STATE_NAME = "dedup_state.pkl"
 
 
-def load_merchant_config():
+def load_merchant_config(cache=None, path=None):
     """
     法人取引判定用のマスターデータを読み込む
     merchants.csvには法人取引先の定義が含まれる
+
+    Args:
+        cache (ClassificationCache): 分類キャッシュ。指定した場合はマスターデータの変更に合わせて
+            影響を受けるエントリを無効化する
+        path (str): マスターデータのパス（None の場合は config.py の MERCHANT_CONFIG）
     """
+    path = path or MERCHANT_CONFIG
     try:
         # サンプルデータも実データも同じCP932（Shift-JIS）で読み込む
-        merchants_df = pd.read_csv(MERCHANT_CONFIG, encoding="cp932")
+        merchants_df = read_csv(path, CSV_READER, columns=MERCHANT_COLUMNS.__contains__)
         print(f"法人取引マスターデータを読み込みました: {len(merchants_df)}件")
+        if cache is not None:
+            cache.sync_master(merchants_df)
         return merchants_df
     except FileNotFoundError:
-        print(f"警告: {MERCHANT_CONFIG}が見つかりません。法人取引の判定はスキップされます。")
+        print(f"警告: {path}が見つかりません。法人取引の判定はスキップされます。")
         return None
     except Exception as e:
         print(f"警告: マスターデータの読み込み中にエラーが発生しました: {e}")
         return None
 
 
-def identify_corporate_transactions(df, merchants_df):
+def merchant_normalizer():
+    """
+    config.py の設定から取引先名の正規化を返します。正規化しない場合は None を返します。
+    """
+    if not MERCHANT_NORMALIZATION:
+        return None
+    return MerchantNormalizer(MERCHANT_STRIP_PATTERNS)
+
+
+def identify_corporate_transactions(df, merchants_df, cache=None):
     """
-    取引データに法人/個人取引フラグとカテゴリを付与します。
+    取引データに法人/個人取引フラグとカテゴリ、判定に使ったルール（merchant_name）を付与します。
 
     フラグの値は取引の性質を示します：
     - 3: 明確な法人取引（例：クラウドサービス、開発ツール）
     - 2: 明確な個人取引（例：スーパーマーケット、レストラン）
     - 1: 法人・個人両方の可能性がある取引
     - 0: 不明・その他
+
+    取引内容とルールは config.py の設定に従って正規化してから照合します。
+    cache (ClassificationCache) を指定すると、キャッシュにない取引内容だけを判定します
+    （正規化の設定はキャッシュに指定したものを使います）。
     """
     if merchants_df is None:
         df["is_corporate"] = 0
         df["merchant_category"] = "unknown"
+        df["matched_rule"] = ""
         return df
 
-    def match_merchant(transaction):
-        for _, merchant in merchants_df.iterrows():
-            if merchant["merchant_name"] in transaction:
-                return pd.Series([merchant["is_corporate"], merchant["category"]])
-        return pd.Series([0, ""])
+    # マスターデータから一度だけマッチャーを構築し、重複を除いた取引内容だけを判定する
+    codes, descriptions = pd.factorize(df["ご利用内容"])
+    if cache is None:
+        rule_indices = build_matcher(merchants_df, merchant_normalizer()).match_all(descriptions)
+    else:
+        rule_indices = cache.match_all(descriptions, merchants_df)
+
+    # 末尾に「一致なし」の値を追加し、ルール番号 NO_MATCH と欠損値（codes=-1）をそこへ対応させる
+    no_match = len(merchants_df)
+    rule_indices[rule_indices == NO_MATCH] = no_match
+    row_rules = np.append(rule_indices, no_match)[codes]
+
+    corporate_flags = np.append(merchants_df["is_corporate"].to_numpy(), 0)
+    categories = np.append(merchants_df["category"].to_numpy(dtype=object), "")
+    rules = np.append(merchants_df["merchant_name"].to_numpy(dtype=object), "")
+
+    if isinstance(df["ご利用内容"].dtype, pd.CategoricalDtype):
+        # compact_transaction_data で変換済みの場合は、判定結果も同じく小さな型で持つ。
+        # カテゴリはルールごとの値（ルール数 + 1 件）だけを並べ替えて符号化し、行にはその番号を対応させる
+        df["is_corporate"] = corporate_flags[row_rules].astype(np.int8)
+        for column, values in (("merchant_category", categories), ("matched_rule", rules)):
+            value_codes, unique_values = pd.factorize(values, sort=True)
+            df[column] = pd.Categorical.from_codes(value_codes[row_rules], unique_values)
+        return df
 
-    df[["is_corporate", "merchant_category"]] = df["ご利用内容"].apply(match_merchant)
     # 結果を整数型に変換
-    df["is_corporate"] = df["is_corporate"].astype(int)
+    df["is_corporate"] = corporate_flags[row_rules].astype(int)
+    df["merchant_category"] = categories[row_rules]
+    df["matched_rule"] = rules[row_rules]
     return df
 
 
-def load_transaction_data(data_dir):
+def read_transaction_csv(path, **kwargs):
+    """
+    明細CSVの分析に使う列（TRANSACTION_COLUMNS）だけを、CSV_READER で指定した方法で読み込みます。
+    金額列は読み込み時に桁区切りのカンマを除いて数値に変換します。
+
+    Args:
+        path (str): CSVファイルのパス
+        **kwargs: pd.read_csv に渡す追加の引数（chunksize など。指定した場合は pandas で読み込む）
+    """
+    # サンプルデータも実データも同じCP932（Shift-JIS）で読み込む
+    # 文字列の列は、ファイルによって数値として推論されないよう型を指定する
+    return read_csv(
+        path,
+        CSV_READER,
+        columns=TRANSACTION_COLUMNS,
+        dtype=TRANSACTION_DTYPES,
+        encoding="cp932",
+        thousands=",",
+        **kwargs,
+    )
+
+
+def read_transaction_file(path, preprocess=False, period=CONFIGURED_PERIOD):
+    """
+    明細CSVファイルを1つ読み込みます。並列読み込みのワーカーからも呼び出されます。
+
+    Args:
+        path (str): CSVファイルのパス
+        preprocess (bool): True の場合は読み込んだデータに前処理を適用する
+        period (tuple): 前処理で絞り込む分析対象期間 (開始日, 終了日)。None の場合は絞り込まない
+
+    Returns:
+        tuple: (pd.DataFrame, str)。読み込みに失敗した場合は (None, エラーメッセージ)
+    """
+    try:
+        df = read_transaction_csv(path)
+        df["ご利用日"] = parse_transaction_dates(df["ご利用日"])
+        if preprocess and not df.empty:
+            # 対象期間外の行は金額などを解析する前に取り除く
+            df = normalize_transaction_data(filter_analysis_period(df, period))
+        return df, None
+    except Exception as e:
+        return None, str(e)
+
+
+def peek_date_range(path):
+    """
+    明細CSVの先頭と末尾のデータ行だけを読み、ご利用日の範囲を返します。
+    明細がご利用日順に並んでいることを前提とします。
+
+    Args:
+        path (str): CSVファイルのパス
+
+    Returns:
+        tuple: (最初の日付, 最後の日付)。判定できない場合は None
+    """
+    try:
+        with open(path, "rb") as f:
+            f.readline()  # ヘッダー行
+            first = f.readline()
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 4096))
+            tail = [line for line in f.read().splitlines() if line.strip()]
+        if not first.strip() or not tail:
+            return None
+        dates = parse_transaction_dates(
+            pd.Series([line.decode("cp932").split(",", 1)[0].strip('"') for line in (first, tail[-1])])
+        )
+    except Exception:
+        return None
+    if dates.isna().any():
+        return None
+    return dates.min(), dates.max()
+
+
+def _outside_period(date_range, period):
+    """
+    日付の範囲が分析対象期間と重ならない場合に True を返します。
+    """
+    if date_range is None or period is None:
+        return False
+    start, end = period
+    return date_range[1] < start or date_range[0] > end
+
+
+def _skip_files_outside_period(data_dir, files, period):
+    """
+    SKIP_FILES_OUTSIDE_PERIOD が有効な場合、先頭行と末尾行の日付が分析対象期間と重ならない
+    ファイルを除いたファイル一覧を返します。
+    """
+    if period is None or not SKIP_FILES_OUTSIDE_PERIOD:
+        return files
+    skipped = [
+        file
+        for file in files
+        if _outside_period(peek_date_range(os.path.join(data_dir, file)), period)
+    ]
+    if skipped:
+        print(f"対象期間外のためスキップしたファイル: {skipped}")
+    return [file for file in files if file not in skipped]
+
+
+def _read_transaction_files(data_dir, files, workers, preprocess, period):
+    """
+    複数の明細CSVファイルを読み込みます。workers が2以上の場合は並列に読み込みます。
+
+    Returns:
+        list: ファイルごとの read_transaction_file の戻り値
+    """
+    paths = [os.path.join(data_dir, file) for file in files]
+    if workers > 1 and len(files) > 1:
+        executor_class = ThreadPoolExecutor if LOAD_EXECUTOR == "thread" else ProcessPoolExecutor
+        with executor_class(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    read_transaction_file, paths, repeat(preprocess), repeat(period)
+                )
+            )
+    return [read_transaction_file(path, preprocess, period) for path in paths]
+
+
+def _load_transaction_files_with_cache(data_dir, files, workers, ingest_cache, period):
+    """
+    取込キャッシュを使って明細CSVファイルを読み込みます。
+    追加・変更されたファイルだけを解析し、それ以外はキャッシュから読み込みます。
+    キャッシュに記録された日付の範囲が分析対象期間と重ならないファイルは読み込みません。
+
+    Returns:
+        list: ファイルごとの (前処理済みの pd.DataFrame, エラーメッセージ)。
+            読み込まなかったファイルは (None, None)
+    """
+    stale = ingest_cache.refresh(data_dir, files)
+    results = {}
+    for file, (df, error) in zip(
+        stale, _read_transaction_files(data_dir, stale, workers, True, None)
+    ):
+        if error is None:
+            ingest_cache.store(file, df)
+        results[file] = (df, error)
+
+    # 列構成が変わった（またはキャッシュが読み込めない）ファイルは解析し直す
+    retry = []
+    for file in files:
+        if file in results:
+            continue
+        if _outside_period(ingest_cache.date_range(file), period):
+            ingest_cache.skipped += 1
+            results[file] = (None, None)
+            continue
+        df = ingest_cache.load(file)
+        if df is None:
+            retry.append(file)
+        else:
+            results[file] = (df, None)
+    for file, (df, error) in zip(
+        retry, _read_transaction_files(data_dir, retry, workers, True, None)
+    ):
+        if error is None:
+            ingest_cache.store(file, df)
+        results[file] = (df, error)
+
+    ingest_cache.save()
+    ingest_cache.report()
+
+    # キャッシュには全期間のデータを保存し、対象期間での絞り込みは読み込み後に行う
+    return [
+        (filter_analysis_period(df, period) if df is not None else None, error)
+        for df, error in (results[file] for file in files)
+    ]
+
+
+def load_deduplicator(cache_dir, data_dir, period, mode):
+    """
+    明細をまたいだ重複取引の除外に使う TransactionDeduplicator を返します。
+
+    cache_dir を指定した場合は前回の判定結果をそこから読み込み、前回と同じ順に処理する変更のない明細は
+    フィンガープリントを計算し直しません（判定結果は TransactionDeduplicator.save で同じ場所に保存する）。
+
+    Args:
+        cache_dir (str): 取込キャッシュのディレクトリ。None の場合は判定結果を保存しない
+        data_dir (str): 明細CSVが格納されているディレクトリパス
+        period (tuple): 分析対象期間 (開始日, 終了日)。None の場合は期間を限定しない
+        mode (str): 明細の読み込み方（"preprocessed": 前処理済みの明細を1件ずつ / "streaming": チャンクごと）。
+            判定する行の位置が変わるため、読み込み方が異なる場合は前回の判定結果を使わない
+
+    Returns:
+        TransactionDeduplicator: 重複取引の判定結果
+    """
+    path = os.path.join(cache_dir, DEDUP_STATE_NAME) if cache_dir else None
+    settings = {
+        "data_dir": os.path.abspath(data_dir),
+        "period": None if period is None else [str(date) for date in period],
+        "mode": mode,
+    }
+    return TransactionDeduplicator.load(path, settings, rebuild=INGEST_CACHE_REBUILD)
+
+
+def load_transaction_data(
+    data_dir, workers=1, preprocess=False, ingest_cache=None, period=CONFIGURED_PERIOD, deduplicate=None
+):
     """
     指定されたディレクトリから全てのCSVファイルを読み込み、結合します。
 
+    workers を2以上にすると、ファイルごとの読み込み（と前処理）を並列に実行します。
+    並列・逐次のどちらでも、ファイル名順に結合してからご利用日で安定ソートするため、
+    結果の行順は同じになります。
+
+    ご利用日の範囲が分析対象期間と重ならないファイルは読み込まずにスキップします。
+    日付の範囲は取込キャッシュがあればその記録から、SKIP_FILES_OUTSIDE_PERIOD が有効な場合は
+    ファイルの先頭行と末尾行から判定します。行単位の絞り込みは preprocess_transaction_data で行います。
+
+    重複取引の除外を有効にした場合は、ファイル名順に読み込んだ明細ごとに、それより前の明細と重複する取引を除いてから結合します。
+    取込キャッシュを使う場合は、判定結果も取込キャッシュのディレクトリに保存し、変更のない明細は次回に計算し直しません。
+
     Args:
         data_dir (str): CSVファイルが格納されているディレクトリパス
+        workers (int): 並列に読み込むワーカー数
+        preprocess (bool): True の場合はファイルごとに preprocess_transaction_data を適用する
+        ingest_cache (IngestCache): 取込キャッシュ。指定した場合は変更のないファイルを
+            キャッシュから読み込み、常に前処理済みのデータを返す
+        period (tuple): 分析対象期間 (開始日, 終了日)。None の場合は期間を限定しない。
+            省略した場合は config.py の設定から求める
+        deduplicate (bool): 明細をまたいで重複する取引を除くかどうか。None の場合は config.py の設定に従う
 
     Returns:
         pd.DataFrame: 結合された取引データ
     """
-    files = [f for f in os.listdir(data_dir) if f.endswith(".csv")]
+    period = resolve_period(period)
+    if deduplicate is None:
+        deduplicate = DEDUPLICATE_TRANSACTIONS
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith(".csv"))
     print(f"処理対象ファイル: {files}")
 
     if not files:
         print(f"警告: {data_dir}ディレクトリにCSVファイルが見つかりません。")
         return pd.DataFrame()
 
+    if ingest_cache is not None:
+        results = _load_transaction_files_with_cache(data_dir, files, workers, ingest_cache, period)
+    else:
+        files = _skip_files_outside_period(data_dir, files, period)
+        results = _read_transaction_files(data_dir, files, workers, preprocess, period)
+
+    deduplicator = None
+    if deduplicate and ingest_cache is not None:
+        deduplicator = load_deduplicator(ingest_cache.cache_dir, data_dir, period, "preprocessed")
+    elif deduplicate:
+        deduplicator = TransactionDeduplicator()
     dfs = []
-    for file in files:
-        try:
-            # サンプルデータも実データも同じCP932（Shift-JIS）で読み込む
-            df = pd.read_csv(os.path.join(data_dir, file), encoding="cp932")
+    for file, (df, error) in zip(files, results):
+        if error is not None:
+            print(f"警告: ファイル {file} の読み込み中にエラーが発生しました: {error}")
+        elif df is not None and not df.empty:
+            if deduplicator is not None:
+                deduplicator.begin(file, file_signature(os.path.join(data_dir, file)))
+                df = deduplicator.filter(df)
+                deduplicator.commit()
             dfs.append(df)
-        except Exception as e:
-            print(f"警告: ファイル {file} の読み込み中にエラーが発生しました: {e}")
+    if deduplicator is not None:
+        deduplicator.save()
+        deduplicator.report()
 
     if not dfs:
         print("警告: 有効なCSVファイルが読み込めませんでした。")
         return pd.DataFrame()
 
-    return pd.concat(dfs).sort_values("ご利用日")
+    return pd.concat(dfs).sort_values("ご利用日", kind="stable")
 
 
-def preprocess_transaction_data(df):
+def import_transaction_files(store, data_dir, workers=1):
     """
-    取引データの前処理を行います。金額の正規化や海外通貨の処理、文字列のクリーニングを含みます。
+    明細CSVのうち、取引データストアに取り込まれていない（または内容が変わった）ファイルを取り込みます。
+
+    取り込むファイルは前処理（対象期間での絞り込みなし）を行ってから保存します。
+    読み込み中にエラーが発生したファイルは取り込まず、次回の実行で再度取り込みを試みます。
+
+    Args:
+        store (TransactionStore): 取引データストア
+        data_dir (str): CSVファイルが格納されているディレクトリパス
+        workers (int): 並列に読み込むワーカー数
+    """
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith(".csv"))
+    print(f"処理対象ファイル: {files}")
+    stale = store.refresh(data_dir, files)
+    for file, (df, error) in zip(stale, _read_transaction_files(data_dir, stale, workers, True, None)):
+        if error is not None:
+            print(f"警告: ファイル {file} の読み込み中にエラーが発生しました: {error}")
+        else:
+            store.append(file, df)
+    store.report()
+
+
+def normalize_transaction_data(df):
+    """
+    金額の正規化や海外通貨の処理、文字列のクリーニングを行います（対象期間での絞り込みは行いません）。
+
+    ご利用日は日付型、金額は整数、現地通貨建て金額は小数の数値型に変換します。
+    """
+    # 海外通貨利用金額（例: "1,234.56 USD"）から金額と通貨を1回の抽出で取り出す
+    foreign = df["海外通貨利用金額"].str.extract(FOREIGN_AMOUNT_PATTERN)
+    return df.drop(columns=["海外通貨利用金額"]).assign(
+        **{
+            "ご利用日": parse_transaction_dates(df["ご利用日"]),
+            # 取引内容の末尾スペースを削除
+            "ご利用内容": df["ご利用内容"].str.strip(),
+            "金額": _parse_amount(df["金額"]),
+            "現地通貨建て金額": pd.to_numeric(foreign["amount"].str.replace(",", "", regex=False)),
+            "通貨": foreign["currency"],
+        }
+    )
+
+
+def _parse_amount(amount):
+    """
+    金額列を整数に変換します。read_transaction_csv で読み込んだ場合は既に数値になっています。
+    """
+    if not pd.api.types.is_numeric_dtype(amount):
+        amount = amount.str.replace(r'[",]', "", regex=True)
+    return amount.astype(int)
+
+
+def parse_transaction_dates(dates):
+    """
+    ご利用日（"2024/01/05" 形式）を日付型に変換します。既に日付型の場合はそのまま返します。
+    日付として解釈できない値は NaT になります。
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+    return pd.to_datetime(dates, format=DATE_FORMAT, errors="coerce")
+
+
+def compact_transaction_data(df):
+    """
+    前処理済みの取引データを、メモリ使用量の少ない型に変換します。
+
+    取引内容・通貨・取引先カテゴリ・判定に使ったルールのように同じ値が繰り返される文字列はカテゴリ型（カテゴリは文字列順）、
+    法人取引フラグは int8、金額は値の範囲に収まる最小の整数型にします。集計（groupby）はカテゴリの番号で
+    行われ、合計は pandas が int64 で計算するため、変換前と同じ結果になります。
+
+    Args:
+        df (pd.DataFrame): 前処理済み（または法人取引判定済み）の取引データ
+
+    Returns:
+        pd.DataFrame: 型を変換した取引データ
     """
     if df.empty:
         return df
+    columns = {}
+    for column in ("ご利用内容", "通貨", "merchant_category", "matched_rule"):
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            columns[column] = df[column].astype("category")
+    if "is_corporate" in df.columns:
+        columns["is_corporate"] = df["is_corporate"].astype(np.int8)
+    columns["金額"] = pd.to_numeric(df["金額"], downcast="integer")
+    return df.assign(**columns)
+
+
+def analysis_period(target_year=None):
+    """
+    設定ファイルから分析対象期間を求めます。
+
+    DATE_FROM / DATE_TO のいずれかが指定されている場合はその期間（両端を含む）、
+    そうでない場合は TARGET_YEAR の年を対象にします。TARGET_YEAR は年の先頭の桁として扱うため、
+    "202" とすると2020年から2029年までが対象になります。
 
-    # まず取引内容の末尾スペースを削除
-    df["ご利用内容"] = df["ご利用内容"].str.strip()
+    Args:
+        target_year (str): 設定ファイルの代わりに使う対象年。指定した場合は DATE_FROM / DATE_TO を使わない
+
+    Returns:
+        tuple: (開始日, 終了日)。期間を限定しない場合は None
+    """
+    if target_year is None:
+        if DATE_FROM or DATE_TO:
+            start = pd.Timestamp(DATE_FROM) if DATE_FROM else pd.Timestamp.min
+            end = pd.Timestamp(DATE_TO) if DATE_TO else pd.Timestamp.max
+            return start, end
+        target_year = TARGET_YEAR
+    if not target_year:
+        return None
+    first_year = int(target_year.ljust(4, "0"))
+    last_year = int(target_year.ljust(4, "9"))
+    return pd.Timestamp(first_year, 1, 1), pd.Timestamp(last_year, 12, 31)
 
-    # 金額の前処理（既存の処理）
-    df["金額"] = df["金額"].str.replace('"', "").str.replace(",", "").astype(int)
 
-    # 海外通貨関連の処理（既存の処理）
-    df["海外通貨利用金額"] = df["海外通貨利用金額"].str.replace('"', "").str.replace(",", "")
-    df["現地通貨建て金額"] = df["海外通貨利用金額"].str.split().str[0]
-    df["通貨"] = df["海外通貨利用金額"].str.split().str[1]
-    df = df.drop(columns=["海外通貨利用金額"])
+def partition_periods(partitions):
+    """
+    複数期間の一括分析の指定を、期間の名前と期間のリストに変換します。
+
+    Args:
+        partitions (list or dict): 年（TARGET_YEAR と同じく年の先頭の桁として扱う）のリスト、
+            または {名前: (開始日, 終了日)} の辞書（開始日・終了日は両端を含み、None の場合は限定しない）
 
-    # 設定ファイルで指定された年のデータのみを抽出
-    return df[df["ご利用日"].str.contains(TARGET_YEAR)]
+    Returns:
+        list: (名前, (開始日, 終了日)) のリスト。partitions が None の場合は空のリスト
+    """
+    if not partitions:
+        return []
+    if isinstance(partitions, dict):
+        return [
+            (
+                str(name),
+                (
+                    pd.Timestamp(start) if start else pd.Timestamp.min,
+                    pd.Timestamp(end) if end else pd.Timestamp.max,
+                ),
+            )
+            for name, (start, end) in partitions.items()
+        ]
+    return [(str(year), analysis_period(str(year))) for year in partitions]
+
+
+def resolve_period(period):
+    """
+    CONFIGURED_PERIOD を設定ファイルの分析対象期間に置き換えます。
+    """
+    if isinstance(period, str) and period == CONFIGURED_PERIOD:
+        return analysis_period()
+    return period
+
+
+def filter_analysis_period(df, period=CONFIGURED_PERIOD):
+    """
+    分析対象期間のデータのみを抽出します。
+
+    Args:
+        df (pd.DataFrame): 取引データ
+        period (tuple): 分析対象期間 (開始日, 終了日)。None の場合は絞り込まない。
+            省略した場合は config.py の設定から求める
+    """
+    period = resolve_period(period)
+    if period is None:
+        return df
+    dates = parse_transaction_dates(df["ご利用日"])
+    mask = dates.between(*period)
+    return df[mask].assign(**{"ご利用日": dates[mask]})
+
+
+def preprocess_transaction_data(df, period=CONFIGURED_PERIOD):
+    """
+    取引データの前処理を行います。金額の正規化や海外通貨の処理、文字列のクリーニングを含みます。
+    対象期間外の行は解析せずに取り除くため、対象期間での絞り込みを最初に行います。
+
+    Args:
+        df (pd.DataFrame): 取引データ
+        period (tuple): 分析対象期間 (開始日, 終了日)。None の場合は絞り込まない。
+            省略した場合は config.py の設定から求める
+    """
+    if df.empty:
+        return df
+
+    return normalize_transaction_data(filter_analysis_period(df, period))
 
 
 def analyze_transaction_frequency(df):
@@ -182,26 +656,7 @@ def analyze_transaction_frequency(df):
     Returns:
         pd.DataFrame: 取引先ごとの利用回数、合計金額、法人フラグの集計結果
     """
-    return (
-        df.groupby("ご利用内容")
-        .agg(
-            {
-                "ご利用内容": "count",
-                "金額": "sum",
-                "is_corporate": "first",  # 各取引先の法人フラグを取得
-                "merchant_category": "first",  # 各取引先のカテゴリを取得
-            }
-        )
-        .rename(
-            columns={
-                "ご利用内容": "回数",
-                "金額": "合計金額",
-                "is_corporate": "法人取引",
-                "merchant_category": "カテゴリ",
-            }
-        )
-        .sort_values("回数", ascending=False)
-    )
+    return AggregateState.from_frame(df, keep_foreign=False).transaction_frequency()
 
 
 def analyze_corporate_transactions(df):
@@ -214,13 +669,8 @@ def analyze_corporate_transactions(df):
     Returns:
         pd.DataFrame: カテゴリごとの法人取引の集計結果
     """
-    # 法人取引（is_corporate=3）のみを抽出
-    df_corporate = df[df["is_corporate"] == 3]
-    return (
-        df_corporate.groupby("merchant_category")
-        .agg({"ご利用内容": "count", "金額": "sum"})
-        .rename(columns={"ご利用内容": "取引回数", "金額": "合計金額"})
-    )
+    # 法人取引（is_corporate=3）のみを集計
+    return AggregateState.from_frame(df, keep_foreign=False).corporate_summary()
 
 
 def get_foreign_transactions(df):
@@ -236,40 +686,671 @@ def get_foreign_transactions(df):
     return df[df["現地通貨建て金額"].notnull()].copy()
 
 
-def main():
+def load_fx_rates():
+    """
+    FX_RATES_PATH の為替レート表を読み込みます。設定していない場合や読み込めない場合は None を返します。
+    """
+    if not FX_RATES_PATH:
+        return None
+    try:
+        return FxRateTable.load(FX_RATES_PATH, FX_RATES_CACHE_DIR, CSV_READER)
+    except FileNotFoundError:
+        print(f"警告: {FX_RATES_PATH}が見つかりません。参照レートとの照合はスキップされます。")
+    except Exception as e:
+        print(f"警告: 為替レート表の読み込み中にエラーが発生しました: {e}")
+    return None
+
+
+def partition_frame(df, period):
+    """
+    取引データから期間内の行を取り出します。
+
+    ご利用日順に並んでいる場合（load_transaction_data の結果）は二分探索で範囲を求め、行をコピーせずに取り出します。
+
+    Args:
+        df (pd.DataFrame): 前処理済みの取引データ
+        period (tuple): 期間 (開始日, 終了日)。両端を含む
+
+    Returns:
+        pd.DataFrame: 期間内の取引データ
+    """
+    dates = df["ご利用日"]
+    if not dates.is_monotonic_increasing:
+        return filter_analysis_period(df, period)
+    start = dates.searchsorted(period[0], side="left")
+    end = dates.searchsorted(period[1], side="right")
+    return df.iloc[start:end]
+
+
+def _save_classification_cache(cache):
+    """
+    分類キャッシュのヒット数を表示して保存します。
+    """
+    if cache is not None:
+        cache.report()
+        cache.save()
+
+
+def _save_run_report(profiler, result_dir, metadata):
+    """
+    RUN_REPORT が有効な場合、または段階を詳しく調べた場合、段階ごとの計測結果を結果ディレクトリに書き出します。
+    """
+    if RUN_REPORT or profiler.profile_stage:
+        profiler.save(os.path.join(result_dir, RUN_REPORT_NAME), metadata)
+
+
+def result_writer(result_dir, formats, metadata=None):
+    """
+    config.py の設定（OUTPUTS, OUTPUT_COMPRESSION, OUTPUT_WORKERS）に従って結果を書き出す ResultWriter を返します。
+    """
+    unknown = [name for name in OUTPUTS or [] if name not in OUTPUT_NAMES]
+    if unknown:
+        print(f"警告: 未対応の出力名は無視します: {unknown}")
+    return ResultWriter(
+        result_dir,
+        formats,
+        metadata=metadata,
+        compression=OUTPUT_COMPRESSION,
+        workers=OUTPUT_WORKERS,
+        outputs=OUTPUTS,
+    )
+
+
+def write_analysis_results(df, result_dir, metadata, profiler, state=None):
+    """
+    法人取引判定済みの取引データを集計し、結果ファイルを書き出します。
+
+    Args:
+        df (pd.DataFrame): 法人取引判定済みの取引データ。state を指定し、concatenated と foreign を
+            書き出さない場合は None でもよい
+        result_dir (str): 結果を出力するディレクトリ
+        metadata (dict): 列指向形式のメタデータファイルに記録する情報
+        profiler (RunProfiler): 段階ごとの計測結果の記録先
+        state (AggregateState): df の集計結果（foreign を書き出す場合は海外取引の行を含む）。None の場合は df から集計する
+    """
+    writer = result_writer(result_dir, OUTPUT_FORMATS, metadata)
+
+    # 基本データの保存
+    if writer.requested("concatenated"):
+        profiler.measure(
+            "write_concatenated", writer.write, "concatenated", df, index=False, partitioned=True
+        )
+
+    # 取引先ごと・法人取引のカテゴリごと・期間ごとの集計と海外取引の抽出を1回の集計で行う
+    # （書き出さない結果の集計は行わない）
+    rollups = [rollup for rollup in ROLLUP_PERIODS if writer.requested(f"rollup_{rollup}")]
+    summaries = ["grouped", "corporate_summary", "foreign"] + [f"rollup_{rollup}" for rollup in rollups]
+    if FX_RATES_PATH:
+        summaries.append("foreign_summary")
+    if state is None and any(writer.requested(name) for name in summaries):
+        state = profiler.measure("aggregate", AggregateState.from_frame, df, rollups)
+
+    # 取引先ごとの集計
+    if writer.requested("grouped"):
+        profiler.measure("write_grouped", writer.write, "grouped", state.transaction_frequency(TOP_MERCHANTS))
+
+    # 法人取引の集計
+    if writer.requested("corporate_summary"):
+        profiler.measure(
+            "write_corporate_summary", writer.write, "corporate_summary", state.corporate_summary()
+        )
+
+    # 海外取引の抽出と、為替レート表がある場合は参照レートとの照合・通貨ごとの集計
+    fx_rates = load_fx_rates() if writer.requested("foreign") or writer.requested("foreign_summary") else None
+    if writer.requested("foreign") or fx_rates is not None:
+        foreign = state.foreign_transactions()
+        if fx_rates is not None:
+            foreign = profiler.measure("fx_rates", fx_rates.annotate, foreign, FX_RATE_MAX_AGE_DAYS)
+            if writer.requested("foreign_summary"):
+                profiler.measure(
+                    "write_foreign_summary",
+                    writer.write,
+                    "foreign_summary",
+                    currency_summary(currency_totals(foreign)),
+                )
+        if writer.requested("foreign"):
+            profiler.measure("write_foreign", writer.write, "foreign", foreign, index=False, partitioned=True)
+
+    # 期間ごとの集計
+    for rollup in rollups:
+        profiler.measure(f"write_rollup_{rollup}", writer.write, f"rollup_{rollup}", state.rollup(rollup))
+
+    # 近似集計（探索用）
+    if _sketches_requested(writer):
+        if df is None:
+            print("警告: 明細を読み込まずに集計状態から結果を書き出す場合、近似集計は書き出しません。")
+        else:
+            sketches = MerchantSketches(SKETCH_CAPACITY, HLL_PRECISION)
+            profiler.measure("sketch", sketches.update, df)
+            _write_sketches(writer, sketches, profiler)
+
+    # 並列に書き出している場合は、ここで書き出しの完了を待つ
+    if OUTPUT_WORKERS > 1:
+        profiler.measure("write_wait", writer.close)
+    else:
+        writer.close()
+
+
+def _row_outputs_requested():
+    """
+    取引の行が必要な結果（concatenated, foreign と、為替レート表を指定した場合の foreign_summary）を書き出すかどうかを返します。
+    """
+    row_outputs = ("concatenated", "foreign") + (("foreign_summary",) if FX_RATES_PATH else ())
+    return any(OUTPUTS is None or name in OUTPUTS for name in row_outputs)
+
+
+def _sketches_requested(writer):
+    """
+    近似集計（APPROXIMATE_SUMMARIES）の結果を書き出すかどうかを返します。
+    """
+    return APPROXIMATE_SUMMARIES and (writer.requested("top_merchants") or writer.requested("distinct_merchants"))
+
+
+def _write_sketches(writer, sketches, profiler):
+    """
+    近似集計の結果（top_merchants / distinct_merchants）を書き出します。
+    """
+    if writer.requested("top_merchants"):
+        profiler.measure(
+            "write_top_merchants", writer.write, "top_merchants", sketches.top_merchants(SKETCH_TOP_K), index=False
+        )
+    if writer.requested("distinct_merchants"):
+        profiler.measure(
+            "write_distinct_merchants", writer.write, "distinct_merchants", sketches.distinct_merchants()
+        )
+
+
+def analyze_partition(partition_df, name, period, result_dir, metadata, profile_stage=None, profile_mode=None):
+    """
+    複数期間の一括分析で、1つの期間の結果を result_dir/name に書き出します。
+    期間ごとの実行レポートもそのディレクトリに書き出します。並列処理のワーカーからも呼び出されます。
+
+    Args:
+        partition_df (pd.DataFrame): 期間内の法人取引判定済みの取引データ
+
+    Returns:
+        int: 期間内の取引の件数
+    """
+    partition_dir = os.path.join(result_dir, name)
+    os.makedirs(partition_dir, exist_ok=True)
+    if partition_df.empty:
+        print(f"警告: 期間 {name} の取引がありません。")
+        return 0
+
+    metadata = {**metadata, "partition": name, "period": [period[0].isoformat(), period[1].isoformat()]}
+    profiler = RunProfiler(profile_stage, profile_mode or PROFILE_MODE, profile_dir=partition_dir)
+    write_analysis_results(partition_df, partition_dir, metadata, profiler)
+    _save_run_report(profiler, partition_dir, metadata)
+    print(f"期間 {name} の結果を {partition_dir} ディレクトリに保存しました: {len(partition_df)}件")
+    return len(partition_df)
+
+
+def analyze_partitions(df, partitions, result_dir, metadata, workers=1, profile_stage=None, profile_mode=None):
+    """
+    複数期間の一括分析で、期間ごとの結果を並列に書き出します。
+
+    読み込み・前処理・法人取引判定済みの取引データを期間ごとに切り出して集計するため、
+    期間の数だけ明細を読み直すことはありません。
+
+    Args:
+        df (pd.DataFrame): 法人取引判定済みの取引データ
+        partitions (list): partition_periods の戻り値
+        result_dir (str): 結果を出力するディレクトリ（期間ごとのサブディレクトリを作成する）
+        metadata (dict): 実行レポートなどに記録する情報
+        workers (int): 並列に処理するワーカー数（PARTITION_EXECUTOR のプロセスまたはスレッド）
+        profile_stage (str): 期間ごとに詳しく調べる段階の名前（スレッドで並列に処理する場合は調べない）
+        profile_mode (str): "cprofile" または "tracemalloc"
+
+    Returns:
+        dict: 期間の名前ごとの取引の件数
+    """
+    names = [name for name, _ in partitions]
+    periods = [period for _, period in partitions]
+    # ワーカーには期間内の行だけを渡す
+    frames = [partition_frame(df, period) for period in periods]
+    if workers <= 1 or len(partitions) <= 1:
+        rows = [
+            analyze_partition(frame, name, period, result_dir, metadata, profile_stage, profile_mode)
+            for frame, name, period in zip(frames, names, periods)
+        ]
+        return dict(zip(names, rows))
+
+    if PARTITION_EXECUTOR == "thread" and profile_stage:
+        # tracemalloc はプロセス全体で1つのため、スレッドで並列に処理する場合は段階を詳しく調べない
+        print("警告: 期間ごとの処理をスレッドで並列に実行する場合、段階の詳しい調査は行いません。")
+        profile_stage = None
+    executor_class = ThreadPoolExecutor if PARTITION_EXECUTOR == "thread" else ProcessPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        rows = executor.map(
+            analyze_partition,
+            frames,
+            names,
+            periods,
+            repeat(result_dir),
+            repeat(metadata),
+            repeat(profile_stage),
+            repeat(profile_mode),
+        )
+        return dict(zip(names, rows))
+
+
+def stream_transaction_analysis(
+    data_dir,
+    merchants_df,
+    result_dir,
+    chunk_size,
+    cache=None,
+    period=CONFIGURED_PERIOD,
+    profiler=None,
+    rollups=(),
+):
+    """
+    明細をチャンク単位で読み込み、前処理・法人取引判定・集計を行って結果を書き出します。
+
+    全データをメモリに保持しないため、使用メモリはチャンクサイズと取引先の種類数で決まります。
+    concatenated.csv と foreign.csv は外部ソートで書き出すため、行順を含めて通常の処理と同じ結果になります。
+    読み込み中にエラーが発生したファイルは、通常の処理と同様にファイル全体をスキップします。
+
+    Args:
+        data_dir (str): CSVファイルが格納されているディレクトリパス
+        merchants_df (pd.DataFrame): 法人取引マスターデータ
+        result_dir (str): 結果を出力するディレクトリパス
+        chunk_size (int): 1回に読み込む行数
+        cache (ClassificationCache): 分類キャッシュ
+        period (tuple): 分析対象期間 (開始日, 終了日)。None の場合は期間を限定しない。
+            省略した場合は config.py の設定から求める
+        profiler (RunProfiler): 段階ごとの計測結果の記録先。チャンクごとの計測は段階ごとに合計される
+        rollups (Iterable[str]): 期間ごとの集計の単位（"month", "week"）
+
+    Returns:
+        bool: 結果を書き出した場合は True、処理対象のデータがなかった場合は False
+    """
+    period = resolve_period(period)
+    profiler = profiler or RunProfiler()
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith(".csv"))
+    print(f"処理対象ファイル: {files}")
+
+    if not files:
+        print(f"警告: {data_dir}ディレクトリにCSVファイルが見つかりません。")
+        return False
+
+    files = _skip_files_outside_period(data_dir, files, period)
+
+    # 書き出さない結果は、ご利用日順の並べ替えや集計も行わない
+    writer = result_writer(result_dir, ["csv"])
+    sorted_outputs = [
+        (name, column)
+        for name, column in (("concatenated", None), ("foreign", "現地通貨建て金額"))
+        if writer.requested(name)
+    ]
+    rollups = [rollup for rollup in rollups if writer.requested(f"rollup_{rollup}")]
+    aggregate = rollups or writer.requested("grouped") or writer.requested("corporate_summary")
+    # 為替レート表がある場合は、チャンクごとに参照レートと照合して通貨ごとに合計する
+    # （照合結果の列は foreign.csv にだけ書き出す）
+    fx_rates = load_fx_rates() if writer.requested("foreign") or writer.requested("foreign_summary") else None
+    summarize_foreign = fx_rates is not None and writer.requested("foreign_summary")
+    # 近似集計はファイルごとに作り、読み込みに成功したファイルの分だけを結合する
+    sketches = MerchantSketches(SKETCH_CAPACITY, HLL_PRECISION) if _sketches_requested(writer) else None
+
+    runs = SortedRunWriter("ご利用日", directory=result_dir, date_format=CSV_DATE_FORMAT)
+    try:
+        loaded_rows = 0
+        states = []
+        foreign_totals = []
+        deduplicator = (
+            load_deduplicator(INGEST_CACHE_DIR, data_dir, period, "streaming") if DEDUPLICATE_TRANSACTIONS else None
+        )
+        for file in files:
+            checkpoint = runs.checkpoint()
+            file_rows = 0
+            file_states = []
+            file_totals = []
+            file_sketches = None if sketches is None else MerchantSketches(SKETCH_CAPACITY, HLL_PRECISION)
+            if deduplicator is not None:
+                deduplicator.begin(file, file_signature(os.path.join(data_dir, file)))
+            try:
+                reader = read_transaction_csv(os.path.join(data_dir, file), chunksize=chunk_size)
+                while True:
+                    chunk = profiler.measure("load", next, reader, None)
+                    if chunk is None:
+                        break
+                    if chunk.empty:
+                        continue
+                    file_rows += len(chunk)
+                    chunk = profiler.measure("preprocess", preprocess_transaction_data, chunk, period)
+                    if deduplicator is not None:
+                        chunk = profiler.measure("deduplicate", deduplicator.filter, chunk)
+                    if COMPACT_DTYPES:
+                        chunk = profiler.measure("compact", compact_transaction_data, chunk)
+                    chunk = profiler.measure(
+                        "classify", identify_corporate_transactions, chunk, merchants_df, cache
+                    )
+                    if file_sketches is not None:
+                        profiler.measure("sketch", file_sketches.update, chunk)
+                    row_width = len(chunk.columns)
+                    if fx_rates is not None:
+                        chunk = profiler.measure("fx_rates", fx_rates.annotate, chunk, FX_RATE_MAX_AGE_DAYS)
+                        if summarize_foreign:
+                            file_totals = [merge_totals(file_totals + [currency_totals(chunk)])]
+                    if sorted_outputs:
+                        profiler.measure("sort_runs", runs.add, chunk)
+                    if aggregate:
+                        # 途中結果は取引内容・カテゴリ・期間の単位にまとめてから保持する
+                        # （海外取引の行は外部ソートで書き出すため保持しない）
+                        state = profiler.measure(
+                            "aggregate", AggregateState.from_frame, chunk, rollups, keep_foreign=False
+                        )
+                        file_states = [AggregateState.merge(file_states + [state])]
+            except Exception as e:
+                print(f"警告: ファイル {file} の読み込み中にエラーが発生しました: {e}")
+                runs.rollback(checkpoint)
+                if deduplicator is not None:
+                    deduplicator.rollback()
+                continue
+
+            if deduplicator is not None:
+                deduplicator.commit()
+            loaded_rows += file_rows
+            states = [AggregateState.merge(states + file_states)] if file_states else states
+            foreign_totals = [merge_totals(foreign_totals + file_totals)] if file_totals else foreign_totals
+            if sketches is not None:
+                sketches.merge(file_sketches)
+
+        if deduplicator is not None:
+            deduplicator.save()
+            deduplicator.report()
+        if loaded_rows == 0:
+            print("警告: 有効なCSVファイルが読み込めませんでした。")
+            return False
+
+        if sorted_outputs:
+            # 照合結果の列を加えている場合、concatenated.csv には元の列だけを書き出す
+            outputs = [(name, column, None if name == "foreign" else row_width) for name, column in sorted_outputs]
+            profiler.measure("write_sorted_outputs", runs.merge, outputs, writer.open_csv)
+    finally:
+        runs.close()
+
+    if aggregate:
+        state = states[0]
+        if writer.requested("grouped"):
+            profiler.measure("write_grouped", writer.write, "grouped", state.transaction_frequency(TOP_MERCHANTS))
+        if writer.requested("corporate_summary"):
+            profiler.measure(
+                "write_corporate_summary", writer.write, "corporate_summary", state.corporate_summary()
+            )
+        for rollup in rollups:
+            profiler.measure(f"write_rollup_{rollup}", writer.write, f"rollup_{rollup}", state.rollup(rollup))
+    if summarize_foreign:
+        profiler.measure(
+            "write_foreign_summary", writer.write, "foreign_summary", currency_summary(foreign_totals[0])
+        )
+    if sketches is not None:
+        _write_sketches(writer, sketches, profiler)
+    writer.close()
+    return True
+
+
+def aggregate_state_settings(data_dir, merchants_df, period):
+    """
+    集計状態の前提（変わった場合はすべてのファイルを集計し直す設定）を返します。
+    """
+    normalizer = merchant_normalizer()
+    return {
+        "data_dir": os.path.abspath(data_dir),
+        "period": None if period is None else [period[0].isoformat(), period[1].isoformat()],
+        "master": None if merchants_df is None else master_hash(master_rule_keys(merchants_df)),
+        "normalization": None if normalizer is None else normalizer.signature,
+    }
+
+
+def _aggregate_files(store, data_dir, files, merchants_df, cache, period):
+    """
+    明細CSVをファイルごとに読み込み・前処理・法人取引判定して集計し、集計状態に加えます。
+    """
+    results = _read_transaction_files(data_dir, files, LOAD_WORKERS, True, period)
+    for file, (df, error) in zip(files, results):
+        if error is not None:
+            # 記録しないため、次回の実行で読み込み直す
+            print(f"警告: ファイル {file} の読み込み中にエラーが発生しました: {error}")
+            continue
+        state = None
+        if store.deduplicator is not None and not df.empty:
+            store.deduplicator.begin(file)
+            df = store.deduplicator.filter(df)
+            store.deduplicator.commit()
+        if not df.empty:
+            if COMPACT_DTYPES:
+                df = compact_transaction_data(df)
+            df = identify_corporate_transactions(df, merchants_df, cache)
+            state = AggregateState.from_frame(df, ROLLUP_PERIODS, keep_foreign=False)
+        store.add(file, state)
+
+
+def update_aggregate_state(data_dir, merchants_df, cache, period, verify=False):
+    """
+    AGGREGATE_STATE_PATH に保存した集計状態を、追加・変更・削除された明細CSVの分だけ更新します。
+
+    Args:
+        data_dir (str): 明細CSVが格納されているディレクトリ
+        merchants_df (pd.DataFrame): 取引先マスターデータ
+        cache (ClassificationCache): 法人取引判定キャッシュ（None の場合は使わない）
+        period (tuple): 分析対象期間 (開始日, 終了日)。None の場合は期間を限定しない
+        verify (bool): True の場合は全体を集計し直した結果と照合し、異なる場合は集計し直した結果で置き換える
+
+    Returns:
+        AggregateState: 全ファイルの集計結果（海外取引の行は保持しない）。集計する行がない場合は None
+    """
+    settings = aggregate_state_settings(data_dir, merchants_df, period)
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith(".csv"))
+    store = AggregateStore.load(AGGREGATE_STATE_PATH, settings, ROLLUP_PERIODS, DEDUPLICATE_TRANSACTIONS)
+    _aggregate_files(store, data_dir, store.refresh(data_dir, files), merchants_df, cache, period)
+    store.report()
+
+    if verify:
+        rebuilt = AggregateStore(AGGREGATE_STATE_PATH, settings, ROLLUP_PERIODS, DEDUPLICATE_TRANSACTIONS)
+        _aggregate_files(rebuilt, data_dir, rebuilt.refresh(data_dir, files), merchants_df, cache, period)
+        if same_results(store.result(), rebuilt.result()):
+            print("集計状態の検証: 全体を集計し直した結果と一致しました。")
+        else:
+            print("警告: 集計状態が全体を集計し直した結果と一致しません。集計し直した結果で置き換えます。")
+            store = rebuilt
+    store.save()
+    return store.result()
+
+
+def main(
+    data_dir=None,
+    merchant_config=None,
+    result_dir=None,
+    target_year=None,
+    mode_test=None,
+    profile_stage=None,
+    profile_mode=None,
+    partitions=None,
+):
     """
     メインの処理フローを制御します。
     データの準備、前処理、そして各種分析を順番に実行します。
+
+    引数を省略した場合は config.py の設定値を使用します。
+
+    Args:
+        data_dir (str): 明細CSVが格納されているディレクトリ
+        merchant_config (str): 取引先マスターデータのパス
+        result_dir (str): 結果を出力するディレクトリ
+        target_year (str): 分析対象年（空文字列の場合はすべての年）
+        mode_test (bool): テストモードで実行するかどうか。data_dir / merchant_config を
+            省略した場合は、モードに応じた既定のパスを使用する
+        profile_stage (str): cProfile / tracemalloc で詳しく調べる段階の名前
+        profile_mode (str): "cprofile" または "tracemalloc"
+        partitions (list or dict): 複数期間の一括分析の期間（partition_periods を参照）。
+            指定した場合は target_year の代わりに、期間ごとの結果を result_dir のサブディレクトリに書き出す
+
+    Returns:
+        int: 終了コード（正常終了の場合は 0）
     """
+    if mode_test is None:
+        mode_test = MODE_TEST
+    default_data_dir, default_merchant_config = default_paths(mode_test)
+    data_dir = data_dir or default_data_dir
+    merchant_config = merchant_config or default_merchant_config
+    result_dir = result_dir or RESULT_DIR
+    profiler = RunProfiler(
+        profile_stage or PROFILE_STAGE, profile_mode or PROFILE_MODE, profile_dir=result_dir
+    )
+
+    print_mode(mode_test)
+    # 本番モードの場合、必要なディレクトリとファイルの存在チェック
+    if not mode_test and not check_production_environment(data_dir, merchant_config):
+        return 1
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(result_dir, exist_ok=True)
+
     # データの準備
-    merchants_df = load_merchant_config()
-    df = load_transaction_data(DATA_DIR)
+    cache = None
+    if CLASSIFICATION_CACHE_PATH:
+        cache = ClassificationCache.load(
+            CLASSIFICATION_CACHE_PATH, CLASSIFICATION_CACHE_MAX_ENTRIES, merchant_normalizer()
+        )
+    merchants_df = profiler.measure("load_merchant_config", load_merchant_config, cache, merchant_config)
+    partitions = partition_periods(PARTITIONS if partitions is None else partitions)
+    if partitions:
+        # 全期間を含む範囲を1回だけ読み込み、期間ごとに切り出す
+        period = (min(p[0] for _, p in partitions), max(p[1] for _, p in partitions))
+        metadata = {"partitions": [name for name, _ in partitions]}
+    else:
+        period = analysis_period(target_year)
+        metadata = {"target_year": TARGET_YEAR if target_year is None else target_year}
+    if period is not None:
+        metadata["period"] = [period[0].isoformat(), period[1].isoformat()]
 
-    if df.empty:
-        print("エラー: 処理対象のデータがありません。処理を中止します。")
-        return
+    if STREAMING and partitions:
+        print("警告: ストリーミングモードでは複数期間の一括分析は使用できません。")
+        return 1
+    if STREAMING:
+        # 明細をチャンク単位で処理し、結果を直接ファイルに書き出す（CSV のみ）
+        if list(OUTPUT_FORMATS) != ["csv"]:
+            print("警告: ストリーミングモードでは CSV 以外の出力形式は使用できません。CSV で出力します。")
+        processed = stream_transaction_analysis(
+            data_dir,
+            merchants_df,
+            result_dir,
+            STREAMING_CHUNK_SIZE,
+            cache,
+            period,
+            profiler,
+            ROLLUP_PERIODS,
+        )
+        _save_classification_cache(cache)
+        if not processed:
+            print("エラー: 処理対象のデータがありません。処理を中止します。")
+            return 1
+        _save_run_report(profiler, result_dir, {"streaming": True, **metadata})
+        print(f"処理が完了しました。結果は {result_dir} ディレクトリに保存されています。")
+        return 0
 
-    # データの前処理
-    df = preprocess_transaction_data(df)
-    df = identify_corporate_transactions(df, merchants_df)
+    state = None
+    if AGGREGATE_STATE_PATH and (TRANSACTION_STORE_PATH or partitions):
+        print("警告: 取引データストアや複数期間の一括分析では、集計状態の保存（AGGREGATE_STATE_PATH）は使用できません。")
+    elif AGGREGATE_STATE_PATH:
+        # 追加・変更・削除された明細CSVの分だけ集計状態を更新する
+        state = profiler.measure(
+            "aggregate_state",
+            update_aggregate_state,
+            data_dir,
+            merchants_df,
+            cache,
+            period,
+            AGGREGATE_STATE_VERIFY,
+        )
+        if state is None:
+            _save_classification_cache(cache)
+            print("エラー: 処理対象のデータがありません。処理を中止します。")
+            return 1
 
-    # 基本データの保存
-    df.to_csv(os.path.join(RESULT_DIR, "concatenated.csv"), index=False)
+    df = None
+    if TRANSACTION_STORE_PATH:
+        # 新しい明細だけをデータベースに取り込み、集計はデータベース上で行う。取引の行は、行を書き出す場合と
+        # 複数期間の一括分析の場合だけ法人取引判定済みの状態で読み出す
+        store = TransactionStore(TRANSACTION_STORE_PATH, DEDUPLICATE_TRANSACTIONS)
+        try:
+            profiler.measure("import", import_transaction_files, store, data_dir, LOAD_WORKERS)
+            profiler.measure(
+                "classify",
+                store.classify,
+                merchants_df,
+                partial(identify_corporate_transactions, merchants_df=merchants_df, cache=cache),
+                merchant_normalizer(),
+            )
+            if not partitions:
+                state = profiler.measure("aggregate", store.aggregate, period, ROLLUP_PERIODS)
+            if partitions or _row_outputs_requested():
+                df = profiler.measure("load", store.query, period)
+        finally:
+            store.close()
+        preprocessed = classified = True
+    elif state is None or _row_outputs_requested():
+        ingest_cache = None
+        if INGEST_CACHE_DIR:
+            ingest_cache = IngestCache(INGEST_CACHE_DIR, rebuild=INGEST_CACHE_REBUILD)
+        # 並列読み込みや取込キャッシュを使う場合は、前処理もファイルごとに読み込み時に行う
+        preprocessed = LOAD_WORKERS > 1 or ingest_cache is not None
+        classified = False
+        df = profiler.measure(
+            "load",
+            load_transaction_data,
+            data_dir,
+            LOAD_WORKERS,
+            preprocess=preprocessed,
+            ingest_cache=ingest_cache,
+            period=period,
+        )
 
-    # 取引先ごとに group by して集計
-    transaction_frequency = analyze_transaction_frequency(df)
-    transaction_frequency.to_csv(os.path.join(RESULT_DIR, "grouped.csv"))
+    if df is None:
+        # 取引の行を書き出さない場合は、明細の行を読み込まずに集計結果から結果を書き出す
+        _save_classification_cache(cache)
+        if state.base.empty:
+            print("エラー: 処理対象のデータがありません。処理を中止します。")
+            return 1
+        write_analysis_results(None, result_dir, metadata, profiler, state)
+        _save_run_report(profiler, result_dir, metadata)
+        print(f"処理が完了しました。結果は {result_dir} ディレクトリに保存されています。")
+        return 0
 
-    # 法人取引の集計
-    corporate_analysis = analyze_corporate_transactions(df)
-    corporate_analysis.to_csv(os.path.join(RESULT_DIR, "corporate_summary.csv"))
+    if df.empty:
+        print("エラー: 処理対象のデータがありません。処理を中止します。")
+        return 1
+
+    # データの前処理
+    if not preprocessed:
+        df = profiler.measure("preprocess", preprocess_transaction_data, df, period)
+    if COMPACT_DTYPES:
+        df = profiler.measure("compact", compact_transaction_data, df)
+    if not classified:
+        df = profiler.measure("classify", identify_corporate_transactions, df, merchants_df, cache)
+    _save_classification_cache(cache)
 
-    # 海外取引の抽出
-    foreign_transactions = get_foreign_transactions(df)
-    foreign_transactions.to_csv(os.path.join(RESULT_DIR, "foreign.csv"), index=False)
+    if partitions:
+        profiler.measure(
+            "partitions",
+            analyze_partitions,
+            df,
+            partitions,
+            result_dir,
+            metadata,
+            PARTITION_WORKERS,
+            profile_stage or PROFILE_STAGE,
+            profile_mode,
+        )
+    else:
+        if state is not None:
+            state = AggregateState(state.base, state.periods, get_foreign_transactions(df))
+        write_analysis_results(df, result_dir, metadata, profiler, state)
+    _save_run_report(profiler, result_dir, metadata)
 
-    print(f"処理が完了しました。結果は {RESULT_DIR} ディレクトリに保存されています。")
+    print(f"処理が完了しました。結果は {result_dir} ディレクトリに保存されています。")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+法人取引判定用のマルチパターンマッチャー
+
+merchants.csv の merchant_name を Aho-Corasick オートマトンにまとめ、
+取引内容を1回走査するだけで一致するルールを求めます。
+完全一致のルール（match_type が "exact"）は辞書で引くため、部分一致の走査は部分一致のルールだけで行います。
+取引内容とルールの両方を同じ方法で正規化してから照合することもできます。
+"""
+
+import re
+import unicodedata
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# 一致するルールがない場合の戻り値
+NO_MATCH = -1
+
+# マスターデータの match_type 列の値。列がない場合や空欄の場合は部分一致
+MATCH_CONTAINS = "contains"
+MATCH_EXACT = "exact"
+
+
+class MerchantNormalizer:
+    """
+    取引内容とルールの表記の揺れをそろえる正規化
+
+    NFKC 正規化（全角英数字・半角カナなどの統一）、大文字・小文字の統一（casefold）、
+    指定した正規表現に一致する部分の削除、連続する空白の1つの空白への置き換えをこの順に行います。
+    """
+
+    def __init__(self, strip_patterns=()):
+        """
+        Args:
+            strip_patterns (Iterable[str]): 正規化の後に取り除く正規表現（末尾の店舗番号など）
+        """
+        self.strip_patterns = tuple(strip_patterns)
+        self._strip = [re.compile(pattern) for pattern in self.strip_patterns]
+
+    def __call__(self, text):
+        text = unicodedata.normalize("NFKC", text).casefold()
+        for pattern in self._strip:
+            text = pattern.sub("", text)
+        return " ".join(text.split())
+
+    @property
+    def signature(self):
+        """
+        正規化の設定を表す文字列（キャッシュの判定結果が同じ設定で作られたかの確認に使う）
+        """
+        return "NFKC,casefold," + ",".join(self.strip_patterns)
+
+
+class MerchantMatcher:
+    """
+    取引先マスターデータの merchant_name から構築する部分一致マッチャー
+
+    複数のルールが一致する場合は、マスターデータ上で先に定義されたルールを優先します。
+    これは従来の iterrows による「ファイル順で最初に一致したルールを採用する」判定と同じ結果です。
+    """
+
+    def __init__(self, patterns, match_types=None, normalizer=None):
+        """
+        Args:
+            patterns (Iterable[str]): ルール順に並んだ merchant_name。欠損値のルールは一致しません。
+                正規化する場合、正規化すると空文字列になるルール（すべての取引内容に一致してしまう）も一致しません
+                （番号を empty_rules に記録します）
+            match_types (Iterable[str]): ルールごとの照合方法（"exact" または "contains"）。
+                None の場合はすべて部分一致
+            normalizer (MerchantNormalizer): ルールと取引内容の正規化（None の場合は正規化しない）
+        """
+        # ノードごとの遷移表、失敗リンク、そのノードで一致する最小のルール番号
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [NO_MATCH]
+        # 正規化した取引内容 -> 完全一致のルールのうち最小のルール番号
+        self._exact = {}
+        # 部分一致のルールのうち最小のルール番号（完全一致の結果がこれより小さければ走査を省略できる）
+        self._first_contains = None
+        self.normalizer = normalizer
+        self.pattern_count = 0
+        self.empty_rules = []
+
+        patterns = list(patterns)
+        if match_types is None:
+            match_types = [MATCH_CONTAINS] * len(patterns)
+        for index, (pattern, match_type) in enumerate(zip(patterns, match_types)):
+            self.pattern_count += 1
+            if pattern is None or (not isinstance(pattern, str) and pd.isna(pattern)):
+                continue
+            pattern = str(pattern)
+            if normalizer is not None:
+                pattern = normalizer(pattern)
+                if not pattern:
+                    self.empty_rules.append(index)
+                    continue
+            if match_type == MATCH_EXACT:
+                self._exact.setdefault(pattern, index)
+            else:
+                if self._first_contains is None:
+                    self._first_contains = index
+                self._add(pattern, index)
+        self._build_fail_links()
+
+    def _add(self, pattern, index):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(NO_MATCH)
+                self._goto[node][char] = next_node
+            node = next_node
+        # 同じ文字列のルールが複数ある場合は先のものを残す
+        if self._best[node] == NO_MATCH:
+            self._best[node] = index
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_target = self._goto[fail].get(char, 0)
+                self._fail[child] = fail_target if fail_target != child else 0
+                # 失敗リンク先で一致するルールもこのノードで一致する
+                self._best[child] = _min_rule(self._best[child], self._best[self._fail[child]])
+                queue.append(child)
+
+    def find_first(self, text):
+        """
+        テキストに含まれるルールのうち、最も先に定義されたルールの番号を返します。
+
+        Args:
+            text (str): 取引内容（ご利用内容）
+
+        Returns:
+            int: ルール番号。一致するルールがない場合は NO_MATCH
+        """
+        if not isinstance(text, str):
+            return NO_MATCH
+        if self.normalizer is not None:
+            text = self.normalizer(text)
+
+        best = _min_rule(self._exact.get(text, NO_MATCH), self._best[0])
+        if best != NO_MATCH and (self._first_contains is None or best <= self._first_contains):
+            # 完全一致したルールより先に部分一致のルールがないため、走査は不要
+            return best
+        if self._first_contains is None:
+            return best
+
+        goto = self._goto
+        fail = self._fail
+        best_table = self._best
+
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            candidate = best_table[node]
+            if candidate != NO_MATCH and (best == NO_MATCH or candidate < best):
+                best = candidate
+                if best == 0:
+                    break
+        return best
+
+    def match_all(self, texts):
+        """
+        複数のテキストに対して find_first を適用します。
+
+        Args:
+            texts (Iterable[str]): 取引内容
+
+        Returns:
+            np.ndarray: テキストごとのルール番号（一致なしは NO_MATCH）
+        """
+        return np.fromiter((self.find_first(text) for text in texts), dtype=np.int64)
+
+
+def build_matcher(merchants_df, normalizer=None):
+    """
+    マスターデータからマッチャーを構築します。match_type 列があれば完全一致のルールを区別します。
+    正規化する場合、正規化すると空文字列になるルールは使わずに警告を表示します。
+
+    Args:
+        merchants_df (pd.DataFrame): 法人取引マスターデータ
+        normalizer (MerchantNormalizer): ルールと取引内容の正規化
+
+    Returns:
+        MerchantMatcher: マッチャー
+    """
+    matcher = MerchantMatcher(merchants_df["merchant_name"], match_types(merchants_df), normalizer)
+    if matcher.empty_rules:
+        names = merchants_df["merchant_name"].iloc[matcher.empty_rules].tolist()
+        print(f"警告: 正規化すると空になる merchant_name のルールは使用しません: {names}")
+    return matcher
+
+
+def match_types(merchants_df):
+    """
+    マスターデータのルールごとの照合方法を返します（match_type 列がない場合はすべて部分一致）。
+    """
+    if "match_type" not in merchants_df.columns:
+        return [MATCH_CONTAINS] * len(merchants_df)
+    return [
+        MATCH_EXACT if str(value).strip().lower() == MATCH_EXACT else MATCH_CONTAINS
+        for value in merchants_df["match_type"]
+    ]
+
+
+def _min_rule(a, b):
+    if a == NO_MATCH:
+        return b
+    if b == NO_MATCH:
+        return a
+    return min(a, b)
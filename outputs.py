@@ -0,0 +1,312 @@
+"""
+分析結果の書き出し
+
+CSV に加えて、型情報を保持する列指向形式（Parquet / Feather）での書き出しに対応します。
+取引明細（concatenated, foreign）は concatenated.parquet/year=2024/month=01/part-0.parquet のように
+年・月ごとのディレクトリに分割して書き出すため、利用側は必要な月のファイルだけを読み込めます。
+
+結果ファイルは一時ファイル（<ファイル名>.tmp）に書き出してから置き換えるため、書き出しの途中で
+読み込まれても、前回の結果か今回の結果のどちらかが読み込まれます。CSV は gzip / zstd で圧縮でき、
+複数の結果ファイルをスレッドで並列に書き出すこともできます。
+"""
+
+import gzip
+import io
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+COLUMNAR_FORMATS = ("parquet", "feather")
+SUPPORTED_FORMATS = ("csv",) + COLUMNAR_FORMATS
+
+# CSV の圧縮方法と、ファイル名に付ける拡張子
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+# 圧縮レベル（書き出しの速さを優先し、それぞれの既定値にしている）
+COMPRESSION_LEVELS = {"gzip": 6, "zstd": 3}
+
+# CSV に書き出すご利用日の形式（明細CSVと同じ形式）
+CSV_DATE_FORMAT = "%Y/%m/%d"
+
+# 列指向形式で書き出した場合のスキーマ・メタデータファイル
+METADATA_NAME = "_metadata.json"
+
+
+class ResultWriter:
+    """
+    分析結果を指定された形式で書き出します。
+    """
+
+    def __init__(self, result_dir, formats=("csv",), metadata=None, compression=None, workers=1, outputs=None):
+        """
+        Args:
+            result_dir (str): 結果を出力するディレクトリ
+            formats (Iterable[str]): 出力形式（"csv", "parquet", "feather"）
+            metadata (dict): メタデータファイルに追加で記録する情報
+            compression (str): CSV の圧縮方法（None, "gzip", "zstd"）
+            workers (int): 2以上の場合は、結果ファイルをスレッドで並列に書き出す（close() で完了を待つ）
+            outputs (Iterable[str]): 書き出す出力名。None の場合はすべて書き出す
+        """
+        self.result_dir = result_dir
+        self.formats = resolve_formats(formats)
+        self.metadata = dict(metadata or {})
+        self.compression = resolve_compression(compression)
+        self.requested_outputs = None if outputs is None else set(outputs)
+        self.outputs = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self._pending = []
+
+    def requested(self, name):
+        """
+        出力名 name の結果を書き出すかどうかを返します。
+        """
+        return self.requested_outputs is None or name in self.requested_outputs
+
+    def csv_path(self, name):
+        """
+        出力名 name の CSV ファイルのパスを返します（圧縮する場合は .csv.gz / .csv.zst）。
+        """
+        return os.path.join(self.result_dir, f"{name}.csv{COMPRESSION_SUFFIXES[self.compression]}")
+
+    def open_csv(self, name):
+        """
+        出力名 name の CSV ファイルを、一時ファイル経由で書き出すテキストファイルとして開きます（圧縮の設定に従う）。
+        """
+        path = self.csv_path(name)
+        remove_stale_csv(path, name)
+        return open_text(path, self.compression)
+
+    def write(self, name, df, index=True, partitioned=False):
+        """
+        1つの分析結果を書き出します。書き出さない出力名の場合は何もしません。
+
+        Args:
+            name (str): 出力名（拡張子なしのファイル名）
+            df (pd.DataFrame): 分析結果
+            index (bool): インデックスを書き出すかどうか
+            partitioned (bool): 列指向形式の場合に、ご利用日の年・月ごとに分割して書き出すかどうか
+        """
+        if not self.requested(name):
+            return
+        if self._executor is None:
+            self._record(name, df, index, partitioned, self._write(name, df, index, partitioned))
+        else:
+            future = self._executor.submit(self._write, name, df, index, partitioned)
+            self._pending.append((name, df, index, partitioned, future))
+
+    def _write(self, name, df, index, partitioned):
+        files = {}
+        for fmt in self.formats:
+            if fmt == "csv":
+                path = self.csv_path(name)
+                remove_stale_csv(path, name)
+                with atomic_path(path) as tmp_path:
+                    df.to_csv(
+                        tmp_path,
+                        index=index,
+                        date_format=CSV_DATE_FORMAT,
+                        compression=_pandas_compression(self.compression),
+                    )
+                files[fmt] = [os.path.basename(path)]
+            elif partitioned:
+                files[fmt] = self._write_partitioned(name, df, fmt)
+            else:
+                path = f"{name}.{fmt}"
+                with atomic_path(os.path.join(self.result_dir, path)) as tmp_path:
+                    _write_table(df.reset_index() if index else df, tmp_path, fmt)
+                files[fmt] = [path]
+        return files
+
+    def _record(self, name, df, index, partitioned, files):
+        if self.columnar:
+            self.outputs[name] = {
+                "rows": len(df),
+                "index": [level for level in df.index.names if level is not None] if index else [],
+                "columns": {column: str(dtype) for column, dtype in df.dtypes.items()},
+                "partitioning": ["year", "month"] if partitioned else [],
+                "files": files,
+            }
+
+    @property
+    def columnar(self):
+        return any(fmt in COLUMNAR_FORMATS for fmt in self.formats)
+
+    def _write_partitioned(self, name, df, fmt):
+        root = os.path.join(self.result_dir, f"{name}.{fmt}")
+        # 一時ディレクトリにすべての月を書き出してから置き換える（前回の実行で書き出した月は残らない）
+        tmp_root = f"{root}.tmp"
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        os.makedirs(tmp_root)
+
+        year, month = partition_keys(df["ご利用日"])
+        paths = []
+        try:
+            # 明細のインデックスは重複するため、配列で分割する
+            for (y, m), part in df.groupby([year.to_numpy(), month.to_numpy()], sort=True):
+                directory = os.path.join(f"year={y}", f"month={m}")
+                os.makedirs(os.path.join(tmp_root, directory))
+                _write_table(part, os.path.join(tmp_root, directory, f"part-0.{fmt}"), fmt)
+                paths.append(os.path.join(f"{name}.{fmt}", directory, f"part-0.{fmt}"))
+        except BaseException:
+            shutil.rmtree(tmp_root, ignore_errors=True)
+            raise
+        replace_directory(tmp_root, root)
+        return [path.replace(os.sep, "/") for path in paths]
+
+    def close(self):
+        """
+        並列に書き出している結果ファイルの完了を待ちます。列指向形式で書き出した場合は、
+        スキーマとメタデータをファイルに書き出します。
+        """
+        if self._executor is not None:
+            try:
+                for name, df, index, partitioned, future in self._pending:
+                    self._record(name, df, index, partitioned, future.result())
+            finally:
+                self._pending = []
+                self._executor.shutdown()
+        if not self.columnar:
+            return
+        metadata = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "formats": list(self.formats),
+            **self.metadata,
+            "outputs": self.outputs,
+        }
+        with open_text(os.path.join(self.result_dir, METADATA_NAME)) as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+
+def resolve_formats(formats):
+    """
+    出力形式を検証し、列指向形式が使えない環境では CSV に置き換えます。
+    """
+    resolved = []
+    for fmt in formats:
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f"未対応の出力形式です: {fmt}")
+        if fmt in COLUMNAR_FORMATS and not PYARROW_AVAILABLE:
+            print(f"警告: pyarrow がインストールされていないため、{fmt} 形式の代わりに CSV で出力します。")
+            fmt = "csv"
+        if fmt not in resolved:
+            resolved.append(fmt)
+    return resolved
+
+
+def resolve_compression(compression):
+    """
+    CSV の圧縮方法を検証し、zstandard がない環境では zstd を gzip に置き換えます。
+    """
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"未対応の圧縮方法です: {compression}")
+    if compression == "zstd" and not ZSTD_AVAILABLE:
+        print("警告: zstandard がインストールされていないため、zstd の代わりに gzip で圧縮します。")
+        return "gzip"
+    return compression
+
+
+def remove_stale_csv(path, name):
+    """
+    圧縮方法を変えた場合に、前回の実行で書き出した同じ結果の別の拡張子のファイルを削除します。
+    """
+    directory = os.path.dirname(path)
+    for suffix in COMPRESSION_SUFFIXES.values():
+        stale = os.path.join(directory, f"{name}.csv{suffix}")
+        if stale != path and os.path.exists(stale):
+            os.remove(stale)
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    一時ファイルのパス（<path>.tmp）を返し、with ブロックが正常に終了した場合だけ path に置き換えます。
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def open_text(path, compression=None, encoding="utf-8"):
+    """
+    path に一時ファイル経由で書き出すテキストファイルを開きます（改行は変換しない）。
+
+    Args:
+        path (str): 書き出すファイルのパス
+        compression (str): 圧縮方法（None, "gzip", "zstd"）
+        encoding (str): 文字コード
+    """
+    with atomic_path(path) as tmp_path:
+        if compression == "gzip":
+            # 同じ内容なら同じファイルになるよう、gzip のヘッダーに更新日時を記録しない
+            raw = gzip.GzipFile(tmp_path, "wb", compresslevel=COMPRESSION_LEVELS["gzip"], mtime=0)
+        elif compression == "zstd":
+            raw = zstandard.open(
+                tmp_path, "wb", cctx=zstandard.ZstdCompressor(level=COMPRESSION_LEVELS["zstd"])
+            )
+        else:
+            raw = open(tmp_path, "wb")
+        with io.TextIOWrapper(raw, encoding=encoding, newline="") as f:
+            yield f
+
+
+def replace_directory(tmp_root, root):
+    """
+    書き出し済みの一時ディレクトリ tmp_root を root に置き換えます。
+    ディレクトリは中身があると1回の rename で置き換えられないため、古いディレクトリを退避してから入れ替えます。
+    """
+    old_root = f"{root}.old"
+    shutil.rmtree(old_root, ignore_errors=True)
+    if os.path.exists(root):
+        os.rename(root, old_root)
+    os.rename(tmp_root, root)
+    shutil.rmtree(old_root, ignore_errors=True)
+
+
+def _pandas_compression(compression):
+    if compression is None:
+        return None
+    if compression == "gzip":
+        return {"method": "gzip", "compresslevel": COMPRESSION_LEVELS["gzip"], "mtime": 0}
+    return {"method": "zstd", "level": COMPRESSION_LEVELS["zstd"]}
+
+
+def partition_keys(dates):
+    """
+    ご利用日から分割用の年・月（ゼロ埋めの文字列）を返します。日付として解釈できない行は "unknown" になります。
+    """
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format="%Y/%m/%d", errors="coerce")
+    year = dates.dt.year.astype("Int64").astype("string").fillna("unknown")
+    month = dates.dt.month.map("{:02.0f}".format, na_action="ignore").astype("string").fillna("unknown")
+    return year.rename("year"), month.rename("month")
+
+
+def _write_table(df, path, fmt):
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(path)
@@ -0,0 +1,371 @@
+"""
+問い合わせサービス
+
+明細を一度だけ読み込み・法人取引判定し、ご利用日・取引内容・カテゴリ・通貨・法人取引フラグの索引を作って、
+期間や条件を指定した集計に HTTP（JSON）で答えます。
+
+    python cli.py --serve
+    curl "http://127.0.0.1:8765/top_merchants?start=2024-07-01&end=2024-09-30&limit=5"
+
+問い合わせの結果は LRU キャッシュに保持し、同じ問い合わせにはキャッシュから答えます。
+データディレクトリと取引先マスターデータはウォッチモードと同じく監視し、変更があった場合は
+そのファイルだけを読み込み直して索引を作り直し、キャッシュを破棄します。
+既定ではこのコンピューターからの接続（127.0.0.1）だけを受け付けます。
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from aggregation import ROLLUP_FREQUENCIES, AggregateState
+from config import QUERY_CACHE_SIZE, QUERY_HOST, QUERY_PORT, WATCH_INTERVAL
+from outputs import CSV_DATE_FORMAT
+from watcher import StatementWatcher, resolve_arguments
+
+# 索引を作る条件の名前と列
+INDEXED_COLUMNS = {
+    "merchant": "ご利用内容",
+    "category": "merchant_category",
+    "currency": "通貨",
+    "is_corporate": "is_corporate",
+}
+
+# 問い合わせの名前ごとに、指定できる条件（start / end と索引の条件はすべての問い合わせで指定できる）
+QUERY_PARAMETERS = {
+    "top_merchants": ("limit", "sort"),
+    "category_totals": ("period",),
+    "corporate_summary": (),
+    "foreign_by_currency": (),
+    "transactions": ("limit",),
+}
+COMMON_PARAMETERS = ("start", "end") + tuple(INDEXED_COLUMNS)
+
+# 上位の取引先の並べ替えの基準
+SORT_COLUMNS = {"count": "回数", "amount": "合計金額"}
+
+_EMPTY = np.array([], dtype=np.intp)
+
+
+class TransactionIndex:
+    """
+    法人取引判定済みの取引データと、その索引
+    """
+
+    def __init__(self, df):
+        """
+        Args:
+            df (pd.DataFrame): 法人取引判定済みの取引データ
+        """
+        if not df["ご利用日"].is_monotonic_increasing:
+            df = df.sort_values("ご利用日", kind="stable")
+        self.df = df.reset_index(drop=True)
+        self.dates = self.df["ご利用日"]
+        # 値ごとの行番号（昇順）
+        self.indexes = {
+            name: self.df.groupby(column, observed=True, sort=False).indices
+            for name, column in INDEXED_COLUMNS.items()
+        }
+
+    def __len__(self):
+        return len(self.df)
+
+    def select(self, start=None, end=None, **conditions):
+        """
+        条件に一致する取引をご利用日順に返します。
+
+        期間はご利用日の二分探索で、その他の条件は索引で行番号を求めてから取り出すため、
+        全行を走査しません。
+
+        Args:
+            start (pd.Timestamp): 期間の開始日（含む。None の場合は限定しない）
+            end (pd.Timestamp): 期間の終了日（含む。None の場合は限定しない）
+            **conditions: 索引の条件（merchant, category, currency, is_corporate）。None の条件は使わない
+
+        Returns:
+            pd.DataFrame: 条件に一致する取引
+        """
+        low = 0 if start is None else self.dates.searchsorted(start, side="left")
+        high = len(self.df) if end is None else self.dates.searchsorted(end, side="right")
+        positions = None
+        for name, value in conditions.items():
+            if value is None:
+                continue
+            found = self.indexes[name].get(value, _EMPTY)
+            found = found[(found >= low) & (found < high)]
+            positions = found if positions is None else np.intersect1d(positions, found, assume_unique=True)
+        if positions is None:
+            return self.df.iloc[low:high]
+        return self.df.iloc[positions]
+
+
+class QueryService:
+    """
+    取引データの索引に対する問い合わせに答えます。問い合わせの結果は LRU キャッシュに保持します。
+    """
+
+    def __init__(self, cache_size=256):
+        """
+        Args:
+            cache_size (int): 保持する問い合わせ結果の件数
+        """
+        self.cache_size = cache_size
+        self.index = None
+        self.updated_at = None
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, df):
+        """
+        取引データを置き換えて索引を作り直し、問い合わせ結果のキャッシュを破棄します。
+        """
+        index = TransactionIndex(df)
+        with self._lock:
+            self.index = index
+            self._cache.clear()
+            self.updated_at = datetime.now().isoformat(timespec="seconds")
+
+    def query(self, name, params):
+        """
+        問い合わせに答えます。
+
+        Args:
+            name (str): 問い合わせの名前（QUERY_PARAMETERS のキー、または "status"）
+            params (dict): 条件（値は文字列）
+
+        Returns:
+            dict: JSON に変換できる結果
+
+        Raises:
+            KeyError: 未対応の問い合わせの場合
+            ValueError: 条件が正しくない場合
+        """
+        if name == "status":
+            return self.status()
+        if name not in QUERY_PARAMETERS:
+            raise KeyError(name)
+        unknown = sorted(set(params) - set(COMMON_PARAMETERS + QUERY_PARAMETERS[name]))
+        if unknown:
+            raise ValueError(f"未対応の条件です: {unknown}")
+
+        key = (name, tuple(sorted(params.items())))
+        with self._lock:
+            index = self.index
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        if index is None:
+            raise ValueError("取引データを読み込んでいません")
+
+        result = {"query": name, "params": params, "rows": getattr(self, f"_{name}")(index, params)}
+        with self._lock:
+            # 問い合わせ中にデータが更新された場合は、古いデータの結果をキャッシュしない
+            if index is self.index:
+                self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def status(self):
+        with self._lock:
+            return {
+                "rows": 0 if self.index is None else len(self.index),
+                "updated_at": self.updated_at,
+                "cache": {"entries": len(self._cache), "hits": self.hits, "misses": self.misses},
+            }
+
+    def _top_merchants(self, index, params):
+        """
+        期間内の取引先ごとの回数・合計金額の上位（grouped.csv と同じ列）
+        """
+        sort = params.get("sort", "count")
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"sort には {list(SORT_COLUMNS)} のいずれかを指定してください: {sort}")
+        grouped = _aggregate(index, params).transaction_frequency(_limit(params, 10), SORT_COLUMNS[sort])
+        return _records(grouped.reset_index())
+
+    def _category_totals(self, index, params):
+        """
+        月（または週）× カテゴリごとの回数・合計金額
+        """
+        period = params.get("period", "month")
+        if period not in ROLLUP_FREQUENCIES:
+            raise ValueError(f"period には {list(ROLLUP_FREQUENCIES)} のいずれかを指定してください: {period}")
+        rollup = _aggregate(index, params, (period,)).rollup(period)
+        totals = rollup.groupby(level=[0, 2], observed=True, dropna=False, sort=True).sum()
+        return _records(totals.reset_index())
+
+    def _corporate_summary(self, index, params):
+        """
+        法人取引のカテゴリごとの取引回数・合計金額（corporate_summary.csv と同じ列）
+        """
+        return _records(_aggregate(index, params).corporate_summary().reset_index())
+
+    def _foreign_by_currency(self, index, params):
+        """
+        海外取引の通貨ごとの回数・円の合計金額・現地通貨建ての合計金額
+        """
+        foreign = _select(index, params)
+        foreign = foreign[foreign["現地通貨建て金額"].notnull()]
+        totals = foreign.groupby("通貨", observed=True, sort=True).agg(
+            回数=("金額", "size"), 合計金額=("金額", "sum"), 現地通貨建て金額=("現地通貨建て金額", "sum")
+        )
+        return _records(totals.reset_index())
+
+    def _transactions(self, index, params):
+        """
+        条件に一致する取引（concatenated.csv と同じ列。ご利用日順）
+        """
+        return _records(_select(index, params).head(_limit(params, 100)))
+
+
+def _select(index, params):
+    conditions = {name: params.get(name) for name in INDEXED_COLUMNS}
+    if conditions["is_corporate"] is not None:
+        conditions["is_corporate"] = _integer(conditions["is_corporate"], "is_corporate")
+    return index.select(_date(params.get("start")), _date(params.get("end")), **conditions)
+
+
+def _aggregate(index, params, periods=()):
+    return AggregateState.from_frame(_select(index, params), periods, keep_foreign=False)
+
+
+def _date(value):
+    if value is None:
+        return None
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise ValueError(f"日付として解釈できません: {value}") from None
+
+
+def _integer(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} には整数を指定してください: {value}") from None
+
+
+def _limit(params, default):
+    limit = _integer(params.get("limit", default), "limit")
+    if limit < 0:
+        raise ValueError(f"limit には0以上の整数を指定してください: {limit}")
+    return limit
+
+
+def _records(df):
+    """
+    集計結果を JSON に変換できるレコードのリストにします。日付は CSV と同じ形式、欠損値は null にします。
+    """
+    df = df.assign(
+        **{
+            column: df[column].dt.strftime(CSV_DATE_FORMAT)
+            for column in df.columns
+            if pd.api.types.is_datetime64_any_dtype(df[column])
+        }
+    )
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+
+class QueryWatcher(StatementWatcher):
+    """
+    データの変更を監視し、結果ファイルの代わりに問い合わせサービスの索引を更新します。
+    """
+
+    def __init__(self, service, data_dir, merchant_config, period, metadata=None):
+        super().__init__(data_dir, merchant_config, None, period, metadata)
+        self.service = service
+
+    def publish(self, df, state, profiler):
+        profiler.measure("index", self.service.update, df)
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /<問い合わせの名前>?<条件> に JSON で答えます。
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip("/")
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            status, body = 200, self.server.service.query(name, params)
+        except KeyError:
+            status, body = 404, {"error": f"未対応の問い合わせです: {name}", "queries": list(QUERY_PARAMETERS)}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_server(service, host=QUERY_HOST, port=QUERY_PORT):
+    """
+    問い合わせサービスの HTTP サーバーを作成します（port に 0 を指定すると空いているポートを使う）。
+    """
+    server = ThreadingHTTPServer((host, port), QueryRequestHandler)
+    server.service = service
+    return server
+
+
+def serve(data_dir=None, merchant_config=None, target_year=None, mode_test=None, host=None, port=None):
+    """
+    問い合わせサービスを起動します。Ctrl+C で終了します。引数を省略した場合は config.py の設定値を使用します。
+
+    Args:
+        data_dir (str): 明細CSVが格納されているディレクトリ
+        merchant_config (str): 取引先マスターデータのパス
+        target_year (str): 分析対象年（空文字列の場合はすべての年）
+        mode_test (bool): テストモードで実行するかどうか
+        host (str): 待ち受けるアドレス（None の場合は QUERY_HOST）
+        port (int): 待ち受けるポート（None の場合は QUERY_PORT）
+
+    Returns:
+        int: 終了コード（正常終了の場合は 0）
+    """
+    arguments = resolve_arguments(data_dir, merchant_config, target_year, mode_test)
+    if arguments is None:
+        return 1
+    data_dir, merchant_config, period, metadata = arguments
+
+    service = QueryService(QUERY_CACHE_SIZE)
+    watcher = QueryWatcher(service, data_dir, merchant_config, period, metadata)
+    watcher.start()
+    server = make_server(service, host or QUERY_HOST, QUERY_PORT if port is None else port)
+
+    stop = threading.Event()
+
+    def poll():
+        while not stop.wait(WATCH_INTERVAL):
+            try:
+                watcher.poll()
+            except Exception as e:
+                print(f"警告: データの更新中にエラーが発生しました: {e}")
+
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+    host, port = server.server_address[:2]
+    print(f"問い合わせサービスを開始しました: http://{host}:{port}/（Ctrl+C で終了）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("問い合わせサービスを終了しました。")
+    finally:
+        stop.set()
+        server.server_close()
+    return 0
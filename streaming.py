@@ -0,0 +1,124 @@
+"""
+ストリーミングモード用の外部ソート
+
+ストリーミングモードでは明細をチャンク単位で処理するため、ご利用日順の出力ファイルは
+チャンクごとに並べ替えた一時ファイル（ラン）を作り、最後にマージして書き出します。
+メモリに保持するのは各ランの先頭行だけなので、使用メモリは全体の行数に依存しません。
+"""
+
+import csv
+import heapq
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack
+
+# 同時に開くランの上限（これを超える場合は段階的にマージする）
+MAX_OPEN_RUNS = 128
+
+
+class SortedRunWriter:
+    """
+    並べ替え済みのチャンクを一時ファイルに書き出し、最後に1つのCSVへマージします。
+    """
+
+    def __init__(self, key_column, directory=None, date_format=None):
+        """
+        Args:
+            key_column (str): 並べ替えのキーとなる列名
+            directory (str): 一時ファイルを作成するディレクトリ（None の場合はシステムの既定値）
+            date_format (str): 日付型の列を書き出す形式。キー列が日付型の場合は、
+                文字列として比較した順序が日付順になる形式（"%Y/%m/%d" など）を指定する
+        """
+        self.key_column = key_column
+        self.date_format = date_format
+        self.columns = None
+        self.runs = []
+        self._run_count = 0
+        self._dir = tempfile.mkdtemp(prefix="amex_runs_", dir=directory)
+
+    def add(self, df):
+        """
+        キー列で安定ソートしたチャンクをランとして書き出します。
+
+        Args:
+            df (pd.DataFrame): 前処理・判定済みの取引データのチャンク
+        """
+        if self.columns is None:
+            self.columns = list(df.columns)
+        path = self._new_run_path()
+        df.sort_values(self.key_column, kind="stable").to_csv(
+            path, index=False, header=False, date_format=self.date_format
+        )
+        self.runs.append(path)
+
+    def checkpoint(self):
+        """
+        現在のラン数を返します。rollback に渡すと、それ以降に追加したランを破棄できます。
+        """
+        return len(self.runs)
+
+    def rollback(self, checkpoint):
+        """
+        checkpoint 以降に追加したランを破棄します。
+        """
+        for path in self.runs[checkpoint:]:
+            os.remove(path)
+        del self.runs[checkpoint:]
+
+    def merge(self, outputs, open_file=None):
+        """
+        すべてのランをキー列の順にマージし、出力ファイルに書き出します。
+        同じキーの行はランを追加した順に並ぶため、全体を安定ソートした結果と一致します。
+
+        Args:
+            outputs (list): (出力先, 列名) または (出力先, 列名, 列数) のリスト。列名を指定した場合は、その列が空でない
+                行だけを書き出す。列数を指定した場合は、先頭からその数の列だけを書き出す（None の場合はすべての列）
+            open_file (callable): 出力先を受け取り、書き込み用のテキストファイルを返すコンテキストマネージャー
+                （None の場合は、出力先をファイルのパスとして UTF-8 で開く）
+        """
+        runs = list(self.runs)
+        while len(runs) > MAX_OPEN_RUNS:
+            merged = []
+            for start in range(0, len(runs), MAX_OPEN_RUNS):
+                path = self._new_run_path()
+                with open(path, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f, lineterminator=os.linesep)
+                    writer.writerows(self._merged_rows(runs[start : start + MAX_OPEN_RUNS]))
+                merged.append(path)
+            runs = merged
+
+        open_file = open_file or (lambda target: open(target, "w", newline="", encoding="utf-8"))
+        with ExitStack() as stack:
+            writers = []
+            for target, column, *width in outputs:
+                width = width[0] if width and width[0] is not None else len(self.columns)
+                writer = csv.writer(stack.enter_context(open_file(target)), lineterminator=os.linesep)
+                writer.writerow(self.columns[:width])
+                index = None if column is None else self.columns.index(column)
+                writers.append((writer, index, width))
+
+            for row in self._merged_rows(runs):
+                for writer, index, width in writers:
+                    if index is None or row[index] != "":
+                        writer.writerow(row[:width])
+
+    def close(self):
+        """
+        一時ファイルをすべて削除します。
+        """
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _merged_rows(self, runs):
+        key_index = self.columns.index(self.key_column)
+        files = [open(path, newline="", encoding="utf-8") for path in runs]
+        try:
+            readers = [csv.reader(f) for f in files]
+            yield from heapq.merge(*readers, key=lambda row: row[key_index])
+        finally:
+            for f in files:
+                f.close()
+
+    def _new_run_path(self):
+        self._run_count += 1
+        return os.path.join(self._dir, f"run_{self._run_count:06d}.csv")
@@ -0,0 +1,201 @@
+"""
+aggregate_store（集計状態の保存）のテスト
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from aggregate_store import AggregateStore
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+SUMMARIES = ["grouped.csv", "corporate_summary.csv", "rollup_month.csv"]
+
+
+def write_statement(path, rows):
+    path.write_bytes((HEADER + "\n".join(rows) + "\n").encode("cp932"))
+
+
+def touch(path):
+    """内容を書き換えたファイルの更新日時を確実に変える"""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_statement(
+        data_dir / "2024_01.csv",
+        [
+            '2024/01/05,AMAZON WEB SERVICES,"12,500",',
+            '2024/01/12,ZOOM.US,"2,000","20.00 USD"',
+            "2024/01/05,セブンイレブン,680,",
+        ],
+    )
+    write_statement(
+        data_dir / "2024_02.csv",
+        ['2024/02/03,GITHUB INC,"4,800",', "2023/12/28,セブンイレブン,680,", "2024/02/10,ZOOM.US,2100,"],
+    )
+    merchant_config = tmp_path / "merchants.csv"
+    merchant_config.write_bytes(
+        "merchant_name,is_corporate,category\nAMAZON,3,cloud_services\nZOOM,3,business_tools\n"
+        "セブンイレブン,2,コンビニ\n".encode("cp932")
+    )
+    monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+    monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+    monkeypatch.setattr(main, "RUN_REPORT", False)
+    monkeypatch.setattr(main, "ROLLUP_PERIODS", ["month"])
+    monkeypatch.setattr(main, "AGGREGATE_STATE_PATH", str(tmp_path / "state" / "aggregate_state.pkl"))
+    return tmp_path, data_dir, merchant_config
+
+
+def run(paths, name):
+    tmp_path, data_dir, merchant_config = paths
+    result_dir = tmp_path / name
+    code = main.main(
+        data_dir=str(data_dir), merchant_config=str(merchant_config), result_dir=str(result_dir), target_year="2024"
+    )
+    assert code == 0
+    return result_dir
+
+
+def assert_same_as_full_run(paths, result_dir, monkeypatch, files=SUMMARIES):
+    """集計状態から作った結果が、集計状態を使わずに main() を実行した結果と同じであることを確認する"""
+    with monkeypatch.context() as m:
+        m.setattr(main, "AGGREGATE_STATE_PATH", None)
+        expected = run(paths, "full")
+    for file in files:
+        assert (result_dir / file).read_bytes() == (expected / file).read_bytes(), file
+
+
+def record_reads(monkeypatch):
+    read = []
+    original = main.read_transaction_file
+    monkeypatch.setattr(
+        main, "read_transaction_file", lambda path, *args: read.append(os.path.basename(path)) or original(path, *args)
+    )
+    return read
+
+
+class TestAggregateStore:
+    """集計状態を使った増分集計のテスト"""
+
+    def test_first_run_matches_full_run(self, paths, monkeypatch):
+        """初回の実行ですべての結果ファイルが従来と同じ内容になり、集計状態が保存される"""
+        result_dir = run(paths, "first")
+
+        assert os.path.exists(main.AGGREGATE_STATE_PATH)
+        assert_same_as_full_run(paths, result_dir, monkeypatch, sorted(os.listdir(result_dir)))
+
+    def test_added_file_is_aggregated_alone(self, paths, monkeypatch):
+        """追加された明細だけを集計し、取引の行を書き出さない場合は過去の明細を読み込まない"""
+        _, data_dir, _ = paths
+        run(paths, "first")
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped", "corporate_summary", "rollup_month"])
+        read = record_reads(monkeypatch)
+
+        write_statement(data_dir / "2024_03.csv", ['2024/03/01,AMAZON WEB SERVICES,"1,000",', "2024/03/02,新しい店,50,"])
+        result_dir = run(paths, "added")
+
+        assert read == ["2024_03.csv"]
+        assert sorted(os.listdir(result_dir)) == sorted(SUMMARIES)
+        assert_same_as_full_run(paths, result_dir, monkeypatch)
+
+    def test_removed_and_replaced_files_are_subtracted(self, paths, monkeypatch):
+        """削除・変更された明細の集計を差し引き、変更後の明細だけを集計し直す"""
+        _, data_dir, _ = paths
+        run(paths, "first")
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped", "corporate_summary", "rollup_month"])
+        read = record_reads(monkeypatch)
+
+        os.remove(data_dir / "2024_01.csv")
+        write_statement(data_dir / "2024_02.csv", ['2024/02/03,GITHUB INC,"4,800",', "2024/02/04,セブンイレブン,100,"])
+        touch(data_dir / "2024_02.csv")
+        result_dir = run(paths, "changed")
+
+        assert read == ["2024_02.csv"]
+        grouped = pd.read_csv(result_dir / "grouped.csv")
+        # 削除された明細にだけあった取引先は、回数が0になるため結果に残らない
+        assert "AMAZON WEB SERVICES" not in grouped["ご利用内容"].tolist()
+        assert_same_as_full_run(paths, result_dir, monkeypatch)
+
+    def test_unchanged_content_is_reused(self, paths, monkeypatch):
+        """更新日時だけが変わった明細は、内容のハッシュ値が同じため集計し直さない"""
+        _, data_dir, _ = paths
+        run(paths, "first")
+        read = record_reads(monkeypatch)
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped"])
+
+        touch(data_dir / "2024_01.csv")
+        run(paths, "touched")
+
+        assert read == []
+
+    def test_settings_change_rebuilds(self, paths, monkeypatch, capsys):
+        """マスターデータや対象期間が変わった場合は、保存した状態を破棄してすべての明細を集計し直す"""
+        _, _, merchant_config = paths
+        run(paths, "first")
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped", "corporate_summary", "rollup_month"])
+        read = record_reads(monkeypatch)
+
+        with open(merchant_config, "ab") as f:
+            f.write("GITHUB,3,developer_tools\n".encode("cp932"))
+        result_dir = run(paths, "master")
+
+        assert sorted(read) == ["2024_01.csv", "2024_02.csv"]
+        assert "集計の前提が変更されました: ['master']" in capsys.readouterr().out
+        assert_same_as_full_run(paths, result_dir, monkeypatch)
+
+    def test_verify_replaces_mismatched_state(self, paths, monkeypatch, capsys):
+        """検証モードでは全体を集計し直した結果と照合し、異なる場合は集計し直した結果で置き換える"""
+        run(paths, "first")
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped", "corporate_summary", "rollup_month"])
+        monkeypatch.setattr(main, "AGGREGATE_STATE_VERIFY", True)
+
+        # 保存した合計を壊す
+        data = pd.read_pickle(main.AGGREGATE_STATE_PATH)
+        data["total"]["回数"] += 1
+        pd.to_pickle(data, main.AGGREGATE_STATE_PATH)
+
+        result_dir = run(paths, "verified")
+        assert "一致しません" in capsys.readouterr().out
+        assert_same_as_full_run(paths, result_dir, monkeypatch)
+
+        run(paths, "verified_again")
+        assert "全体を集計し直した結果と一致しました" in capsys.readouterr().out
+
+    def test_duplicates_follow_removed_file(self, paths, monkeypatch):
+        """削除された明細と重複していたため取引を除いていた明細は、集計し直す"""
+        _, data_dir, _ = paths
+        monkeypatch.setattr(main, "DEDUPLICATE_TRANSACTIONS", True)
+        write_statement(
+            data_dir / "2024_ytd.csv",
+            ['2024/01/05,AMAZON WEB SERVICES,"12,500",', "2024/01/05,セブンイレブン,680,", "2024/03/01,ZOOM.US,2100,"],
+        )
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped", "corporate_summary", "rollup_month"])
+        assert_same_as_full_run(paths, run(paths, "first"), monkeypatch)
+        read = record_reads(monkeypatch)
+
+        os.remove(data_dir / "2024_01.csv")
+        result_dir = run(paths, "removed")
+
+        assert read == ["2024_ytd.csv"]
+        grouped = pd.read_csv(result_dir / "grouped.csv")
+        assert "AMAZON WEB SERVICES" in grouped["ご利用内容"].tolist()
+        assert_same_as_full_run(paths, result_dir, monkeypatch)
+
+    def test_load_broken_state(self, tmp_path, capsys):
+        """壊れた状態ファイルは破棄して空の状態から始める"""
+        path = tmp_path / "aggregate_state.pkl"
+        path.write_bytes(b"broken")
+
+        store = AggregateStore.load(str(path), {}, ["month"])
+
+        assert store.files == {} and store.result() is None
+        assert "警告" in capsys.readouterr().out
@@ -0,0 +1,136 @@
+"""
+集計エンジンのテスト
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from aggregation import AggregateState
+
+
+@pytest.fixture
+def identified_df():
+    """法人取引判定済みの取引データ（年をまたぐ週を含む）"""
+    rng = np.random.default_rng(0)
+    rows = 2000
+    merchants = ["AMAZON WEB SERVICES", "GITHUB INC", "ZOOM.US", "セブンイレブン", "不明な店"]
+    df = pd.DataFrame(
+        {
+            "ご利用日": pd.Timestamp("2023-12-25") + pd.to_timedelta(rng.integers(0, 120, rows), unit="D"),
+            "ご利用内容": rng.choice(merchants, rows),
+            "金額": rng.integers(100, 50000, rows),
+            "海外通貨利用金額": None,
+            "現地通貨建て金額": np.where(rng.random(rows) < 0.1, 10.5, np.nan),
+            "通貨": None,
+        }
+    ).sort_values("ご利用日", kind="stable", ignore_index=True)
+    merchants_df = pd.DataFrame(
+        {
+            "merchant_name": ["AMAZON WEB SERVICES", "GITHUB INC", "ZOOM.US", "セブンイレブン"],
+            "is_corporate": [3, 3, 3, 2],
+            "category": ["cloud_services", "developer_tools", "business_tools", "コンビニ"],
+        }
+    )
+    return main.identify_corporate_transactions(main.compact_transaction_data(df), merchants_df)
+
+
+def reference_frequency(df):
+    """従来の集計（grouped.csv）"""
+    return (
+        df.groupby("ご利用内容", observed=True)
+        .agg(
+            回数=("ご利用内容", "size"),
+            合計金額=("金額", "sum"),
+            法人取引=("is_corporate", "first"),
+            カテゴリ=("merchant_category", "first"),
+        )
+        .sort_values("回数", ascending=False)
+    )
+
+
+def reference_corporate_summary(df):
+    """従来の集計（corporate_summary.csv）"""
+    return (
+        df[df["is_corporate"] == 3]
+        .groupby("merchant_category", observed=True)
+        .agg(取引回数=("金額", "size"), 合計金額=("金額", "sum"))
+    )
+
+
+def assert_same_values(result, expected):
+    """型の違い（カテゴリ型と文字列など）は無視して値を比較する"""
+    pd.testing.assert_frame_equal(
+        result.reset_index().astype(object), expected.reset_index().astype(object), check_dtype=False
+    )
+
+
+class TestAggregateState:
+    """集計エンジンのテスト"""
+
+    def test_same_results_as_separate_groupby(self, identified_df):
+        """1回の集計から作った結果が、従来の個別の集計と同じになる"""
+        state = AggregateState.from_frame(identified_df, ["month", "week"])
+
+        assert_same_values(state.transaction_frequency(), reference_frequency(identified_df))
+        assert_same_values(state.corporate_summary(), reference_corporate_summary(identified_df))
+        pd.testing.assert_frame_equal(
+            state.foreign_transactions(), identified_df[identified_df["現地通貨建て金額"].notnull()]
+        )
+
+    def test_merge_matches_single_pass(self, identified_df):
+        """チャンクごとの集計を結合した結果が、全体を一度に集計した結果と同じになる"""
+        single = AggregateState.from_frame(identified_df, ["month", "week"])
+        chunks = [identified_df.iloc[i : i + 300] for i in range(0, len(identified_df), 300)]
+        merged = AggregateState.merge(AggregateState.from_frame(chunk, ["month", "week"]) for chunk in chunks)
+
+        pd.testing.assert_frame_equal(merged.transaction_frequency(), single.transaction_frequency())
+        pd.testing.assert_frame_equal(merged.corporate_summary(), single.corporate_summary())
+        for period in ("month", "week"):
+            pd.testing.assert_frame_equal(merged.rollup(period), single.rollup(period))
+        pd.testing.assert_frame_equal(merged.foreign_transactions(), single.foreign_transactions())
+
+    def test_subtract_matches_remaining(self, identified_df):
+        """結合した途中結果から一部を差し引いた結果が、残りだけを集計した結果と同じになる"""
+        head, tail = identified_df.iloc[:700], identified_df.iloc[700:]
+        merged = AggregateState.merge(
+            [AggregateState.from_frame(head, ["month"]), AggregateState.from_frame(tail, ["month"])]
+        )
+        subtracted = merged.subtract(AggregateState.from_frame(head, ["month"]))
+        remaining = AggregateState.from_frame(tail, ["month"])
+
+        assert (subtracted.base["回数"] > 0).all()
+        assert subtracted.transaction_frequency().to_csv() == remaining.transaction_frequency().to_csv()
+        assert subtracted.corporate_summary().to_csv() == remaining.corporate_summary().to_csv()
+        assert subtracted.rollup("month").to_csv() == remaining.rollup("month").to_csv()
+        with pytest.raises(ValueError):
+            merged.subtract(AggregateState.from_frame(head, ["week"]))
+
+    def test_rollups(self, identified_df):
+        """月・週ごとの集計の合計が取引先ごとの合計と一致し、期間の表記が正しい"""
+        state = AggregateState.from_frame(identified_df, ["month", "week"])
+        frequency = state.transaction_frequency()
+
+        for period in ("month", "week"):
+            rollup = state.rollup(period)
+            totals = rollup.groupby(level="ご利用内容", observed=True)[["回数", "合計金額"]].sum()
+            assert_same_values(totals, frequency[["回数", "合計金額"]].sort_index())
+
+        months = state.rollup("month").index.get_level_values("期間").unique().tolist()
+        assert months == ["2023-12", "2024-01", "2024-02", "2024-03", "2024-04"]
+        weeks = state.rollup("week").index.get_level_values("期間").unique()
+        # 週は月曜日から日曜日まで
+        assert weeks[0] == "2023-12-25/2023-12-31"
+        assert weeks[1] == "2024-01-01/2024-01-07"
+
+    def test_unknown_period(self, identified_df):
+        """未対応・未集計の期間はエラーにする"""
+        with pytest.raises(ValueError):
+            AggregateState.from_frame(identified_df, ["year"])
+        with pytest.raises(ValueError):
+            AggregateState.from_frame(identified_df, ["month"]).rollup("week")
@@ -0,0 +1,143 @@
+"""
+classification_cache のテスト
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from classification_cache import ClassificationCache
+from merchant_matcher import MerchantNormalizer
+
+
+def make_merchants(rows):
+    return pd.DataFrame(rows, columns=["merchant_name", "is_corporate", "category"])
+
+
+@pytest.fixture
+def merchants_df():
+    return make_merchants(
+        [
+            ["AMAZON WEB SERVICES", 3, "cloud_services"],
+            ["GITHUB INC", 3, "developer_tools"],
+            ["AMAZON", 1, "買い物"],
+        ]
+    )
+
+
+@pytest.fixture
+def transactions_df():
+    return pd.DataFrame(
+        {"ご利用内容": ["AMAZON WEB SERVICES", "GITHUB INC", "AMAZON.CO.JP", "コンビニ", "GITHUB INC"]}
+    )
+
+
+def classify(df, merchants_df, cache):
+    result_df = main.identify_corporate_transactions(df.copy(), merchants_df, cache)
+    return list(zip(result_df["is_corporate"], result_df["merchant_category"]))
+
+
+class TestClassificationCache:
+    """分類キャッシュのテスト"""
+
+    def test_hits_after_reload(self, tmp_path, merchants_df, transactions_df):
+        """保存したキャッシュを読み込むと、同じ取引内容はすべてヒットする"""
+        path = str(tmp_path / "cache.json")
+        cache = ClassificationCache.load(path)
+        expected = classify(transactions_df, merchants_df, cache)
+        assert (cache.hits, cache.misses) == (0, 4)
+        cache.save()
+
+        reloaded = ClassificationCache.load(path)
+        assert classify(transactions_df, merchants_df, reloaded) == expected
+        assert (reloaded.hits, reloaded.misses) == (4, 0)
+
+    def test_same_result_as_uncached(self, merchants_df, transactions_df):
+        """キャッシュの有無で判定結果が変わらない"""
+        cache = ClassificationCache()
+        classify(transactions_df, merchants_df, cache)
+
+        assert classify(transactions_df, merchants_df, cache) == classify(
+            transactions_df, merchants_df, None
+        )
+
+    def test_added_rule_invalidates_only_affected_entries(self, merchants_df, transactions_df):
+        """ルールを追加すると、そのルールに一致する取引内容だけが無効化される"""
+        cache = ClassificationCache()
+        classify(transactions_df, merchants_df, cache)
+
+        edited = make_merchants(
+            [
+                ["AMAZON WEB SERVICES", 3, "cloud_services"],
+                ["GITHUB INC", 3, "developer_tools"],
+                ["コンビニ", 2, "コンビニ"],
+                ["AMAZON", 1, "買い物"],
+            ]
+        )
+        cache.sync_master(edited)
+
+        assert cache.invalidated == 1
+        assert classify(transactions_df, edited, cache) == classify(transactions_df, edited, None)
+
+    def test_reordered_and_removed_rules(self, merchants_df, transactions_df):
+        """並べ替え・削除されたルールの影響を受けるエントリが無効化され、結果が正しく更新される"""
+        cache = ClassificationCache()
+        classify(transactions_df, merchants_df, cache)
+
+        reordered = make_merchants(
+            [
+                ["GITHUB INC", 3, "developer_tools"],
+                ["AMAZON", 1, "買い物"],
+                ["AMAZON WEB SERVICES", 3, "cloud_services"],
+            ]
+        )
+        cache.sync_master(reordered)
+
+        # AMAZON WEB SERVICES の判定に使われたルールが後ろに移動したため無効化される
+        assert cache.invalidated == 1
+        assert classify(transactions_df, reordered, cache) == classify(
+            transactions_df, reordered, None
+        )
+
+        removed = reordered.iloc[1:].reset_index(drop=True)
+        cache.sync_master(removed)
+
+        # GITHUB INC の判定に使われたルールが削除されたため無効化される
+        assert cache.invalidated == 2
+        assert classify(transactions_df, removed, cache) == classify(transactions_df, removed, None)
+
+    def test_normalization_change_discards_entries(self, tmp_path, merchants_df, transactions_df):
+        """取引先名の正規化の設定が変わると、保存したキャッシュは使われない"""
+        path = str(tmp_path / "cache.json")
+        cache = ClassificationCache.load(path, normalizer=MerchantNormalizer())
+        classify(transactions_df, merchants_df, cache)
+        cache.save()
+
+        assert len(ClassificationCache.load(path, normalizer=MerchantNormalizer())) == 4
+        assert len(ClassificationCache.load(path, normalizer=MerchantNormalizer([r"\d+$"]))) == 0
+        assert len(ClassificationCache.load(path)) == 0
+
+    def test_match_type_change_invalidates_entries(self, merchants_df, transactions_df):
+        """ルールを完全一致に変えると、そのルールで判定した取引内容が判定し直される"""
+        cache = ClassificationCache()
+        classify(transactions_df, merchants_df, cache)
+        exact = merchants_df.assign(match_type=["contains", "contains", "exact"])
+
+        result = classify(transactions_df, exact, cache)
+
+        assert result == classify(transactions_df, exact, None)
+        # AMAZON.CO.JP は AMAZON に完全一致しないため一致なしになる
+        assert result[2] == (0, "")
+
+    def test_eviction_keeps_most_recent_entries(self, merchants_df, transactions_df):
+        """上限を超えると最も古いエントリから削除される"""
+        cache = ClassificationCache(max_entries=2)
+        classify(transactions_df, merchants_df, cache)
+
+        assert len(cache) == 2
+        assert cache.get("コンビニ") == (0, "")
+        assert cache.get("AMAZON WEB SERVICES") is None
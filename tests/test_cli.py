@@ -0,0 +1,137 @@
+"""
+コマンドラインのテスト
+"""
+
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import cli
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class TestRun:
+    """引数の解釈のテスト"""
+
+    @patch("main.main", return_value=0)
+    def test_arguments_are_passed_to_main(self, mock_main):
+        """オプションで指定した値で分析を実行する"""
+        status = cli.run(
+            [
+                "--production",
+                "--data-dir",
+                "statements",
+                "--merchants",
+                "rules.csv",
+                "--result-dir",
+                "out",
+                "--year",
+                "2023",
+                "--profile",
+                "preprocess",
+                "--profile-mode",
+                "tracemalloc",
+                "--years",
+                "2023",
+                "2024",
+            ]
+        )
+
+        assert status == 0
+        mock_main.assert_called_once_with(
+            data_dir="statements",
+            merchant_config="rules.csv",
+            result_dir="out",
+            target_year="2023",
+            mode_test=False,
+            profile_stage="preprocess",
+            profile_mode="tracemalloc",
+            partitions=["2023", "2024"],
+        )
+
+    @patch("main.main", return_value=0)
+    def test_defaults_are_left_to_config(self, mock_main):
+        """省略したオプションは None のまま渡し、config.py の設定値を使わせる"""
+        cli.run([])
+
+        mock_main.assert_called_once_with(
+            data_dir=None,
+            merchant_config=None,
+            result_dir=None,
+            target_year=None,
+            mode_test=None,
+            profile_stage=None,
+            profile_mode=None,
+            partitions=None,
+        )
+
+    @patch("watcher.watch", return_value=0)
+    @patch("main.main")
+    def test_watch(self, mock_main, mock_watch):
+        """--watch を指定するとウォッチモードで実行する"""
+        assert cli.run(["--watch", "--year", "2024"]) == 0
+
+        mock_watch.assert_called_once_with(
+            data_dir=None, merchant_config=None, result_dir=None, target_year="2024", mode_test=None
+        )
+        mock_main.assert_not_called()
+        assert cli.run(["--watch", "--years", "2023", "2024"]) == 2
+
+    @patch("query_service.serve", return_value=0)
+    def test_serve(self, mock_serve):
+        """--serve を指定すると問い合わせサービスを起動する"""
+        assert cli.run(["--serve", "--port", "9000"]) == 0
+
+        mock_serve.assert_called_once_with(
+            data_dir=None, merchant_config=None, target_year=None, mode_test=None, port=9000
+        )
+
+    @patch("main.main")
+    def test_invalid_year(self, mock_main, capsys):
+        """数字でない対象年はエラーにする"""
+        assert cli.run(["--year", "last"]) == 2
+        assert "分析対象年は数字で指定してください" in capsys.readouterr().out
+        assert cli.run(["--years", "2024", "last"]) == 2
+        # 日付として扱えない5桁以上の年もエラーにする
+        assert cli.run(["--year", "20245"]) == 2
+        assert cli.run(["--years", "2024", "20245"]) == 2
+        mock_main.assert_not_called()
+
+    def test_check(self, tmp_path, capsys):
+        """--check は入力ファイルの有無だけを確認する"""
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        merchant_config = tmp_path / "merchants.csv"
+        merchant_config.touch()
+        args = ["--check", "--data-dir", str(data_dir), "--merchants", str(merchant_config)]
+
+        assert cli.run(args) == 1
+        assert "CSVファイルが見つかりません" in capsys.readouterr().out
+
+        (data_dir / "2024.csv").touch()
+        assert cli.run(args) == 0
+        assert "入力ファイルを確認しました。" in capsys.readouterr().out
+
+
+class TestStartup:
+    """起動時の読み込みのテスト"""
+
+    @pytest.mark.parametrize("args", [["--help"], ["--check"]])
+    def test_pandas_is_not_imported(self, args):
+        """--help と --check では pandas を読み込まない"""
+        code = (
+            "import sys, cli\n"
+            "try:\n"
+            f"    cli.run({args!r})\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "assert 'pandas' not in sys.modules, 'pandas imported'\n"
+        )
+        subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        )
@@ -0,0 +1,86 @@
+"""
+csv_reader のテスト
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import csv_reader
+import main
+
+pytest.importorskip("pyarrow")
+
+STATEMENT = (
+    "ご利用日,ご利用内容,カード会員,金額,海外通貨利用金額\n"
+    '2024/01/05,AMAZON WEB SERVICES ,本会員,"12,500",\n'
+    '2024/01/12,ZOOM.US,家族会員,"-2,000","1,020.00 USD"\n'
+    "2024/01/20,,本会員,680,\n"
+)
+
+
+@pytest.fixture
+def statement(tmp_path):
+    path = tmp_path / "statement.csv"
+    path.write_bytes(STATEMENT.encode("cp932"))
+    return str(path)
+
+
+class TestReadCsv:
+    """CSV の読み込みのテスト"""
+
+    def test_backends_read_same_frame(self, statement, monkeypatch):
+        """pandas と pyarrow で、必要な列だけが同じ型・同じ値で読み込まれる"""
+        frames = {}
+        for backend in csv_reader.READER_BACKENDS:
+            monkeypatch.setattr(main, "CSV_READER", backend)
+            frames[backend] = main.read_transaction_csv(statement)
+
+        pd.testing.assert_frame_equal(frames["pyarrow"], frames["pandas"])
+        assert frames["pandas"].columns.tolist() == main.TRANSACTION_COLUMNS
+        assert frames["pandas"]["金額"].tolist() == [12500, -2000, 680]
+        assert frames["pandas"]["ご利用内容"].isna().tolist() == [False, False, True]
+
+    def test_missing_column(self, tmp_path):
+        """必要な列がないファイルはエラーになる"""
+        path = tmp_path / "broken.csv"
+        path.write_bytes("ご利用日,ご利用内容\n2024/01/05,A\n".encode("cp932"))
+
+        for backend in csv_reader.READER_BACKENDS:
+            with pytest.raises(ValueError):
+                csv_reader.read_csv(str(path), backend, columns=main.TRANSACTION_COLUMNS)
+
+    def test_merchant_config(self, tmp_path, monkeypatch):
+        """取引先マスターデータは任意の列（match_type）も含めて同じように読み込まれる"""
+        path = tmp_path / "merchants.csv"
+        path.write_bytes(
+            "merchant_name,is_corporate,category,memo\nAWS,3,cloud_services,x\nセブン,2,コンビニ,\n".encode(
+                "cp932"
+            )
+        )
+        frames = {}
+        for backend in csv_reader.READER_BACKENDS:
+            monkeypatch.setattr(main, "CSV_READER", backend)
+            frames[backend] = main.load_merchant_config(path=str(path))
+
+        pd.testing.assert_frame_equal(frames["pyarrow"], frames["pandas"])
+        assert frames["pandas"].columns.tolist() == ["merchant_name", "is_corporate", "category"]
+
+    def test_fallback_without_pyarrow(self, statement, monkeypatch, capsys):
+        """pyarrow がない場合は警告を1回だけ表示して pandas で読み込む"""
+        monkeypatch.setattr(csv_reader, "PYARROW_AVAILABLE", False)
+        monkeypatch.setattr(csv_reader, "_fallback_warned", False)
+
+        assert csv_reader.resolve_backend("pyarrow") == "pandas"
+        assert csv_reader.resolve_backend("pyarrow") == "pandas"
+        assert capsys.readouterr().out.count("pyarrow がインストールされていない") == 1
+        monkeypatch.setattr(main, "CSV_READER", "pyarrow")
+        assert len(main.read_transaction_csv(statement)) == 3
+
+    def test_unknown_backend(self):
+        """未対応の読み込み方法はエラーにする"""
+        with pytest.raises(ValueError):
+            csv_reader.resolve_backend("polars")
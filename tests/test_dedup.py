@@ -0,0 +1,205 @@
+"""
+dedup（明細をまたいだ重複取引の除外）のテスト
+"""
+
+import os
+import sys
+from functools import partial
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from dedup import TransactionDeduplicator, row_fingerprints
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+
+JANUARY = [
+    '2024/01/05,AMAZON WEB SERVICES,"12,500",',
+    '2024/01/12,ZOOM.US,"2,000","20.00 USD"',
+    "2024/01/20,セブンイレブン,680,",
+    "2024/01/20,セブンイレブン,680,",
+]
+# 年初からの明細: 1月の取引に加えて、1月の明細の後に計上された同じ内容の利用と2月の取引を含む
+YEAR_TO_DATE = JANUARY + ["2024/01/20,セブンイレブン,680,", '2024/02/03,GITHUB INC,"4,800",']
+
+
+def write_statement(path, rows):
+    path.write_bytes((HEADER + "\n".join(rows) + "\n").encode("cp932"))
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    """重複する明細のディレクトリと、重複を手で除いた明細のディレクトリ"""
+    overlapping = tmp_path / "data_overlapping"
+    overlapping.mkdir()
+    write_statement(overlapping / "2024_01.csv", JANUARY)
+    write_statement(overlapping / "2024_ytd.csv", YEAR_TO_DATE)
+    distinct = tmp_path / "data_distinct"
+    distinct.mkdir()
+    write_statement(distinct / "2024_01.csv", JANUARY)
+    write_statement(distinct / "2024_ytd.csv", YEAR_TO_DATE[len(JANUARY) :])
+    merchant_config = tmp_path / "merchants.csv"
+    merchant_config.write_bytes(
+        "merchant_name,is_corporate,category\nAMAZON,3,cloud_services\nセブンイレブン,2,コンビニ\n".encode("cp932")
+    )
+    monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+    monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+    monkeypatch.setattr(main, "RUN_REPORT", False)
+    monkeypatch.setattr(main, "DEDUPLICATE_TRANSACTIONS", True)
+    return tmp_path, overlapping, distinct, merchant_config
+
+
+def frame(rows):
+    return main.preprocess_transaction_data(
+        pd.DataFrame(
+            [row.split(",", 3) for row in rows], columns=["ご利用日", "ご利用内容", "金額", "海外通貨利用金額"]
+        ).replace({"海外通貨利用金額": {"": None}}),
+        None,
+    )
+
+
+def run_main(paths, data_dir, name):
+    tmp_path, _, _, merchant_config = paths
+    result_dir = tmp_path / name
+    code = main.main(
+        data_dir=str(data_dir), merchant_config=str(merchant_config), result_dir=str(result_dir), target_year="2024"
+    )
+    assert code == 0
+    return result_dir
+
+
+def assert_same_files(result_dir, expected):
+    names = sorted(os.listdir(expected))
+    assert sorted(os.listdir(result_dir)) == names
+    for file in names:
+        assert (result_dir / file).read_bytes() == (expected / file).read_bytes(), file
+
+
+class TestTransactionDeduplicator:
+    """重複の判定のテスト"""
+
+    def test_repeats_within_statement_are_kept(self):
+        """同じ明細の中で繰り返された利用は残し、先の明細より多い分だけを残す"""
+        deduplicator = TransactionDeduplicator()
+        deduplicator.begin("2024_01.csv")
+        assert len(deduplicator.filter(frame(JANUARY))) == 4
+        deduplicator.begin("2024_ytd.csv")
+        kept = deduplicator.filter(frame(YEAR_TO_DATE))
+        deduplicator.commit()
+
+        assert kept["ご利用内容"].tolist() == ["セブンイレブン", "GITHUB INC"]
+        assert deduplicator.dropped == 4
+        assert deduplicator.duplicates == {"2024_ytd.csv": {"2024_01.csv"}}
+        # 先の明細を除くと、それと重複していた明細を読み込み直す必要がある
+        assert deduplicator.remove("2024_01.csv") == {"2024_ytd.csv"}
+
+    def test_chunks_match_whole_statement(self):
+        """チャンクに分けて渡しても、明細全体から作ったフィンガープリントと同じになる"""
+        df = frame(YEAR_TO_DATE)
+        expected, _ = row_fingerprints(df)
+        first, counts = row_fingerprints(df.iloc[:3])
+        second, _ = row_fingerprints(df.iloc[3:], counts)
+
+        assert expected.tolist() == first.tolist() + second.tolist()
+        assert len(set(expected.tolist())) == len(df)
+        # 型を小さくしても同じ値になる
+        compact, _ = row_fingerprints(main.compact_transaction_data(df.copy()))
+        assert compact.tolist() == expected.tolist()
+
+    def test_rollback(self):
+        """読み込みに失敗した明細のフィンガープリントは記録しない"""
+        deduplicator = TransactionDeduplicator()
+        deduplicator.begin("2024_01.csv")
+        deduplicator.filter(frame(JANUARY))
+        deduplicator.rollback()
+        deduplicator.begin("2024_ytd.csv")
+
+        assert len(deduplicator.filter(frame(YEAR_TO_DATE))) == len(YEAR_TO_DATE)
+
+    def test_saved_state_is_reused(self, tmp_path, monkeypatch):
+        """保存した判定結果から再開すると、前回と同じ順の変更のない明細はフィンガープリントを計算し直さない"""
+        path = str(tmp_path / "dedup_state.pkl")
+        settings = {"period": None}
+        deduplicator = TransactionDeduplicator.load(path, settings)
+        deduplicator.begin("2024_01.csv", (1, 1))
+        deduplicator.filter(frame(JANUARY))
+        deduplicator.begin("2024_ytd.csv", (2, 2))
+        expected = deduplicator.filter(frame(YEAR_TO_DATE))
+        deduplicator.save()
+
+        def fail(*args):
+            raise AssertionError("フィンガープリントを計算し直した")
+
+        with monkeypatch.context() as m:
+            m.setattr("dedup.row_fingerprints", fail)
+            restored = TransactionDeduplicator.load(path, settings)
+            restored.begin("2024_01.csv", (1, 1))
+            assert len(restored.filter(frame(JANUARY))) == len(JANUARY)
+            restored.begin("2024_ytd.csv", (2, 2))
+            # チャンクに分けて渡しても、前回と同じ行を除く
+            df = frame(YEAR_TO_DATE)
+            kept = pd.concat([restored.filter(df.iloc[:3]), restored.filter(df.iloc[3:])])
+            restored.commit()
+        assert kept.equals(expected)
+        assert restored.reused == 2
+        assert restored.dropped == 4
+        assert restored.duplicates == {"2024_ytd.csv": {"2024_01.csv"}}
+
+        # 先の明細が変わった場合は、後の明細も計算し直す
+        changed = TransactionDeduplicator.load(path, settings)
+        changed.begin("2024_01.csv", (1, 3))
+        changed.filter(frame(JANUARY[:1]))
+        changed.begin("2024_ytd.csv", (2, 2))
+        assert len(changed.filter(frame(YEAR_TO_DATE))) == len(YEAR_TO_DATE) - 1
+        changed.commit()
+        assert changed.reused == 0
+        # 前提が異なる場合は保存した結果を使わない
+        assert TransactionDeduplicator.load(path, {"period": "2023"}).fingerprints == {}
+
+
+class TestIngestion:
+    """読み込み方法ごとの重複の除外のテスト"""
+
+    def test_load_transaction_data(self, paths):
+        """逐次・並列の読み込みのどちらでも重複を除き、無効にした場合はすべての行を残す"""
+        _, overlapping, _, _ = paths
+        load = partial(main.load_transaction_data, str(overlapping), period=None)
+
+        assert len(load()) == 6
+        assert len(load(workers=2, preprocess=True)) == 6
+        assert len(load(deduplicate=False)) == 10
+
+    @pytest.mark.parametrize(
+        "setting", [None, ("INGEST_CACHE_DIR", "ingest"), ("STREAMING", True), ("TRANSACTION_STORE_PATH", "store")]
+    )
+    def test_outputs_match_distinct_statements(self, paths, monkeypatch, setting):
+        """通常・取込キャッシュ・ストリーミング・取引データストアのいずれでも、重複を除いた明細と同じ結果になる"""
+        tmp_path, overlapping, distinct, _ = paths
+        with monkeypatch.context() as m:
+            m.setattr(main, "DEDUPLICATE_TRANSACTIONS", False)
+            expected = run_main(paths, distinct, "expected")
+        if setting is not None:
+            name, value = setting
+            monkeypatch.setattr(main, name, str(tmp_path / value) if isinstance(value, str) else value)
+
+        assert_same_files(run_main(paths, overlapping, "first"), expected)
+        # 取込キャッシュや取引データストアから読み込む2回目の実行でも同じ結果になる
+        assert_same_files(run_main(paths, overlapping, "second"), expected)
+
+    @pytest.mark.parametrize("streaming", [False, True])
+    def test_saved_state_is_reused(self, paths, monkeypatch, capsys, streaming):
+        """取込キャッシュのディレクトリに保存した判定結果を次回の実行で使い、同じ結果になる"""
+        tmp_path, overlapping, distinct, _ = paths
+        with monkeypatch.context() as m:
+            m.setattr(main, "DEDUPLICATE_TRANSACTIONS", False)
+            expected = run_main(paths, distinct, "expected")
+        monkeypatch.setattr(main, "INGEST_CACHE_DIR", str(tmp_path / "ingest"))
+        monkeypatch.setattr(main, "STREAMING", streaming)
+
+        assert_same_files(run_main(paths, overlapping, "first"), expected)
+        assert os.path.exists(tmp_path / "ingest" / main.DEDUP_STATE_NAME)
+        capsys.readouterr()
+        assert_same_files(run_main(paths, overlapping, "second"), expected)
+        assert "2件の明細は前回の判定結果を使用しました" in capsys.readouterr().out
@@ -0,0 +1,157 @@
+"""
+fx_rates（為替レート表との照合）のテスト
+"""
+
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from fx_rates import FxRateTable, currency_summary, currency_totals, merge_totals
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+RATES = "date,currency,rate\n2024/01/01,USD,140\n2024/01/10,USD,150\n2024/01/05,eur,160\n2024-02-01,USD,145\n"
+
+
+@pytest.fixture
+def rates_path(tmp_path):
+    path = tmp_path / "rates.csv"
+    path.write_bytes(RATES.encode("cp932"))
+    return path
+
+
+@pytest.fixture
+def paths(tmp_path, rates_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    rows = [
+        '2024/01/05,AMAZON WEB SERVICES,"12,500",',
+        '2024/01/12,ZOOM.US,"3,000","20.00 USD"',
+        '2024/01/03,ZOOM.US,"1,400","10.00 USD"',
+        '2024/01/20,HOTEL,"16,500","100.00 EUR"',
+        '2024/02/03,GITHUB INC,"1,500","10.00 USD"',
+        '2024/02/05,SHOP,"2,000","100.00 THB"',
+    ]
+    (data_dir / "2024_01.csv").write_bytes((HEADER + "\n".join(rows) + "\n").encode("cp932"))
+    merchant_config = tmp_path / "merchants.csv"
+    merchant_config.write_bytes("merchant_name,is_corporate,category\nZOOM,3,business_tools\n".encode("cp932"))
+    monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+    monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+    monkeypatch.setattr(main, "RUN_REPORT", False)
+    monkeypatch.setattr(main, "FX_RATES_PATH", str(rates_path))
+    monkeypatch.setattr(main, "FX_RATES_CACHE_DIR", str(tmp_path / "fx_cache"))
+    return tmp_path, data_dir, merchant_config
+
+
+def run(paths, name):
+    tmp_path, data_dir, merchant_config = paths
+    result_dir = tmp_path / name
+    code = main.main(
+        data_dir=str(data_dir), merchant_config=str(merchant_config), result_dir=str(result_dir), target_year="2024"
+    )
+    assert code == 0
+    return result_dir
+
+
+class TestFxRateTable:
+    """参照レートの照合のテスト"""
+
+    def test_lookup_as_of(self, rates_path):
+        """ご利用日以前で最も新しいレートを通貨ごとに使い、古すぎるレートやない通貨は NaN になる"""
+        table = FxRateTable.load(str(rates_path))
+        currencies = pd.Series(["USD", "USD", "USD", "EUR", "EUR", "THB", "USD"], dtype="category")
+        dates = pd.to_datetime(
+            pd.Series(["2024-01-09", "2024-01-10", "2023-12-31", "2024-01-04", "2024-03-01", "2024-01-10", "2024-03-01"])
+        )
+
+        reference = table.lookup(currencies, dates)
+        np.testing.assert_array_equal(reference, [140, 150, np.nan, np.nan, 160, np.nan, 145])
+
+        limited = table.lookup(currencies, dates, max_age_days=7)
+        np.testing.assert_array_equal(limited, [np.nan, 150, np.nan, np.nan, np.nan, np.nan, np.nan])
+
+        # 小文字や前後に空白のある通貨コードも、レート表と同じく正規化して照合する
+        unnormalized = pd.Series(["usd", " USD ", "Eur", None])
+        reference = table.lookup(unnormalized, dates[[1, 1, 4, 4]].reset_index(drop=True))
+        np.testing.assert_array_equal(reference, [150, 150, 160, np.nan])
+
+    def test_cache(self, tmp_path, rates_path, capsys):
+        """解析したレート表はキャッシュから読み込み、内容が変わると解析し直す"""
+        cache_dir = tmp_path / "fx_cache"
+        FxRateTable.load(str(rates_path), str(cache_dir))
+        cached = FxRateTable.load(str(rates_path), str(cache_dir))
+        assert "キャッシュから読み込みました: 4件" in capsys.readouterr().out
+        assert len(os.listdir(cache_dir)) == 1
+
+        rates_path.write_bytes((RATES + "2024/03/01,USD,148\n").encode("cp932"))
+        table = FxRateTable.load(str(rates_path), str(cache_dir))
+        assert "為替レート表を読み込みました: 5件" in capsys.readouterr().out
+        assert len(table) == len(cached) + 1
+        assert len(os.listdir(cache_dir)) == 1
+
+    def test_summary_of_chunks(self, rates_path):
+        """チャンクごとの合計を足し合わせても、全体を集計した結果と同じになる"""
+        table = FxRateTable.load(str(rates_path))
+        foreign = table.annotate(
+            pd.DataFrame(
+                {
+                    "ご利用日": pd.to_datetime(["2024-01-12", "2024-01-03", "2024-01-20", "2024-02-05"]),
+                    "金額": [3000, 1400, 16500, 2000],
+                    "現地通貨建て金額": [20.0, 10.0, 100.0, 100.0],
+                    "通貨": ["USD", "USD", "EUR", "THB"],
+                }
+            )
+        )
+
+        summary = currency_summary(currency_totals(foreign))
+        pd.testing.assert_frame_equal(
+            currency_summary(merge_totals([currency_totals(foreign.iloc[:2]), currency_totals(foreign.iloc[2:])])),
+            summary,
+        )
+        assert foreign["乖離率"].round(4).tolist()[:3] == [0.0, 0.0, 0.0312]
+        assert summary.loc["USD", ["回数", "合計金額", "乖離額", "レート未登録"]].tolist() == [2, 4400, 0, 0]
+        assert summary.loc["THB", "レート未登録"] == 1 and pd.isna(summary.loc["THB", "乖離率"])
+
+
+class TestMainWithFxRates:
+    """main() で為替レート表を使用した場合のテスト"""
+
+    def test_foreign_outputs(self, paths):
+        """foreign.csv に照合結果の列が加わり、foreign_summary.csv に通貨ごとの集計が書き出される"""
+        result_dir = run(paths, "result")
+
+        foreign = pd.read_csv(result_dir / "foreign.csv")
+        assert foreign.columns[-3:].tolist() == ["換算レート", "参照レート", "乖離率"]
+        assert foreign["参照レート"].tolist()[:2] == [140, 150]
+        summary = pd.read_csv(result_dir / "foreign_summary.csv", index_col="通貨")
+        assert summary.index.tolist() == ["EUR", "THB", "USD"]
+        # EUR のレートはご利用日より FX_RATE_MAX_AGE_DAYS を超えて古いため使わない
+        assert summary.loc["EUR", ["乖離額", "レート未登録"]].tolist() == [0, 1]
+        assert summary.loc["USD", ["参照レート換算額", "乖離額"]].tolist() == [5850, 50]
+        # concatenated.csv の列は変わらない
+        assert "参照レート" not in pd.read_csv(result_dir / "concatenated.csv").columns
+
+    def test_streaming_matches(self, paths):
+        """ストリーミングモードでも同じ内容を書き出す"""
+        expected = run(paths, "expected")
+        with patch.object(main, "STREAMING", True), patch.object(main, "STREAMING_CHUNK_SIZE", 2):
+            result_dir = run(paths, "streaming")
+
+        for name in ("concatenated.csv", "foreign.csv", "foreign_summary.csv"):
+            assert (result_dir / name).read_bytes() == (expected / name).read_bytes(), name
+
+    def test_missing_rates_file(self, paths, monkeypatch, capsys):
+        """為替レート表がない場合は警告を表示し、照合せずに書き出す"""
+        tmp_path, _, _ = paths
+        monkeypatch.setattr(main, "FX_RATES_PATH", str(tmp_path / "missing.csv"))
+
+        result_dir = run(paths, "result")
+
+        assert "参照レートとの照合はスキップされます" in capsys.readouterr().out
+        assert not os.path.exists(result_dir / "foreign_summary.csv")
+        assert "参照レート" not in pd.read_csv(result_dir / "foreign.csv").columns
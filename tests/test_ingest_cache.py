@@ -0,0 +1,119 @@
+"""
+ingest_cache のテスト
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import ingest_cache
+import main
+from ingest_cache import IngestCache
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+
+
+def write_statement(path, rows):
+    path.write_bytes((HEADER + "\n".join(rows) + "\n").encode("cp932"))
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    write_statement(
+        directory / "2024_01.csv",
+        ['2024/01/05,AMAZON WEB SERVICES,"12,500",', '2024/01/12,ZOOM.US,"2,000","20.00 USD"'],
+    )
+    write_statement(
+        directory / "2024_02.csv",
+        ['2024/02/03,GITHUB INC,"4,800",', '2023/12/28,セブンイレブン,680,'],
+    )
+    return directory
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def load(data_dir, cache_dir, rebuild=False):
+    cache = IngestCache(cache_dir, rebuild=rebuild)
+    df = main.load_transaction_data(str(data_dir), ingest_cache=cache)
+    return df, cache
+
+
+class TestIngestCache:
+    """取込キャッシュのテスト"""
+
+    def test_unchanged_files_are_loaded_from_cache(self, data_dir, cache_dir):
+        """2回目の実行では変更のないファイルを解析せず、結果も同じになる"""
+        expected = main.preprocess_transaction_data(main.load_transaction_data(str(data_dir)))
+
+        first_df, first = load(data_dir, cache_dir)
+        second_df, second = load(data_dir, cache_dir)
+
+        assert (first.parsed, first.reused) == (2, 0)
+        assert (second.parsed, second.reused) == (0, 2)
+        pd.testing.assert_frame_equal(first_df, expected)
+        pd.testing.assert_frame_equal(second_df, expected)
+
+    def test_only_changed_file_is_parsed(self, data_dir, cache_dir):
+        """内容が変わったファイルだけが解析される"""
+        load(data_dir, cache_dir)
+        write_statement(data_dir / "2024_02.csv", ['2024/02/03,GITHUB INC,"5,000",'])
+
+        df, cache = load(data_dir, cache_dir)
+
+        assert (cache.parsed, cache.reused) == (1, 1)
+        assert df.loc[df["ご利用内容"] == "GITHUB INC", "金額"].tolist() == [5000]
+
+    def test_touched_file_with_same_content_is_reused(self, data_dir, cache_dir):
+        """更新日時だけが変わったファイルはハッシュ値の比較で再利用される"""
+        load(data_dir, cache_dir)
+        path = data_dir / "2024_01.csv"
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+
+        _, cache = load(data_dir, cache_dir)
+
+        assert (cache.parsed, cache.reused) == (0, 2)
+
+    def test_deleted_file_is_removed(self, data_dir, cache_dir):
+        """削除されたファイルはマニフェストとキャッシュから除外される"""
+        _, first = load(data_dir, cache_dir)
+        cached_file = os.path.join(cache_dir, first.manifest["files"]["2024_02.csv"]["cache"])
+        os.remove(data_dir / "2024_02.csv")
+
+        df, cache = load(data_dir, cache_dir)
+
+        assert cache.deleted == 1
+        assert "2024_02.csv" not in cache.manifest["files"]
+        assert not os.path.exists(cached_file)
+        assert df["ご利用内容"].tolist() == ["AMAZON WEB SERVICES", "ZOOM.US"]
+
+    def test_rebuild_and_schema_version_change(self, data_dir, cache_dir, monkeypatch):
+        """再構築の指定やキャッシュ形式の変更ではすべてのファイルが解析し直される"""
+        load(data_dir, cache_dir)
+
+        _, rebuilt = load(data_dir, cache_dir, rebuild=True)
+        assert (rebuilt.parsed, rebuilt.reused) == (2, 0)
+
+        monkeypatch.setattr(ingest_cache, "SCHEMA_VERSION", ingest_cache.SCHEMA_VERSION + 1)
+        _, upgraded = load(data_dir, cache_dir)
+        assert (upgraded.parsed, upgraded.reused) == (2, 0)
+
+    def test_files_outside_period_are_not_loaded(self, data_dir, cache_dir):
+        """キャッシュに記録された日付の範囲が期間外のファイルは読み込まれない"""
+        load(data_dir, cache_dir)
+        write_statement(data_dir / "2022_12.csv", ["2022/12/01,古い取引,100,"])
+        load(data_dir, cache_dir)
+
+        cache = IngestCache(cache_dir)
+        period = (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-12-31"))
+        df = main.load_transaction_data(str(data_dir), ingest_cache=cache, period=period)
+
+        assert (cache.reused, cache.skipped) == (2, 1)
+        assert "古い取引" not in df["ご利用内容"].tolist()
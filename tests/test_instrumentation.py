@@ -0,0 +1,140 @@
+"""
+処理の段階ごとの計測のテスト
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from instrumentation import RUN_REPORT_NAME, RunProfiler, peak_rss_mb
+
+
+def stage_report(report, name):
+    return next(stage for stage in report["stages"] if stage["name"] == name)
+
+
+class TestRunProfiler:
+    """RunProfiler のテスト"""
+
+    def test_measure_records_rows(self):
+        """入力と出力の DataFrame の行数を記録する"""
+        profiler = RunProfiler()
+        df = pd.DataFrame({"a": range(5)})
+
+        result = profiler.measure("filter", lambda frame: frame[frame["a"] > 2], df)
+
+        assert len(result) == 2
+        stage = stage_report(profiler.report(), "filter")
+        assert (stage["calls"], stage["rows_in"], stage["rows_out"]) == (1, 5, 2)
+        assert stage["wall_seconds"] >= 0
+        assert stage["cpu_seconds"] >= 0
+
+    def test_repeated_stage_is_accumulated(self):
+        """同じ名前の段階は呼び出し回数と行数を合計する"""
+        profiler = RunProfiler()
+        for rows in (3, 4):
+            profiler.measure("chunk", lambda frame: frame, pd.DataFrame({"a": range(rows)}))
+
+        stage = stage_report(profiler.report(), "chunk")
+        assert (stage["calls"], stage["rows_in"], stage["rows_out"]) == (2, 7, 7)
+
+    @pytest.mark.skipif(peak_rss_mb() is None, reason="メモリ使用量を取得できない環境")
+    def test_peak_rss_increase_per_stage(self):
+        """メモリ使用量の最大値の増加は、その段階で増えた分だけを記録する"""
+        profiler = RunProfiler()
+        profiler.measure("allocate", lambda: np.ones(64 * 2**20 // 8).sum())
+        profiler.measure("small", lambda: np.ones(1000).sum())
+
+        report = profiler.report()
+        assert stage_report(report, "allocate")["peak_rss_increase_mb"] >= 32
+        assert stage_report(report, "small")["peak_rss_increase_mb"] == 0
+
+    def test_failed_stage_is_recorded(self):
+        """例外が発生した段階も計測結果に残る"""
+        profiler = RunProfiler()
+        with pytest.raises(ZeroDivisionError):
+            profiler.measure("broken", lambda: 1 / 0)
+
+        assert stage_report(profiler.report(), "broken")["calls"] == 1
+
+    def test_cprofile(self, tmp_path):
+        """cProfile の統計ファイルと累積時間の長い関数を記録する"""
+        profiler = RunProfiler("sort", "cprofile", profile_dir=str(tmp_path))
+        profiler.measure("sort", sorted, list(range(1000)))
+        profiler.measure("other", sorted, list(range(10)))
+
+        profile = profiler.report()["profile"]
+
+        assert profile["stage"] == "sort"
+        assert (tmp_path / profile["stats_file"]).exists()
+        assert any("sorted" in entry["function"] for entry in profile["top"])
+
+    def test_tracemalloc(self):
+        """tracemalloc でメモリ使用量のピークを記録する"""
+        profiler = RunProfiler("allocate", "tracemalloc")
+        profiler.measure("allocate", lambda: [object() for _ in range(10000)])
+
+        profile = profiler.report()["profile"]
+
+        assert profile["mode"] == "tracemalloc"
+        assert profile["peak_mb"] > 0
+        assert profile["top"]
+
+    def test_unknown_profile_mode(self):
+        """未対応のプロファイル方法はエラーにする"""
+        with pytest.raises(ValueError):
+            RunProfiler("load", "perf")
+
+
+class TestRunReport:
+    """実行レポートのテスト"""
+
+    def test_main_writes_run_report(self, tmp_path, monkeypatch):
+        """段階を詳しく調べる場合、main() は RUN_REPORT によらず各段階の計測結果を結果ディレクトリに書き出す"""
+        monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+        monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+        monkeypatch.setattr(main, "ROLLUP_PERIODS", ["month"])
+        monkeypatch.setattr(main, "RUN_REPORT", False)
+        result_dir = tmp_path / "results"
+
+        assert main.main(result_dir=str(result_dir), profile_stage="classify") == 0
+
+        with open(result_dir / RUN_REPORT_NAME, encoding="utf-8") as f:
+            report = json.load(f)
+        names = [stage["name"] for stage in report["stages"]]
+        assert names == [
+            "load_merchant_config",
+            "load",
+            "preprocess",
+            "compact",
+            "classify",
+            "write_concatenated",
+            "aggregate",
+            "write_grouped",
+            "write_corporate_summary",
+            "write_foreign",
+            "write_rollup_month",
+        ]
+        concatenated = pd.read_csv(result_dir / "concatenated.csv")
+        assert stage_report(report, "classify")["rows_out"] == len(concatenated)
+        assert report["target_year"] == main.TARGET_YEAR
+        assert report["profile"]["stage"] == "classify"
+        assert (result_dir / report["profile"]["stats_file"]).exists()
+
+    def test_run_report_can_be_disabled(self, tmp_path, monkeypatch):
+        """RUN_REPORT が無効（既定）の場合は実行レポートを書き出さず、有効にすると書き出す"""
+        monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+        monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+
+        main.main(result_dir=str(tmp_path / "default"))
+        assert not (tmp_path / "default" / RUN_REPORT_NAME).exists()
+
+        monkeypatch.setattr(main, "RUN_REPORT", True)
+        main.main(result_dir=str(tmp_path / "enabled"))
+        assert (tmp_path / "enabled" / RUN_REPORT_NAME).exists()
@@ -3,7 +3,9 @@ AMEX CSV Analyzer のテスト
 """
 
 import os
+import subprocess
 import sys
+from functools import partial
 from unittest.mock import MagicMock, patch
 
 import numpy as np
@@ -149,8 +151,9 @@ class TestDataProcessing:
         # 現地通貨建て金額の検証
         current_values = result_df["現地通貨建て金額"].tolist()
         assert pd.isna(current_values[0]) or current_values[0] == ""
-        assert current_values[1] == "20.00"
+        assert current_values[1] == 20.0
         assert pd.isna(current_values[2]) or current_values[2] == ""
+        assert pd.api.types.is_float_dtype(result_df["現地通貨建て金額"])
 
         # 通貨の検証
         currency_values = result_df["通貨"].tolist()
@@ -158,6 +161,24 @@ class TestDataProcessing:
         assert currency_values[1] == "USD"
         assert pd.isna(currency_values[2]) or currency_values[2] == ""
 
+    def test_preprocess_filters_year_before_parsing(self):
+        """対象年以外の行は金額を解析する前に取り除かれる"""
+        df = pd.DataFrame(
+            {
+                "ご利用日": ["2024/01/01", "2023/12/31"],
+                "ご利用内容": ["GITHUB INC", "古い取引"],
+                "金額": ["1,000", "解析できない金額"],
+                "海外通貨利用金額": ["1,234.50 USD", "不正な値"],
+            }
+        )
+
+        with patch("main.TARGET_YEAR", "2024"):
+            result_df = main.preprocess_transaction_data(df)
+
+        assert result_df["金額"].tolist() == [1000]
+        assert result_df["現地通貨建て金額"].tolist() == [1234.5]
+        assert result_df["通貨"].tolist() == ["USD"]
+
     @patch("pandas.read_csv")
     def test_load_merchant_config(self, mock_read_csv):
         """マスターデータ読み込みのテスト"""
@@ -241,6 +262,200 @@ class TestDataProcessing:
         assert result_df["通貨"].iloc[0] == "USD"
 
 
+class TestCompactTransactionData:
+    """メモリ使用量の少ない型への変換のテスト"""
+
+    @pytest.fixture
+    def preprocessed_df(self):
+        """前処理済み（法人取引判定前）のテスト用データフレーム"""
+        descriptions = ["GITHUB INC", "コンビニ", "AMAZON WEB SERVICES", "GITHUB INC", "コンビニ", "ZOOM"]
+        return pd.DataFrame(
+            {
+                "ご利用日": pd.to_datetime(["2024/01/01"] * 6),
+                "ご利用内容": descriptions,
+                "金額": [2000, 500, 1000, 40000, 300, 2100],
+                "現地通貨建て金額": [np.nan, np.nan, np.nan, np.nan, np.nan, 21.0],
+                "通貨": [np.nan, np.nan, np.nan, np.nan, np.nan, "USD"],
+            }
+        )
+
+    @pytest.fixture
+    def merchants_df(self):
+        return pd.DataFrame(
+            {
+                "merchant_name": ["AMAZON WEB SERVICES", "GITHUB INC", "ZOOM", "コンビニ"],
+                "is_corporate": [3, 3, 3, 2],
+                "category": ["cloud_services", "developer_tools", "developer_tools", "コンビニ"],
+            }
+        )
+
+    def test_dtypes(self, preprocessed_df, merchants_df):
+        """繰り返しの多い文字列はカテゴリ型、フラグは int8、金額は収まる最小の整数型になる"""
+        compact_df = main.compact_transaction_data(preprocessed_df)
+        compact_df = main.identify_corporate_transactions(compact_df, merchants_df)
+
+        for column in ("ご利用内容", "通貨", "merchant_category"):
+            assert isinstance(compact_df[column].dtype, pd.CategoricalDtype)
+            # カテゴリは文字列順（groupby の結果が変換前と同じ順序になる）
+            categories = compact_df[column].cat.categories.tolist()
+            assert categories == sorted(categories)
+        assert compact_df["is_corporate"].dtype == np.int8
+        assert compact_df["金額"].dtype == np.int32
+        assert compact_df["金額"].tolist() == preprocessed_df["金額"].tolist()
+
+    def test_same_results_as_object_columns(self, preprocessed_df, merchants_df):
+        """変換前と同じ判定・集計結果になる"""
+        expected_df = main.identify_corporate_transactions(preprocessed_df.copy(), merchants_df)
+        compact_df = main.identify_corporate_transactions(
+            main.compact_transaction_data(preprocessed_df), merchants_df
+        )
+
+        pd.testing.assert_frame_equal(
+            compact_df.astype(expected_df.dtypes.to_dict()), expected_df
+        )
+        for analyze in (
+            main.analyze_transaction_frequency,
+            main.analyze_corporate_transactions,
+            main.get_foreign_transactions,
+        ):
+            assert analyze(compact_df).to_csv() == analyze(expected_df).to_csv()
+
+    def test_memory_is_reduced(self, preprocessed_df, merchants_df):
+        """繰り返しの多いデータではメモリ使用量が減る"""
+        df = pd.concat([preprocessed_df] * 1000, ignore_index=True)
+        expected_df = main.identify_corporate_transactions(df.copy(), merchants_df)
+        compact_df = main.identify_corporate_transactions(
+            main.compact_transaction_data(df), merchants_df
+        )
+
+        compact_bytes = compact_df.memory_usage(deep=True).sum()
+        assert compact_bytes < expected_df.memory_usage(deep=True).sum() / 3
+
+
+class TestLoadTransactionData:
+    """明細CSV読み込みのテスト"""
+
+    @pytest.fixture
+    def data_dir(self, tmp_path):
+        """CP932で保存した明細CSVを含むディレクトリ"""
+        files = {
+            "b.csv": [
+                "2024/01/05,AMAZON WEB SERVICES,\"12,500\",",
+                "2023/12/30,GITHUB INC,\"4,800\",",
+            ],
+            "a.csv": [
+                "2024/01/05,ZOOM.US,\"2,000\",\"20.00 USD\"",
+                "2024/01/03,セブンイレブン,680,",
+            ],
+        }
+        for name, rows in files.items():
+            content = "ご利用日,ご利用内容,金額,海外通貨利用金額\n" + "\n".join(rows) + "\n"
+            (tmp_path / name).write_bytes(content.encode("cp932"))
+        return str(tmp_path)
+
+    def test_rows_sorted_by_date_in_stable_order(self, data_dir):
+        """ファイル名順に結合し、同じ日付の行は結合順のまま並ぶ"""
+        result_df = main.load_transaction_data(data_dir)
+
+        assert result_df["ご利用内容"].tolist() == [
+            "GITHUB INC",
+            "セブンイレブン",
+            "ZOOM.US",
+            "AMAZON WEB SERVICES",
+        ]
+
+    @pytest.mark.parametrize("executor", ["thread", "process"])
+    def test_parallel_matches_serial(self, data_dir, executor):
+        """並列読み込みの結果が逐次読み込み＋前処理と一致する"""
+        expected = main.preprocess_transaction_data(main.load_transaction_data(data_dir))
+
+        with patch("main.LOAD_EXECUTOR", executor):
+            result_df = main.load_transaction_data(data_dir, workers=2, preprocess=True)
+
+        pd.testing.assert_frame_equal(result_df, expected)
+
+    def test_broken_file_is_reported_as_warning(self, data_dir, capsys):
+        """読み込めないファイルは警告を表示してスキップされる"""
+        # 明細の列がないファイル
+        with open(os.path.join(data_dir, "c.csv"), "w", encoding="cp932") as f:
+            f.write("foo,bar\n1,2\n")
+
+        result_df = main.load_transaction_data(data_dir, workers=2, preprocess=True)
+
+        assert "警告: ファイル c.csv の読み込み中にエラーが発生しました" in capsys.readouterr().out
+        assert len(result_df) == 3
+
+
+class TestAnalysisPeriod:
+    """分析対象期間のテスト"""
+
+    @pytest.mark.parametrize(
+        "target_year, expected",
+        [
+            ("2024", ("2024-01-01", "2024-12-31")),
+            ("202", ("2020-01-01", "2029-12-31")),
+            ("", None),
+        ],
+    )
+    def test_target_year(self, target_year, expected):
+        """TARGET_YEAR は年の先頭の桁として期間に変換される"""
+        with patch("main.TARGET_YEAR", target_year):
+            period = main.analysis_period()
+
+        if expected is None:
+            assert period is None
+        else:
+            assert period == (pd.Timestamp(expected[0]), pd.Timestamp(expected[1]))
+
+    def test_date_range_overrides_target_year(self):
+        """DATE_FROM / DATE_TO を指定すると両端を含む期間で絞り込まれる"""
+        df = pd.DataFrame(
+            {
+                "ご利用日": ["2023/12/31", "2024/3/1", "2024/03/31", "2024/04/01"],
+                "ご利用内容": ["A", "B", "C", "D"],
+                "金額": ["1", "2", "3", "4"],
+                "海外通貨利用金額": pd.Series([np.nan] * 4, dtype=object),
+            }
+        )
+
+        with patch("main.DATE_FROM", "2024/03/01"), patch("main.DATE_TO", "2024/03/31"):
+            result_df = main.preprocess_transaction_data(df)
+
+        assert result_df["ご利用内容"].tolist() == ["B", "C"]
+        assert pd.api.types.is_datetime64_any_dtype(result_df["ご利用日"])
+
+    def test_load_sorts_by_date_not_by_string(self, tmp_path):
+        """ご利用日は日付として並べ替えられる"""
+        content = "ご利用日,ご利用内容,金額,海外通貨利用金額\n2024/10/01,B,100,\n2024/9/30,A,100,\n"
+        (tmp_path / "a.csv").write_bytes(content.encode("cp932"))
+
+        result_df = main.load_transaction_data(str(tmp_path))
+
+        assert result_df["ご利用内容"].tolist() == ["A", "B"]
+
+    def test_skip_files_outside_period(self, tmp_path, capsys):
+        """先頭行と末尾行の日付が期間外のファイルは読み込まれない"""
+        header = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+        (tmp_path / "2023.csv").write_bytes(
+            (header + "2023/01/05,OLD,100,\n2023/12/20,OLD,100,\n").encode("cp932")
+        )
+        (tmp_path / "2024.csv").write_bytes(
+            (header + "2023/12/28,NEW,100,\n2024/01/20,NEW,100,\n").encode("cp932")
+        )
+        period = (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-12-31"))
+
+        assert main.peek_date_range(str(tmp_path / "2024.csv")) == (
+            pd.Timestamp("2023-12-28"),
+            pd.Timestamp("2024-01-20"),
+        )
+        with patch("main.SKIP_FILES_OUTSIDE_PERIOD", True):
+            result_df = main.load_transaction_data(str(tmp_path), period=period)
+
+        assert "対象期間外のためスキップしたファイル: ['2023.csv']" in capsys.readouterr().out
+        # 期間と重なるファイルは全行が読み込まれ、行単位の絞り込みは前処理で行う
+        assert result_df["ご利用内容"].tolist() == ["NEW", "NEW"]
+
+
 class TestMainFunction:
     """メイン関数のテスト"""
 
@@ -248,15 +463,15 @@ class TestMainFunction:
     @patch("main.load_transaction_data")
     @patch("main.preprocess_transaction_data")
     @patch("main.identify_corporate_transactions")
-    @patch("main.analyze_transaction_frequency")
-    @patch("main.analyze_corporate_transactions")
-    @patch("main.get_foreign_transactions")
+    @patch("main.AggregateState")
     @patch("pandas.DataFrame.to_csv", MagicMock())  # to_csvをモックするが、呼び出し回数は検証しない
+    @patch("main.ResultWriter", MagicMock())  # モックのデータは結果ファイルに書き出さない
+    @patch("main.CLASSIFICATION_CACHE_PATH", None)  # 分類キャッシュは使用しない
+    @patch("main.INGEST_CACHE_DIR", None)  # 取込キャッシュは使用しない
+    @patch("main.RUN_REPORT", False)  # 実行レポートは書き出さない
     def test_main_function_with_data(
         self,
-        mock_get_foreign,
-        mock_analyze_corporate,
-        mock_analyze_frequency,
+        mock_aggregate_state,
         mock_identify,
         mock_preprocess,
         mock_load_transaction,
@@ -278,14 +493,7 @@ class TestMainFunction:
         mock_identified_df = MagicMock()
         mock_identify.return_value = mock_identified_df
 
-        mock_frequency_df = MagicMock()
-        mock_analyze_frequency.return_value = mock_frequency_df
-
-        mock_corporate_df = MagicMock()
-        mock_analyze_corporate.return_value = mock_corporate_df
-
-        mock_foreign_df = MagicMock()
-        mock_get_foreign.return_value = mock_foreign_df
+        mock_state = mock_aggregate_state.from_frame.return_value
 
         # メイン関数を実行
         main.main()
@@ -293,14 +501,21 @@ class TestMainFunction:
         # 各関数が呼び出されたことを検証
         mock_load_merchant.assert_called_once()
         mock_load_transaction.assert_called_once()
-        mock_preprocess.assert_called_once_with(mock_transaction_df)
-        mock_identify.assert_called_once_with(mock_preprocessed_df, mock_merchants_df)
-        mock_analyze_frequency.assert_called_once_with(mock_identified_df)
-        mock_analyze_corporate.assert_called_once_with(mock_identified_df)
-        mock_get_foreign.assert_called_once_with(mock_identified_df)
+        mock_preprocess.assert_called_once_with(mock_transaction_df, main.analysis_period())
+        mock_identify.assert_called_once_with(mock_preprocessed_df, mock_merchants_df, None)
+        # 取引先ごと・カテゴリごと・期間ごとの集計と海外取引の抽出は1回の集計から作られる
+        mock_aggregate_state.from_frame.assert_called_once_with(
+            mock_identified_df, main.ROLLUP_PERIODS
+        )
+        mock_state.transaction_frequency.assert_called_once_with(main.TOP_MERCHANTS)
+        mock_state.corporate_summary.assert_called_once_with()
+        mock_state.foreign_transactions.assert_called_once_with()
+        assert mock_state.rollup.call_count == len(main.ROLLUP_PERIODS)
 
     @patch("main.load_merchant_config")
     @patch("main.load_transaction_data")
+    @patch("main.CLASSIFICATION_CACHE_PATH", None)
+    @patch("main.INGEST_CACHE_DIR", None)
     def test_main_function_no_data(self, mock_load_transaction, mock_load_merchant):
         """データがない場合のメイン関数のテスト"""
         # モックの戻り値を設定
@@ -318,6 +533,149 @@ class TestMainFunction:
         mock_load_transaction.assert_called_once()
         # データがないので、他の処理関数は呼び出されないはず
 
+    @patch("main.load_merchant_config")
+    @patch("main.load_transaction_data")
+    def test_main_function_production_environment_missing(
+        self, mock_load_transaction, mock_load_merchant, tmp_path
+    ):
+        """実データモードで入力ファイルがない場合は何も作成せずに終了する"""
+        data_dir = tmp_path / "data"
+
+        status = main.main(
+            data_dir=str(data_dir),
+            merchant_config=str(tmp_path / "merchants" / "merchants.csv"),
+            result_dir=str(tmp_path / "results"),
+            mode_test=False,
+        )
+
+        assert status == 1
+        assert not data_dir.exists()
+        assert not (tmp_path / "results").exists()
+        mock_load_transaction.assert_not_called()
+
+    @patch("main.CLASSIFICATION_CACHE_PATH", None)
+    @patch("main.INGEST_CACHE_DIR", None)
+    def test_main_function_with_arguments(self, tmp_path):
+        """引数で指定した入力・出力先と対象年で分析する"""
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        (data_dir / "a.csv").write_bytes(
+            (
+                "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+                "2023/12/31,A,100,\n2024/01/01,B,200,\n"
+            ).encode("cp932")
+        )
+        result_dir = tmp_path / "results"
+
+        status = main.main(
+            data_dir=str(data_dir),
+            merchant_config=str(tmp_path / "missing.csv"),
+            result_dir=str(result_dir),
+            target_year="2023",
+        )
+
+        assert status == 0
+        result_df = pd.read_csv(result_dir / "concatenated.csv")
+        assert result_df["ご利用内容"].tolist() == ["A"]
+
+    @patch("main.CLASSIFICATION_CACHE_PATH", None)
+    @patch("main.INGEST_CACHE_DIR", None)
+    @patch("main.RUN_REPORT", False)
+    @patch("main.OUTPUTS", ["concatenated"])
+    @patch("main.OUTPUT_WORKERS", 2)
+    def test_only_requested_outputs(self, tmp_path):
+        """OUTPUTS で指定した結果だけを書き出し、書き出さない結果の集計は行わない"""
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        (data_dir / "a.csv").write_bytes(
+            "ご利用日,ご利用内容,金額,海外通貨利用金額\n2024/01/01,B,200,\n".encode("cp932")
+        )
+        result_dir = tmp_path / "results"
+
+        with patch("main.AggregateState") as mock_aggregate_state:
+            status = main.main(
+                data_dir=str(data_dir),
+                merchant_config=str(tmp_path / "missing.csv"),
+                result_dir=str(result_dir),
+            )
+
+        assert status == 0
+        assert os.listdir(result_dir) == ["concatenated.csv"]
+        mock_aggregate_state.from_frame.assert_not_called()
+
+
+class TestPartitions:
+    """複数期間の一括分析のテスト"""
+
+    def test_partition_periods(self):
+        """年のリストと名前付きの期間の辞書を期間に変換する"""
+        assert main.partition_periods(["2023", 2024]) == [
+            ("2023", (pd.Timestamp("2023-01-01"), pd.Timestamp("2023-12-31"))),
+            ("2024", (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-12-31"))),
+        ]
+        assert main.partition_periods({"Q1": ("2024/01/01", "2024/03/31"), "all": (None, None)}) == [
+            ("Q1", (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-03-31"))),
+            ("all", (pd.Timestamp.min, pd.Timestamp.max)),
+        ]
+        assert main.partition_periods(None) == []
+
+    def test_partition_frame(self):
+        """ご利用日順の取引データからは、両端を含む期間の行を切り出す"""
+        df = pd.DataFrame(
+            {"ご利用日": pd.to_datetime(["2023-12-31", "2024-01-01", "2024-03-31", "2024-04-01"])}
+        )
+        period = (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-03-31"))
+
+        assert main.partition_frame(df, period).index.tolist() == [1, 2]
+        assert main.partition_frame(df.iloc[::-1], period).index.tolist() == [2, 1]
+
+    @patch("main.CLASSIFICATION_CACHE_PATH", None)
+    @patch("main.INGEST_CACHE_DIR", None)
+    @patch("main.RUN_REPORT", False)
+    @pytest.mark.parametrize("workers, executor", [(1, "process"), (2, "thread")])
+    def test_same_results_as_separate_runs(self, tmp_path, workers, executor):
+        """期間ごとの結果が、年ごとに実行した場合と同じになる"""
+        data_dir = tmp_path / "data"
+        data_dir.mkdir()
+        (data_dir / "a.csv").write_bytes(
+            (
+                "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+                "2023/12/31,A,100,\n2024/01/01,B,200,\n2024/06/01,A,300,\n2022/05/01,C,50,\n"
+            ).encode("cp932")
+        )
+        run = partial(main.main, data_dir=str(data_dir), merchant_config=str(tmp_path / "missing.csv"))
+        for year in ("2023", "2024"):
+            assert run(result_dir=str(tmp_path / "separate" / year), target_year=year) == 0
+
+        with patch("main.PARTITION_WORKERS", workers), patch("main.PARTITION_EXECUTOR", executor):
+            assert run(result_dir=str(tmp_path / "partitions"), partitions=["2023", "2024"]) == 0
+
+        assert sorted(os.listdir(tmp_path / "partitions")) == ["2023", "2024"]
+        for year in ("2023", "2024"):
+            for name in os.listdir(tmp_path / "separate" / year):
+                assert (tmp_path / "partitions" / year / name).read_bytes() == (
+                    tmp_path / "separate" / year / name
+                ).read_bytes()
+
+
+class TestImport:
+    """モジュールの読み込みのテスト"""
+
+    def test_import_has_no_side_effects(self, tmp_path):
+        """main を読み込んでも表示やディレクトリの作成を行わない"""
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        result = subprocess.run(
+            [sys.executable, "-c", "import main"],
+            cwd=tmp_path,
+            env={**os.environ, "PYTHONPATH": root},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        assert result.stdout == ""
+        assert list(tmp_path.iterdir()) == []
+
 
 if __name__ == "__main__":
     pytest.main(["-v"])
@@ -0,0 +1,201 @@
+"""
+merchant_matcher のテスト
+"""
+
+import os
+import random
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from merchant_matcher import NO_MATCH, MerchantMatcher, MerchantNormalizer, build_matcher
+
+
+def naive_find_first(patterns, text):
+    """従来の iterrows と同じ順次判定"""
+    for index, pattern in enumerate(patterns):
+        if pattern in text:
+            return index
+    return NO_MATCH
+
+
+class TestMerchantMatcher:
+    """マルチパターンマッチャーのテスト"""
+
+    def test_first_rule_in_file_order_wins(self):
+        """複数のルールが一致する場合はファイル上で先のルールが採用される"""
+        matcher = MerchantMatcher(["WEB SERVICES", "AMAZON", "AMAZON WEB SERVICES"])
+
+        assert matcher.find_first("AMAZON WEB SERVICES") == 0
+        assert matcher.find_first("AMAZON.CO.JP") == 1
+
+    def test_match_found_through_fail_link(self):
+        """失敗リンク経由の一致（他のルールの途中に含まれるルール）も検出される"""
+        matcher = MerchantMatcher(["ABCX", "BC"])
+
+        assert matcher.find_first("ABCD") == 1
+        assert matcher.find_first("ZZABCX") == 0
+
+    def test_no_match_and_missing_values(self):
+        """一致しない取引内容と欠損値は NO_MATCH になる"""
+        matcher = MerchantMatcher(["GITHUB INC", np.nan])
+
+        assert matcher.find_first("コンビニ") == NO_MATCH
+        assert matcher.find_first(np.nan) == NO_MATCH
+        assert matcher.find_first("") == NO_MATCH
+
+    def test_empty_pattern_matches_everything(self):
+        """空文字列のルールは従来通りすべての取引内容に一致する"""
+        matcher = MerchantMatcher(["GITHUB INC", ""])
+
+        assert matcher.find_first("GITHUB INC") == 0
+        assert matcher.find_first("コンビニ") == 1
+
+    def test_empty_normalized_pattern_is_rejected(self, capsys):
+        """正規化すると空になるルールは、すべての取引内容に一致させずに除外する"""
+        merchants_df = pd.DataFrame({"merchant_name": ["#123", "GITHUB INC", " #7"]})
+
+        matcher = build_matcher(merchants_df, MerchantNormalizer([r"\s*#?\d+$"]))
+
+        assert matcher.empty_rules == [0, 2]
+        assert matcher.find_first("GitHub Inc") == 1
+        assert matcher.find_first("コンビニ") == NO_MATCH
+        assert "正規化すると空になる merchant_name のルールは使用しません: ['#123', ' #7']" in capsys.readouterr().out
+
+    def test_same_result_as_sequential_scan(self):
+        """ランダムなルールと取引内容で従来の順次判定と同じ結果になる"""
+        rng = random.Random(0)
+        alphabet = "ABCあいう"
+        patterns = [
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(200)
+        ]
+        texts = [
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) for _ in range(500)
+        ]
+
+        matcher = MerchantMatcher(patterns)
+
+        expected = [naive_find_first(patterns, text) for text in texts]
+        assert matcher.match_all(texts).tolist() == expected
+
+
+class TestNormalization:
+    """取引先名の正規化と完全一致のルールのテスト"""
+
+    def test_normalizer(self):
+        """全角・半角、大文字・小文字、空白の違いと指定したパターンを取り除く"""
+        normalizer = MerchantNormalizer([r"\s*#?\d+$"])
+
+        assert normalizer("ＡＭＡＺＯＮ　Web  Services #123") == "amazon web services"
+        assert normalizer("ｾﾌﾞﾝｲﾚﾌﾞﾝ 0042") == "セブンイレブン"
+
+    def test_variants_match_normalized_rules(self):
+        """表記の揺れがある取引内容も同じルールに一致する"""
+        matcher = MerchantMatcher(["Amazon Web Services", "ｾﾌﾞﾝｲﾚﾌﾞﾝ"], normalizer=MerchantNormalizer())
+
+        assert matcher.find_first("ＡＭＡＺＯＮ WEB SERVICES") == 0
+        assert matcher.find_first("セブンイレブン 渋谷店") == 1
+        assert MerchantMatcher(["Amazon Web Services"]).find_first("AMAZON WEB SERVICES") == NO_MATCH
+
+    def test_exact_rules(self):
+        """完全一致のルールは取引内容全体が一致する場合だけ採用され、ファイル順の優先度は保たれる"""
+        matcher = MerchantMatcher(
+            ["ZOOM.US", "AMAZON", "AMAZON WEB SERVICES", "GITHUB"],
+            ["contains", "exact", "exact", "contains"],
+            MerchantNormalizer(),
+        )
+
+        assert matcher.find_first("amazon") == 1
+        assert matcher.find_first("AMAZON.CO.JP") == NO_MATCH
+        assert matcher.find_first("Amazon Web Services") == 2
+        # 先に定義された部分一致のルールが優先される
+        assert matcher.find_first("ZOOM.US") == 0
+
+    def test_same_result_as_sequential_scan(self):
+        """ランダムなルールで、正規化した文字列に対する順次判定と同じ結果になる"""
+        rng = random.Random(1)
+        alphabet = "AaBｂあア"
+        normalizer = MerchantNormalizer()
+        patterns = [
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 3))) for _ in range(100)
+        ]
+        types = [rng.choice(["exact", "contains"]) for _ in patterns]
+        texts = [
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 6))) for _ in range(500)
+        ]
+
+        matcher = MerchantMatcher(patterns, types, normalizer)
+
+        expected = []
+        for text in texts:
+            text = normalizer(text)
+            expected.append(
+                next(
+                    (
+                        index
+                        for index, (pattern, match_type) in enumerate(zip(patterns, types))
+                        if (normalizer(pattern) == text if match_type == "exact" else normalizer(pattern) in text)
+                    ),
+                    NO_MATCH,
+                )
+            )
+        assert matcher.match_all(texts).tolist() == expected
+
+    def test_build_matcher_reads_match_type(self):
+        """マスターデータの match_type 列から完全一致のルールを区別する"""
+        merchants_df = pd.DataFrame(
+            {
+                "merchant_name": ["AMAZON", "AMAZON"],
+                "is_corporate": [3, 1],
+                "category": ["cloud_services", "買い物"],
+                "match_type": ["exact", np.nan],
+            }
+        )
+
+        matcher = build_matcher(merchants_df)
+
+        assert matcher.find_first("AMAZON") == 0
+        assert matcher.find_first("AMAZON.CO.JP") == 1
+
+
+class TestIdentifyCorporateTransactions:
+    """マッチャーを利用した法人取引判定のテスト"""
+
+    def test_duplicate_and_missing_descriptions(self):
+        """重複する取引内容と欠損値を含む場合も行ごとに正しく判定される"""
+        merchants_df = pd.DataFrame(
+            {
+                "merchant_name": ["AMAZON", "AMAZON WEB SERVICES"],
+                "is_corporate": [1, 3],
+                "category": ["買い物", "cloud_services"],
+            }
+        )
+        df = pd.DataFrame(
+            {"ご利用内容": ["AMAZON WEB SERVICES", "コンビニ", np.nan, "AMAZON WEB SERVICES"]}
+        )
+
+        result_df = main.identify_corporate_transactions(df, merchants_df)
+
+        assert result_df["is_corporate"].tolist() == [1, 0, 0, 1]
+        assert result_df["merchant_category"].tolist() == ["買い物", "", "", "買い物"]
+
+    def test_matched_rule(self):
+        """判定に使ったルールの merchant_name が行ごとに記録される"""
+        merchants_df = pd.DataFrame(
+            {
+                "merchant_name": ["Amazon Web Services", "GITHUB"],
+                "is_corporate": [3, 3],
+                "category": ["cloud_services", "developer_tools"],
+            }
+        )
+        df = pd.DataFrame({"ご利用内容": ["ＡＭＡＺＯＮ WEB SERVICES", "GitHub Inc", "コンビニ"]})
+
+        with patch("main.MERCHANT_NORMALIZATION", True):
+            result_df = main.identify_corporate_transactions(df, merchants_df)
+
+        assert result_df["matched_rule"].tolist() == ["Amazon Web Services", "GITHUB", ""]
+        assert result_df["is_corporate"].tolist() == [3, 3, 0]
@@ -0,0 +1,184 @@
+"""
+outputs のテスト
+"""
+
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+import outputs
+from outputs import ResultWriter
+
+
+@pytest.fixture
+def transactions_df():
+    """インデックスが重複する（複数ファイルを結合した）取引データ"""
+    return pd.DataFrame(
+        {
+            "ご利用日": ["2024/01/05", "2024/01/12", "2024/02/03"],
+            "ご利用内容": ["AMAZON WEB SERVICES", "ZOOM.US", "GITHUB INC"],
+            "金額": [12500, 2000, 4800],
+            "現地通貨建て金額": [np.nan, 20.0, np.nan],
+            "通貨": [np.nan, "USD", np.nan],
+            "is_corporate": [3, 3, 3],
+            "merchant_category": ["cloud_services", "business_tools", "developer_tools"],
+        },
+        index=[0, 1, 0],
+    )
+
+
+class TestResultWriter:
+    """分析結果の書き出しのテスト"""
+
+    def test_csv_only_by_default(self, tmp_path, transactions_df):
+        """既定では CSV だけを書き出し、メタデータファイルは作らない"""
+        writer = ResultWriter(str(tmp_path))
+        writer.write("concatenated", transactions_df, index=False, partitioned=True)
+        writer.close()
+
+        assert os.listdir(tmp_path) == ["concatenated.csv"]
+
+    @pytest.mark.parametrize("fmt", ["parquet", "feather"])
+    def test_partitioned_detail(self, tmp_path, transactions_df, fmt):
+        """取引明細は年・月ごとに分割され、型を保ったまま1か月分だけ読み込める"""
+        pytest.importorskip("pyarrow")
+        writer = ResultWriter(str(tmp_path), ["csv", fmt])
+        writer.write("concatenated", transactions_df, index=False, partitioned=True)
+        writer.close()
+
+        path = tmp_path / f"concatenated.{fmt}" / "year=2024" / "month=01" / f"part-0.{fmt}"
+        january = pd.read_parquet(path) if fmt == "parquet" else pd.read_feather(path)
+        assert january["ご利用内容"].tolist() == ["AMAZON WEB SERVICES", "ZOOM.US"]
+        assert january["金額"].dtype == np.int64
+        assert january["現地通貨建て金額"].dtype == np.float64
+
+        metadata = json.loads((tmp_path / outputs.METADATA_NAME).read_text(encoding="utf-8"))
+        entry = metadata["outputs"]["concatenated"]
+        assert entry["rows"] == 3
+        assert entry["partitioning"] == ["year", "month"]
+        assert entry["columns"]["金額"] == "int64"
+        assert entry["files"][fmt] == [
+            f"concatenated.{fmt}/year=2024/month=01/part-0.{fmt}",
+            f"concatenated.{fmt}/year=2024/month=02/part-0.{fmt}",
+        ]
+
+    def test_summary_keeps_index_as_column(self, tmp_path, transactions_df):
+        """集計結果はインデックスを列として書き出す"""
+        pytest.importorskip("pyarrow")
+        grouped = main.analyze_transaction_frequency(transactions_df)
+        writer = ResultWriter(str(tmp_path), ["parquet"])
+        writer.write("grouped", grouped)
+        writer.close()
+
+        result = pd.read_parquet(tmp_path / "grouped.parquet")
+        assert result.columns.tolist() == ["ご利用内容", "回数", "合計金額", "法人取引", "カテゴリ"]
+        assert not (tmp_path / "grouped.csv").exists()
+
+    def test_stale_partitions_are_removed(self, tmp_path, transactions_df):
+        """前回の実行で書き出した月のディレクトリは残らない"""
+        pytest.importorskip("pyarrow")
+        ResultWriter(str(tmp_path), ["parquet"]).write("foreign", transactions_df, False, True)
+        ResultWriter(str(tmp_path), ["parquet"]).write("foreign", transactions_df.iloc[:1], False, True)
+
+        assert os.listdir(tmp_path / "foreign.parquet" / "year=2024") == ["month=01"]
+
+    def test_fallback_to_csv_without_pyarrow(self, monkeypatch, capsys):
+        """pyarrow がない場合は警告を表示して CSV に置き換える"""
+        monkeypatch.setattr(outputs, "PYARROW_AVAILABLE", False)
+
+        assert outputs.resolve_formats(["parquet", "csv"]) == ["csv"]
+        assert "pyarrow がインストールされていない" in capsys.readouterr().out
+
+    def test_unknown_format(self):
+        """未対応の形式はエラーになる"""
+        with pytest.raises(ValueError):
+            outputs.resolve_formats(["xlsx"])
+
+
+class TestWriteOptions:
+    """圧縮・並列書き出し・一時ファイル経由の置き換え・出力の選択のテスト"""
+
+    def test_gzip(self, tmp_path, transactions_df):
+        """gzip で圧縮した CSV は元の CSV と同じ内容で、前回の非圧縮のファイルは削除される"""
+        ResultWriter(str(tmp_path)).write("concatenated", transactions_df, index=False)
+        expected = (tmp_path / "concatenated.csv").read_bytes()
+
+        ResultWriter(str(tmp_path), compression="gzip").write("concatenated", transactions_df, index=False)
+        first = (tmp_path / "concatenated.csv.gz").read_bytes()
+        ResultWriter(str(tmp_path), compression="gzip").write("concatenated", transactions_df, index=False)
+
+        assert os.listdir(tmp_path) == ["concatenated.csv.gz"]
+        assert gzip.decompress(first) == expected
+        # 同じ内容なら同じファイルになる（gzip のヘッダーに更新日時を記録しない）
+        assert (tmp_path / "concatenated.csv.gz").read_bytes() == first
+
+    def test_zstd(self, tmp_path, transactions_df):
+        """zstd で圧縮した CSV も pandas でそのまま読み込める"""
+        pytest.importorskip("zstandard")
+        ResultWriter(str(tmp_path), compression="zstd").write("concatenated", transactions_df, index=False)
+
+        assert pd.read_csv(tmp_path / "concatenated.csv.zst")["金額"].tolist() == [12500, 2000, 4800]
+
+    def test_zstd_fallback(self, monkeypatch, capsys):
+        """zstandard がない場合は警告を表示して gzip で圧縮する"""
+        monkeypatch.setattr(outputs, "ZSTD_AVAILABLE", False)
+
+        assert outputs.resolve_compression("zstd") == "gzip"
+        assert "zstandard がインストールされていない" in capsys.readouterr().out
+        with pytest.raises(ValueError):
+            outputs.resolve_compression("bz2")
+
+    def test_parallel_writes(self, tmp_path, transactions_df):
+        """並列に書き出しても、順に書き出した場合と同じファイルとメタデータになる"""
+        formats = ["csv", "parquet"] if outputs.PYARROW_AVAILABLE else ["csv"]
+        grouped = main.analyze_transaction_frequency(transactions_df)
+        for workers in (1, 4):
+            writer = ResultWriter(str(tmp_path / str(workers)), formats, workers=workers)
+            os.makedirs(writer.result_dir)
+            writer.write("concatenated", transactions_df, index=False, partitioned=True)
+            writer.write("grouped", grouped)
+            writer.close()
+
+        for name in ("concatenated.csv", "grouped.csv"):
+            assert (tmp_path / "4" / name).read_bytes() == (tmp_path / "1" / name).read_bytes()
+        if outputs.PYARROW_AVAILABLE:
+            metadata = [
+                json.loads((tmp_path / workers / outputs.METADATA_NAME).read_text(encoding="utf-8"))
+                for workers in ("1", "4")
+            ]
+            assert metadata[0]["outputs"] == metadata[1]["outputs"]
+            assert list(metadata[1]["outputs"]) == ["concatenated", "grouped"]
+
+    def test_failed_write_keeps_previous_file(self, tmp_path, transactions_df, monkeypatch):
+        """書き出しの途中でエラーになった場合は、前回の結果が残り、一時ファイルは残らない"""
+        ResultWriter(str(tmp_path)).write("grouped", transactions_df)
+        expected = (tmp_path / "grouped.csv").read_bytes()
+
+        def broken_to_csv(self, path, **kwargs):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("ご利用日,")
+            raise OSError("disk full")
+
+        monkeypatch.setattr(pd.DataFrame, "to_csv", broken_to_csv)
+        with pytest.raises(OSError):
+            ResultWriter(str(tmp_path)).write("grouped", transactions_df)
+
+        assert os.listdir(tmp_path) == ["grouped.csv"]
+        assert (tmp_path / "grouped.csv").read_bytes() == expected
+
+    def test_requested_outputs(self, tmp_path, transactions_df):
+        """指定していない出力名の結果は書き出さない"""
+        writer = ResultWriter(str(tmp_path), outputs=["grouped"])
+        writer.write("concatenated", transactions_df, index=False)
+        writer.write("grouped", transactions_df)
+        writer.close()
+
+        assert not writer.requested("concatenated")
+        assert os.listdir(tmp_path) == ["grouped.csv"]
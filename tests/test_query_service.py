@@ -0,0 +1,195 @@
+"""
+query_service のテスト
+"""
+
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from query_service import QueryService, QueryWatcher, TransactionIndex, make_server
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+
+
+def write_statement(path, rows):
+    path.write_bytes((HEADER + "\n".join(rows) + "\n").encode("cp932"))
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_statement(
+        data_dir / "2024_01.csv",
+        [
+            '2024/01/05,AMAZON WEB SERVICES,"12,500",',
+            '2024/01/12,ZOOM.US,"2,000","20.00 USD"',
+            "2024/01/05,セブンイレブン,680,",
+            "2024/01/20,セブンイレブン,320,",
+        ],
+    )
+    write_statement(
+        data_dir / "2024_02.csv",
+        [
+            '2024/02/03,GITHUB INC,"4,800",',
+            '2024/02/10,ZOOM.US,"2,100","21.00 USD"',
+            '2024/02/11,HOTEL PARIS,"15,000","90.00 EUR"',
+            "2024/02/12,不明な店,300,",
+        ],
+    )
+    merchant_config = tmp_path / "merchants.csv"
+    merchant_config.write_bytes(
+        (
+            "merchant_name,is_corporate,category\n"
+            "AMAZON,3,cloud_services\nGITHUB,3,developer_tools\nZOOM,3,business_tools\nセブンイレブン,2,コンビニ\n"
+        ).encode("cp932")
+    )
+    monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+    monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+    return data_dir, merchant_config
+
+
+@pytest.fixture
+def service(paths):
+    data_dir, merchant_config = paths
+    service = QueryService(cache_size=2)
+    watcher = QueryWatcher(service, str(data_dir), str(merchant_config), main.analysis_period("2024"))
+    watcher.start()
+    service.watcher = watcher
+    return service
+
+
+def classified(paths):
+    """main() と同じ手順で読み込み・法人取引判定した取引データ"""
+    data_dir, merchant_config = paths
+    df = main.preprocess_transaction_data(main.load_transaction_data(str(data_dir)), main.analysis_period("2024"))
+    return main.identify_corporate_transactions(
+        main.compact_transaction_data(df), main.load_merchant_config(path=str(merchant_config))
+    )
+
+
+class TestTransactionIndex:
+    """索引のテスト"""
+
+    def test_select_matches_filtering(self, paths):
+        """索引と二分探索で取り出した行が、全行を絞り込んだ結果と同じになる"""
+        df = classified(paths)
+        index = TransactionIndex(df)
+        start, end = pd.Timestamp("2024-01-05"), pd.Timestamp("2024-02-10")
+
+        selected = index.select(start, end, category="business_tools", is_corporate=3)
+
+        dates = df["ご利用日"]
+        expected = df[dates.between(start, end) & (df["merchant_category"] == "business_tools")]
+        assert selected["ご利用日"].tolist() == expected["ご利用日"].tolist()
+        assert selected["金額"].tolist() == [2000, 2100]
+        assert index.select(merchant="存在しない店").empty
+        assert len(index.select(end=pd.Timestamp("2024-01-05"))) == 2
+
+
+class TestQueryService:
+    """問い合わせのテスト"""
+
+    def test_top_merchants_matches_grouped(self, service, paths):
+        """期間を指定しない上位の取引先は grouped.csv と同じ内容になる"""
+        grouped = main.analyze_transaction_frequency(classified(paths)).reset_index()
+
+        rows = service.query("top_merchants", {"limit": "100"})["rows"]
+
+        assert [row["ご利用内容"] for row in rows] == grouped["ご利用内容"].tolist()
+        assert [row["合計金額"] for row in rows] == grouped["合計金額"].tolist()
+        top = service.query("top_merchants", {"start": "2024-02-01", "limit": "1", "sort": "amount"})
+        assert top["rows"] == [
+            {"ご利用内容": "HOTEL PARIS", "回数": 1, "合計金額": 15000, "法人取引": 0, "カテゴリ": ""}
+        ]
+
+    def test_other_queries(self, service):
+        """カテゴリ × 月、法人取引のカテゴリ、通貨ごとの集計と取引の一覧に答える"""
+        totals = service.query("category_totals", {"category": "コンビニ"})["rows"]
+        assert totals == [{"期間": "2024-01", "merchant_category": "コンビニ", "回数": 2, "合計金額": 1000}]
+
+        summary = service.query("corporate_summary", {"end": "2024-01-31"})["rows"]
+        assert {row["merchant_category"]: row["合計金額"] for row in summary} == {
+            "business_tools": 2000,
+            "cloud_services": 12500,
+        }
+
+        currencies = service.query("foreign_by_currency", {})["rows"]
+        assert currencies == [
+            {"通貨": "EUR", "回数": 1, "合計金額": 15000, "現地通貨建て金額": 90.0},
+            {"通貨": "USD", "回数": 2, "合計金額": 4100, "現地通貨建て金額": 41.0},
+        ]
+
+        transactions = service.query("transactions", {"currency": "USD", "limit": "1"})["rows"]
+        assert len(transactions) == 1
+        assert transactions[0]["ご利用日"] == "2024/01/12"
+        assert transactions[0]["matched_rule"] == "ZOOM"
+
+    def test_invalid_queries(self, service):
+        """未対応の問い合わせや条件はエラーになる"""
+        with pytest.raises(KeyError):
+            service.query("unknown", {})
+        for params in ({"color": "red"}, {"limit": "ten"}, {"start": "yesterday?"}, {"sort": "name"}):
+            with pytest.raises(ValueError):
+                service.query("top_merchants", params)
+
+    def test_cache(self, service):
+        """同じ問い合わせはキャッシュから答え、古いものから破棄する"""
+        first = service.query("top_merchants", {"limit": "3"})
+        assert service.query("top_merchants", {"limit": "3"}) is first
+        service.query("transactions", {})
+        service.query("foreign_by_currency", {})
+
+        assert service.query("top_merchants", {"limit": "3"}) is not first
+        assert service.status()["cache"] == {"entries": 2, "hits": 1, "misses": 4}
+
+    def test_data_change_invalidates_cache(self, service, paths):
+        """明細が追加されると索引を作り直し、キャッシュを破棄する"""
+        data_dir, _ = paths
+        before = service.query("foreign_by_currency", {})
+
+        write_statement(data_dir / "2024_03.csv", ['2024/03/01,ZOOM.US,"2,200","22.00 USD"'])
+        assert not service.watcher.poll()
+        assert service.watcher.poll()
+
+        after = service.query("foreign_by_currency", {})
+        assert after is not before
+        assert after["rows"][1]["回数"] == 3
+        assert service.status()["rows"] == 9
+
+
+class TestHttpServer:
+    """HTTP サーバーのテスト"""
+
+    def test_json_responses(self, service):
+        """GET /<問い合わせの名前>?<条件> に JSON で答え、エラーは 404 / 400 で返す"""
+        server = make_server(service, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = "http://127.0.0.1:%d" % server.server_address[1]
+
+        def get(path):
+            try:
+                with urllib.request.urlopen(base + path) as response:
+                    return response.status, json.loads(response.read().decode("utf-8"))
+            except urllib.error.HTTPError as e:
+                return e.code, json.loads(e.read().decode("utf-8"))
+
+        try:
+            status, body = get("/top_merchants?limit=1&category=cloud_services")
+            assert status == 200
+            assert body["rows"][0]["ご利用内容"] == "AMAZON WEB SERVICES"
+            assert get("/status")[1]["rows"] == 8
+            assert get("/unknown")[0] == 404
+            assert get("/transactions?limit=-1")[0] == 400
+        finally:
+            server.shutdown()
+            server.server_close()
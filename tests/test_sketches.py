@@ -0,0 +1,169 @@
+"""
+sketches（近似集計）のテスト
+"""
+
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from aggregation import AggregateState
+from benchmarks.synthetic_data import generate_dataset
+from sketches import DistinctCounter, HeavyHitters
+
+
+def skewed(rows, keys, seed=0):
+    """少数のキーに偏った (キー, 金額) を作る"""
+    rng = np.random.default_rng(seed)
+    names = pd.Series([f"店舗{i:05d}" for i in rng.zipf(1.3, rows) % keys])
+    amounts = pd.Series(rng.integers(100, 10000, rows))
+    return names, amounts
+
+
+def assert_within_bounds(sketch, exact):
+    """すべてのキーで 推定値 <= 真の値 <= 推定値 + error が成り立ち、error が理論上の上限以下であることを確認する"""
+    estimates = sketch.counters.reindex(exact.index, fill_value=0)
+    assert (estimates <= exact).all()
+    assert (exact <= estimates + sketch.error).all()
+    assert sketch.error <= sketch.total / (sketch.capacity + 1)
+    assert len(sketch.counters) <= sketch.capacity
+
+
+class TestHeavyHitters:
+    """上位のキーの要約のテスト"""
+
+    @pytest.mark.parametrize("weighted", [False, True])
+    def test_bounds_against_exact(self, weighted):
+        """チャンクごとの要約を結合しても、正確な集計に対する誤差が保証の範囲に収まる"""
+        names, amounts = skewed(50000, 5000)
+        weights = amounts if weighted else pd.Series(1, index=names.index)
+        exact = weights.groupby(names).sum()
+
+        sketch = HeavyHitters(100)
+        for start in range(0, len(names), 3000):
+            chunk = HeavyHitters(100)
+            chunk.update(names[start : start + 3000], amounts[start : start + 3000] if weighted else None)
+            sketch.merge(chunk)
+
+        assert sketch.total == exact.sum()
+        assert_within_bounds(sketch, exact)
+        # 合計 / (capacity + 1) を超える値のキーは必ず残る
+        assert set(exact[exact > sketch.error].index) <= set(sketch.counters.index)
+        # 上位の順位は正確な集計と一致する
+        top = sketch.top(5)
+        assert top.index.tolist() == exact.nlargest(5).index.tolist()
+        assert (top["上限"] - top["推定値"] == sketch.error).all()
+
+    def test_exact_below_capacity(self):
+        """キーの種類が capacity 以下なら正確な値になる"""
+        names, _ = skewed(2000, 30)
+        sketch = HeavyHitters(30)
+        sketch.update(names)
+
+        assert sketch.error == 0
+        assert sketch.counters.sort_index().to_dict() == names.value_counts().sort_index().to_dict()
+
+
+class TestDistinctCounter:
+    """種類数の推定のテスト"""
+
+    def test_relative_error(self):
+        """グループごとの推定値の誤差が、相対標準誤差の4倍以内に収まる"""
+        rng = np.random.default_rng(0)
+        groups = pd.Series(rng.integers(0, 4, 200000)).astype(str)
+        values = pd.Series(rng.integers(0, 50000, 200000)).astype(str)
+        exact = values.groupby(groups).nunique()
+
+        counter = DistinctCounter(12)
+        for start in range(0, len(values), 30000):
+            other = DistinctCounter(12)
+            other.update([groups[start : start + 30000]], values[start : start + 30000])
+            counter.merge(other)
+
+        estimates = counter.estimates()
+        relative = (estimates.to_numpy() - exact.to_numpy()) / exact.to_numpy()
+        assert np.abs(relative).max() < 4 * 1.04 / np.sqrt(2**12)
+
+    def test_small_counts(self):
+        """種類数が少ない場合は線形計数でほぼ正確な値になる"""
+        counter = DistinctCounter(12)
+        counter.update([pd.Series(["A"] * 6 + ["B"] * 2)], pd.Series(list("abcabc") + ["x", "x"]))
+
+        assert counter.estimates().to_dict() == {("A",): 3, ("B",): 1}
+
+
+class TestTopMerchants:
+    """正確な上位の取引先のテスト"""
+
+    def test_top_matches_full_sort(self):
+        """上位だけを選んだ結果が、全体を（安定に）並べ替えた先頭と一致する"""
+        names, amounts = skewed(20000, 3000)
+        df = pd.DataFrame(
+            {"ご利用内容": names, "金額": amounts, "merchant_category": "", "is_corporate": 0}
+        )
+        state = AggregateState.from_frame(df, keep_foreign=False)
+
+        for by in ("回数", "合計金額"):
+            pd.testing.assert_frame_equal(
+                state.transaction_frequency(50, by), state.transaction_frequency(by=by).head(50)
+            )
+
+    def test_ties_follow_description_order(self):
+        """同じ回数の取引先は取引内容の順に並び、上位だけを選んでも全体の先頭と一致する"""
+        names = ["D", "B", "C", "A", "E", "B", "D", "F", "C", "A"]
+        df = pd.DataFrame({"ご利用内容": names, "金額": 100, "merchant_category": "", "is_corporate": 0})
+        state = AggregateState.from_frame(df, keep_foreign=False)
+
+        full = state.transaction_frequency()
+        assert full.index.tolist() == ["A", "B", "C", "D", "E", "F"]
+        for top in range(1, 7):
+            pd.testing.assert_frame_equal(state.transaction_frequency(top), full.head(top))
+
+
+class TestMainWithSketches:
+    """main() で近似集計を書き出した場合のテスト"""
+
+    @pytest.fixture
+    def paths(self, tmp_path, monkeypatch):
+        data_dir, merchant_config = generate_dataset(str(tmp_path), rows=4000, files=4, merchants=300)
+        monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+        monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+        monkeypatch.setattr(main, "RUN_REPORT", False)
+        monkeypatch.setattr(main, "APPROXIMATE_SUMMARIES", True)
+        monkeypatch.setattr(main, "SKETCH_CAPACITY", 40)
+        monkeypatch.setattr(main, "SKETCH_TOP_K", 10)
+        return tmp_path, data_dir, merchant_config
+
+    @pytest.mark.parametrize("streaming", [False, True])
+    def test_outputs_within_bounds(self, paths, streaming):
+        """top_merchants.csv の推定値と上限の間に正確な値があり、distinct_merchants.csv の誤差が小さい"""
+        tmp_path, data_dir, merchant_config = paths
+        result_dir = tmp_path / "result"
+        with patch.object(main, "STREAMING", streaming), patch.object(main, "STREAMING_CHUNK_SIZE", 500):
+            code = main.main(
+                data_dir=data_dir, merchant_config=merchant_config, result_dir=str(result_dir), target_year="2024"
+            )
+        assert code == 0
+
+        concatenated = pd.read_csv(result_dir / "concatenated.csv")
+        top = pd.read_csv(result_dir / "top_merchants.csv")
+        for name, exact in (
+            ("回数", concatenated.groupby("ご利用内容").size()),
+            ("合計金額", concatenated["金額"].clip(lower=0).groupby(concatenated["ご利用内容"]).sum()),
+        ):
+            rows = top[top["集計"] == name].set_index("ご利用内容")
+            assert rows["順位"].tolist() == list(range(1, 11))
+            truth = exact.reindex(rows.index)
+            assert (rows["推定値"] <= truth).all() and (truth <= rows["上限"]).all()
+
+        distinct = pd.read_csv(result_dir / "distinct_merchants.csv", index_col=["カテゴリ", "期間"])
+        months = pd.to_datetime(concatenated["ご利用日"]).dt.strftime("%Y-%m")
+        exact = concatenated.groupby([concatenated["merchant_category"].fillna(""), months])["ご利用内容"].nunique()
+        assert len(distinct) == len(exact)
+        # 種類数が少ないグループでは、レジスタの衝突による ±1〜2 の差がありうる
+        assert np.allclose(distinct["取引先数"].to_numpy(), exact.to_numpy(), rtol=0.05, atol=2)
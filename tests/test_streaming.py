@@ -0,0 +1,154 @@
+"""
+ストリーミングモードのテスト
+"""
+
+import gzip
+import os
+import sys
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+import streaming
+from outputs import ResultWriter
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+OUTPUTS = ["concatenated.csv", "grouped.csv", "corporate_summary.csv", "foreign.csv"]
+
+
+@pytest.fixture
+def merchants_df():
+    return pd.DataFrame(
+        {
+            "merchant_name": ["AMAZON WEB SERVICES", "GITHUB INC", "ZOOM.US", "セブンイレブン"],
+            "is_corporate": [3, 3, 3, 2],
+            "category": ["cloud_services", "developer_tools", "business_tools", "コンビニ"],
+        }
+    )
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """同じ日付の取引や対象年以外の取引を含む複数の明細"""
+    directory = tmp_path / "data"
+    directory.mkdir()
+    rows = {
+        "2024_01.csv": [
+            '2024/01/05,AMAZON WEB SERVICES,"12,500",',
+            '2024/01/03,GITHUB INC,"4,800",',
+            '2024/01/05,ZOOM.US,"2,000","20.00 USD"',
+            "2023/12/31,セブンイレブン,680,",
+            '2024/01/05,セブンイレブン,"1,080",',
+            "2024/01/09,不明な店,300,",
+        ],
+        "2024_02.csv": [
+            '2024/01/05,GITHUB INC,"4,800",',
+            '2024/02/10,ZOOM.US,"2,100","21.00 USD"',
+            '2024/02/01,AMAZON WEB SERVICES,"13,000",',
+            "2024/02/01,セブンイレブン,500,",
+        ],
+    }
+    for name, lines in rows.items():
+        (directory / name).write_bytes((HEADER + "\n".join(lines) + "\n").encode("cp932"))
+    return directory
+
+
+def run_in_memory(data_dir, merchants_df, result_dir):
+    """通常（メモリ上）の処理で結果を書き出す"""
+    df = main.load_transaction_data(str(data_dir))
+    df = main.preprocess_transaction_data(df)
+    df = main.identify_corporate_transactions(df, merchants_df)
+    writer = ResultWriter(result_dir)
+    writer.write("concatenated", df, index=False)
+    writer.write("grouped", main.analyze_transaction_frequency(df))
+    writer.write("corporate_summary", main.analyze_corporate_transactions(df))
+    writer.write("foreign", main.get_foreign_transactions(df), index=False)
+
+
+def read_outputs(result_dir):
+    outputs = {}
+    for name in OUTPUTS:
+        with open(os.path.join(result_dir, name), "rb") as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+class TestStreamTransactionAnalysis:
+    """ストリーミングモードのテスト"""
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 100])
+    def test_same_outputs_as_in_memory(self, tmp_path, data_dir, merchants_df, chunk_size):
+        """チャンクサイズによらず、通常の処理と同じ出力ファイルになる"""
+        expected_dir = tmp_path / "expected"
+        result_dir = tmp_path / "result"
+        expected_dir.mkdir()
+        result_dir.mkdir()
+
+        run_in_memory(data_dir, merchants_df, str(expected_dir))
+        assert main.stream_transaction_analysis(
+            str(data_dir), merchants_df, str(result_dir), chunk_size
+        )
+
+        assert read_outputs(result_dir) == read_outputs(expected_dir)
+        # 一時ファイルは残らない
+        assert sorted(os.listdir(result_dir)) == sorted(OUTPUTS)
+
+    def test_compressed_and_selected_outputs(self, tmp_path, data_dir, merchants_df, monkeypatch):
+        """OUTPUTS で選んだ結果だけを、OUTPUT_COMPRESSION の方法で圧縮して書き出す"""
+        expected_dir = tmp_path / "expected"
+        result_dir = tmp_path / "result"
+        expected_dir.mkdir()
+        result_dir.mkdir()
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped", "foreign"])
+        monkeypatch.setattr(main, "OUTPUT_COMPRESSION", "gzip")
+
+        run_in_memory(data_dir, merchants_df, str(expected_dir))
+        main.stream_transaction_analysis(str(data_dir), merchants_df, str(result_dir), 2)
+
+        assert sorted(os.listdir(result_dir)) == ["foreign.csv.gz", "grouped.csv.gz"]
+        for name in ("foreign.csv", "grouped.csv"):
+            assert gzip.decompress((result_dir / f"{name}.gz").read_bytes()) == (expected_dir / name).read_bytes()
+
+    def test_multi_pass_merge(self, tmp_path, data_dir, merchants_df):
+        """ランの数が同時に開ける上限を超えても同じ結果になる"""
+        expected_dir = tmp_path / "expected"
+        result_dir = tmp_path / "result"
+        expected_dir.mkdir()
+        result_dir.mkdir()
+
+        run_in_memory(data_dir, merchants_df, str(expected_dir))
+        with patch.object(streaming, "MAX_OPEN_RUNS", 3):
+            main.stream_transaction_analysis(str(data_dir), merchants_df, str(result_dir), 1)
+
+        assert read_outputs(result_dir) == read_outputs(expected_dir)
+
+    def test_broken_file_is_skipped_entirely(self, tmp_path, data_dir, merchants_df, capsys):
+        """途中でエラーになったファイルは、処理済みのチャンクも含めて結果に含まれない"""
+        (data_dir / "2024_03.csv").write_bytes(
+            (HEADER + '2024/03/01,GITHUB INC,"4,800",\n2024/03/02,GITHUB INC,abc,\n').encode(
+                "cp932"
+            )
+        )
+        result_dir = tmp_path / "result"
+        result_dir.mkdir()
+
+        main.stream_transaction_analysis(str(data_dir), merchants_df, str(result_dir), 1)
+
+        assert "警告: ファイル 2024_03.csv の読み込み中にエラーが発生しました" in capsys.readouterr().out
+        concatenated = pd.read_csv(result_dir / "concatenated.csv")
+        assert not concatenated["ご利用日"].str.startswith("2024/03").any()
+        grouped = pd.read_csv(result_dir / "grouped.csv", index_col=0)
+        assert grouped.loc["GITHUB INC", "回数"] == 2
+
+    def test_no_files(self, tmp_path, merchants_df):
+        """CSVファイルがない場合は何も書き出さない"""
+        empty_dir = tmp_path / "empty"
+        empty_dir.mkdir()
+
+        assert not main.stream_transaction_analysis(
+            str(empty_dir), merchants_df, str(tmp_path), 10
+        )
+        assert not os.path.exists(tmp_path / "concatenated.csv")
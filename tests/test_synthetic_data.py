@@ -0,0 +1,46 @@
+"""
+ベンチマーク用の合成データのテスト
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from benchmarks.synthetic_data import generate_dataset
+
+
+class TestGenerateDataset:
+    """合成データの生成のテスト"""
+
+    def test_dataset_can_be_analyzed(self, tmp_path):
+        """生成した明細と取引先マスターデータをそのまま分析できる"""
+        data_dir, merchant_config = generate_dataset(
+            str(tmp_path), rows=2000, files=4, merchants=50, foreign_ratio=0.1, years=[2023, 2024]
+        )
+
+        assert sorted(os.listdir(data_dir)) == [f"statement_{i:04d}.csv" for i in range(1, 5)]
+        df = main.load_transaction_data(data_dir, period=None)
+        assert len(df) == 2000
+
+        merchants_df = main.load_merchant_config(path=merchant_config)
+        df = main.preprocess_transaction_data(df, main.analysis_period("2024"))
+        df = main.identify_corporate_transactions(df, merchants_df)
+
+        assert df["ご利用日"].dt.year.eq(2024).all()
+        assert 0 < df["現地通貨建て金額"].notna().mean() < 0.2
+        # 一部の取引内容だけがマスターデータのルールに一致する
+        assert 0 < (df["merchant_category"] != "").mean() < 1
+
+    def test_statements_are_in_date_order(self, tmp_path):
+        """各ファイルはご利用日順で、ファイル同士の期間は重ならない"""
+        data_dir, _ = generate_dataset(str(tmp_path), rows=1000, files=3, merchants=20)
+
+        ranges = []
+        for file in sorted(os.listdir(data_dir)):
+            dates = pd.to_datetime(main.read_transaction_csv(os.path.join(data_dir, file))["ご利用日"])
+            assert dates.is_monotonic_increasing
+            ranges.append((dates.min(), dates.max()))
+        assert all(previous[1] <= current[0] for previous, current in zip(ranges, ranges[1:]))
@@ -0,0 +1,249 @@
+"""
+transaction_store のテスト
+"""
+
+import os
+import sys
+from functools import partial
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from aggregation import AggregateState
+from transaction_store import TransactionStore
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+
+
+def write_statement(path, rows):
+    path.write_bytes((HEADER + "\n".join(rows) + "\n").encode("cp932"))
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    write_statement(
+        directory / "2024_01.csv",
+        [
+            '2024/01/05,AMAZON WEB SERVICES,"12,500",',
+            '2024/01/12,ZOOM.US,"2,000","20.00 USD"',
+            "2024/01/05,セブンイレブン,680,",
+        ],
+    )
+    write_statement(
+        directory / "2024_02.csv",
+        ['2024/02/03,GITHUB INC,"4,800",', "2023/12/28,セブンイレブン,680,", "2024/02/10,不明な店,300,"],
+    )
+    return directory
+
+
+@pytest.fixture
+def merchants_df():
+    return pd.DataFrame(
+        {
+            "merchant_name": ["AMAZON WEB SERVICES", "GITHUB INC", "ZOOM.US", "セブンイレブン"],
+            "is_corporate": [3, 3, 3, 2],
+            "category": ["cloud_services", "developer_tools", "business_tools", "コンビニ"],
+        }
+    )
+
+
+def open_store(tmp_path, data_dir, merchants_df):
+    """明細を取り込んで法人取引判定を行ったストアを返す"""
+    store = TransactionStore(str(tmp_path / "store.sqlite3"))
+    main.import_transaction_files(store, str(data_dir))
+    store.classify(merchants_df, partial(main.identify_corporate_transactions, merchants_df=merchants_df))
+    return store
+
+
+def row_count(store):
+    return store.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+
+class TestImport:
+    """取り込みのテスト"""
+
+    def test_reimport_is_idempotent(self, tmp_path, data_dir, merchants_df):
+        """取り込み済みのファイルは、更新日時だけが変わっても再度取り込まれない"""
+        open_store(tmp_path, data_dir, merchants_df).close()
+        path = data_dir / "2024_01.csv"
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        assert (store.imported, store.unchanged) == (0, 2)
+        assert row_count(store) == 6
+
+    def test_changed_file_replaces_rows(self, tmp_path, data_dir, merchants_df):
+        """内容が変わったファイルは、そのファイルの行だけが置き換えられる"""
+        open_store(tmp_path, data_dir, merchants_df).close()
+        write_statement(data_dir / "2024_02.csv", ['2024/02/03,GITHUB INC,"5,000",'])
+
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        assert (store.imported, store.replaced, store.unchanged) == (1, 1, 1)
+        assert row_count(store) == 4
+        assert store.query(description="GITHUB")["金額"].tolist() == [5000]
+
+    def test_deleted_file_is_kept(self, tmp_path, data_dir, merchants_df):
+        """データディレクトリから削除したファイルの取引もストアに残る"""
+        open_store(tmp_path, data_dir, merchants_df).close()
+        os.remove(data_dir / "2024_02.csv")
+
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        assert row_count(store) == 6
+
+    def test_overlapping_statement_is_deduplicated(self, tmp_path, data_dir, merchants_df):
+        """ほかの明細と重複する取引は問い合わせの結果から除き、先の明細が置き換えられると結果に戻す"""
+        write_statement(
+            data_dir / "2024_ytd.csv",
+            ['2024/01/05,AMAZON WEB SERVICES,"12,500",', "2024/01/05,セブンイレブン,680,", "2024/03/01,ZOOM.US,2100,"],
+        )
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        assert store.duplicates == 2
+        assert row_count(store) == 9
+        assert len(store.query()) == 7
+        assert len(TransactionStore(store.path, deduplicate=False).query()) == 9
+        store.close()
+
+        write_statement(data_dir / "2024_01.csv", ['2024/01/12,ZOOM.US,"2,000","20.00 USD"'])
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        assert store.query(description="AMAZON")["金額"].tolist() == [12500]
+        assert store.query(description="セブンイレブン")["ご利用日"].dt.strftime("%Y-%m-%d").tolist() == [
+            "2023-12-28",
+            "2024-01-05",
+        ]
+
+
+    def test_duplicates_follow_file_name_order(self, tmp_path, data_dir, merchants_df):
+        """後から取り込んだ明細でも、ファイル名順で先の明細の取引を残す（CSV から読み込む場合と同じ）"""
+        write_statement(
+            data_dir / "2024_ytd.csv",
+            ['2024/01/05,AMAZON WEB SERVICES,"12,500",', "2024/01/05,セブンイレブン,680,", "2024/03/01,ZOOM.US,2100,"],
+        )
+        january = data_dir / "2024_01.csv"
+        os.rename(january, tmp_path / "2024_01.csv")
+        open_store(tmp_path, data_dir, merchants_df).close()
+        os.rename(tmp_path / "2024_01.csv", january)
+
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        duplicated = store.conn.execute(
+            "SELECT f.name, COUNT(*) FROM transactions t JOIN files f ON f.id = t.file_id "
+            "WHERE t.duplicate_of IS NOT NULL GROUP BY f.name"
+        ).fetchall()
+        assert duplicated == [("2024_ytd.csv", 2)]
+        assert store.duplicates == 2
+        assert len(store.query()) == 7
+
+
+class TestQuery:
+    """問い合わせのテスト"""
+
+    def test_same_as_loading_csv(self, tmp_path, data_dir, merchants_df):
+        """問い合わせ結果が、CSV から読み込んで前処理・法人取引判定をした結果と同じになる"""
+        period = (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-12-31"))
+        expected = main.identify_corporate_transactions(
+            main.preprocess_transaction_data(main.load_transaction_data(str(data_dir)), period),
+            merchants_df,
+        ).reset_index(drop=True)
+
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        pd.testing.assert_frame_equal(store.query(period), expected)
+
+    def test_filters(self, tmp_path, data_dir, merchants_df):
+        """期間・取引内容（前方一致）・カテゴリ・法人取引フラグで絞り込める"""
+        store = open_store(tmp_path, data_dir, merchants_df)
+        january = (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-31"))
+
+        assert store.query(january)["ご利用内容"].tolist() == [
+            "AMAZON WEB SERVICES",
+            "セブンイレブン",
+            "ZOOM.US",
+        ]
+        assert store.query(description="AMAZON")["金額"].tolist() == [12500]
+        assert store.query(category="コンビニ")["ご利用日"].dt.strftime("%Y-%m-%d").tolist() == [
+            "2023-12-28",
+            "2024-01-05",
+        ]
+        assert store.query(is_corporate=3)["ご利用内容"].nunique() == 3
+        # 判定結果のない取引内容は既定値（カテゴリは空文字列、フラグは 0）で絞り込める
+        assert store.query(category="", is_corporate=0)["ご利用内容"].tolist() == ["不明な店"]
+
+    def test_aggregate(self, tmp_path, data_dir, merchants_df):
+        """データベース上での集計結果が、問い合わせた取引データの集計と一致する"""
+        store = open_store(tmp_path, data_dir, merchants_df)
+        periods = ["month", "week"]
+
+        for period in (None, (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-12-31"))):
+            state = store.aggregate(period, periods)
+            expected = AggregateState.from_frame(store.query(period), periods)
+            pd.testing.assert_frame_equal(state.transaction_frequency(), expected.transaction_frequency())
+            pd.testing.assert_frame_equal(state.corporate_summary(), expected.corporate_summary())
+            for rollup in periods:
+                assert state.rollup(rollup).to_csv() == expected.rollup(rollup).to_csv()
+
+        assert store.aggregate(is_corporate=3).corporate_summary()["取引回数"].to_dict() == {
+            "business_tools": 1,
+            "cloud_services": 1,
+            "developer_tools": 1,
+        }
+
+    def test_master_change_reclassifies(self, tmp_path, data_dir, merchants_df):
+        """マスターデータが変わると、取引内容が判定し直される"""
+        open_store(tmp_path, data_dir, merchants_df).close()
+        merchants_df.loc[merchants_df["merchant_name"] == "セブンイレブン", "is_corporate"] = 1
+
+        store = open_store(tmp_path, data_dir, merchants_df)
+
+        assert store.query(description="セブンイレブン")["is_corporate"].tolist() == [1, 1]
+
+
+class TestMainWithStore:
+    """main() でストアを使用した場合のテスト"""
+
+    def test_outputs_are_unchanged(self, tmp_path, data_dir, monkeypatch):
+        """ストアを使用しても、出力ファイルの内容は変わらない"""
+        merchant_config = tmp_path / "merchants.csv"
+        merchant_config.write_bytes(
+            "merchant_name,is_corporate,category\nAMAZON,3,cloud_services\nセブンイレブン,2,コンビニ\n".encode(
+                "cp932"
+            )
+        )
+        monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+        monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+        monkeypatch.setattr(main, "RUN_REPORT", False)
+        monkeypatch.setattr(main, "ROLLUP_PERIODS", ["month", "week"])
+        run = partial(main.main, data_dir=str(data_dir), merchant_config=str(merchant_config))
+
+        assert run(result_dir=str(tmp_path / "csv")) == 0
+        monkeypatch.setattr(main, "TRANSACTION_STORE_PATH", str(tmp_path / "store.sqlite3"))
+        assert run(result_dir=str(tmp_path / "store")) == 0
+        assert run(result_dir=str(tmp_path / "store_again")) == 0
+        # 取引の行を書き出さない場合は、データベース上の集計だけから書き出す
+        monkeypatch.setattr(main, "OUTPUTS", ["grouped", "corporate_summary", "rollup_month", "rollup_week"])
+        with patch.object(TransactionStore, "query", side_effect=AssertionError("取引の行を読み出した")):
+            assert run(result_dir=str(tmp_path / "summaries")) == 0
+
+        names = sorted(os.listdir(tmp_path / "csv"))
+        assert names == sorted(os.listdir(tmp_path / "store"))
+        for name in names:
+            expected = (tmp_path / "csv" / name).read_bytes()
+            assert (tmp_path / "store" / name).read_bytes() == expected
+            assert (tmp_path / "store_again" / name).read_bytes() == expected
+        assert sorted(os.listdir(tmp_path / "summaries")) == [
+            "corporate_summary.csv",
+            "grouped.csv",
+            "rollup_month.csv",
+            "rollup_week.csv",
+        ]
+        for name in os.listdir(tmp_path / "summaries"):
+            assert (tmp_path / "summaries" / name).read_bytes() == (tmp_path / "csv" / name).read_bytes()
@@ -0,0 +1,171 @@
+"""
+watcher のテスト
+"""
+
+import os
+import sys
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main
+from watcher import StatementWatcher
+
+HEADER = "ご利用日,ご利用内容,金額,海外通貨利用金額\n"
+MERCHANTS_HEADER = "merchant_name,is_corporate,category\n"
+
+
+def write_csv(path, header, rows):
+    path.write_bytes((header + "\n".join(rows) + "\n").encode("cp932"))
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_csv(
+        data_dir / "2024_01.csv",
+        HEADER,
+        [
+            '2024/01/05,AMAZON WEB SERVICES,"12,500",',
+            '2024/01/12,ZOOM.US,"2,000","20.00 USD"',
+            "2024/01/05,セブンイレブン,680,",
+        ],
+    )
+    write_csv(
+        data_dir / "2024_02.csv",
+        HEADER,
+        ['2024/02/03,GITHUB INC,"4,800",', "2023/12/28,セブンイレブン,680,", "2024/02/10,不明な店,300,"],
+    )
+    merchant_config = tmp_path / "merchants.csv"
+    write_csv(merchant_config, MERCHANTS_HEADER, ["AMAZON,3,cloud_services", "セブンイレブン,2,コンビニ"])
+    monkeypatch.setattr(main, "CLASSIFICATION_CACHE_PATH", None)
+    monkeypatch.setattr(main, "INGEST_CACHE_DIR", None)
+    monkeypatch.setattr(main, "RUN_REPORT", False)
+    return tmp_path, data_dir, merchant_config
+
+
+def start_watcher(paths):
+    tmp_path, data_dir, merchant_config = paths
+    watcher = StatementWatcher(
+        str(data_dir), str(merchant_config), str(tmp_path / "watch"), main.analysis_period("2024")
+    )
+    os.makedirs(watcher.result_dir)
+    watcher.start()
+    return watcher
+
+
+def poll_until_settled(watcher):
+    """書き込み途中のファイルを読まないよう、変更は2回目の確認で反映される"""
+    assert not watcher.poll()
+    assert watcher.poll()
+
+
+def assert_same_as_main(paths, name):
+    """ウォッチモードの結果ファイルが、同じ入力で main() を実行した結果と同じであることを確認する"""
+    tmp_path, data_dir, merchant_config = paths
+    result_dir = tmp_path / name
+    run = partial(main.main, data_dir=str(data_dir), merchant_config=str(merchant_config))
+    assert run(result_dir=str(result_dir), target_year="2024") == 0
+
+    names = sorted(os.listdir(result_dir))
+    assert sorted(os.listdir(tmp_path / "watch")) == names
+    for file in names:
+        assert (tmp_path / "watch" / file).read_bytes() == (result_dir / file).read_bytes(), file
+
+
+def touch(path):
+    """内容を書き換えたファイルの更新日時を確実に変える"""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+class TestStatementWatcher:
+    """ウォッチモードのテスト"""
+
+    def test_start(self, paths):
+        """起動時の結果ファイルが main() の結果と同じになる"""
+        watcher = start_watcher(paths)
+
+        assert_same_as_main(paths, "initial")
+        # ファイルごとに変換したカテゴリ型は、結合しても全データをまとめて変換した場合と同じ型になる
+        combined = watcher._combine(sorted(watcher.frames))
+        assert combined["ご利用内容"].cat.categories.is_monotonic_increasing
+        assert combined["merchant_category"].dtype == "category"
+
+    def test_new_file_is_ingested_alone(self, paths, monkeypatch):
+        """追加されたファイルだけを読み込んで結果を更新する"""
+        _, data_dir, _ = paths
+        watcher = start_watcher(paths)
+        read = []
+        original = main.read_transaction_file
+        monkeypatch.setattr(
+            main, "read_transaction_file", lambda path, *args: read.append(path) or original(path, *args)
+        )
+
+        write_csv(
+            data_dir / "2024_03.csv",
+            HEADER,
+            ['2024/03/01,AMAZON WEB SERVICES,"1,000",', '2024/01/05,ZOOM.US,500,"5.00 USD"'],
+        )
+        poll_until_settled(watcher)
+
+        assert read == [str(data_dir / "2024_03.csv")]
+        assert not watcher.poll()
+        assert_same_as_main(paths, "added")
+
+    def test_changed_and_removed_files(self, paths):
+        """変更されたファイルは読み込み直し、削除されたファイルは結果から除く"""
+        _, data_dir, _ = paths
+        watcher = start_watcher(paths)
+
+        write_csv(data_dir / "2024_01.csv", HEADER, ["2024/01/20,セブンイレブン,1200,"])
+        touch(data_dir / "2024_01.csv")
+        os.remove(data_dir / "2024_02.csv")
+        # 削除はすぐに反映し、変更は2回目の確認で反映する
+        assert watcher.poll()
+        assert sorted(watcher.frames) == ["2024_01.csv"]
+        assert watcher.poll()
+        assert watcher.frames["2024_01.csv"]["金額"].tolist() == [1200]
+        assert_same_as_main(paths, "changed")
+
+    def test_master_change_reclassifies_affected(self, paths):
+        """マスターデータの変更では、影響を受ける取引内容だけを判定し直し、判定結果が変わったファイルだけを集計し直す"""
+        _, _, merchant_config = paths
+        watcher = start_watcher(paths)
+        misses = watcher.cache.misses
+        states = dict(watcher.states)
+
+        write_csv(
+            merchant_config,
+            MERCHANTS_HEADER,
+            ["AMAZON,3,cloud_services", "セブンイレブン,2,コンビニ", "GITHUB,3,developer_tools"],
+        )
+        touch(merchant_config)
+        poll_until_settled(watcher)
+
+        # 追加されたルールに一致しうる GITHUB INC だけを照合し直す
+        assert watcher.cache.misses - misses == 1
+        assert watcher.states["2024_01.csv"] is states["2024_01.csv"]
+        assert watcher.states["2024_02.csv"] is not states["2024_02.csv"]
+        assert_same_as_main(paths, "master")
+
+    def test_removed_file_releases_duplicates(self, paths, monkeypatch):
+        """削除されたファイルと重複していたため取引を除いていたファイルは読み込み直す"""
+        _, data_dir, _ = paths
+        monkeypatch.setattr(main, "DEDUPLICATE_TRANSACTIONS", True)
+        write_csv(
+            data_dir / "2024_ytd.csv",
+            HEADER,
+            ['2024/01/05,AMAZON WEB SERVICES,"12,500",', "2024/01/05,セブンイレブン,680,", "2024/03/01,ZOOM.US,2100,"],
+        )
+        watcher = start_watcher(paths)
+        assert len(watcher.frames["2024_ytd.csv"]) == 1
+        assert_same_as_main(paths, "overlapping")
+
+        os.remove(data_dir / "2024_01.csv")
+        assert watcher.poll()
+
+        assert len(watcher.frames["2024_ytd.csv"]) == 3
+        assert_same_as_main(paths, "released")
@@ -0,0 +1,423 @@
+"""
+取引データストア
+
+前処理済み（対象年での絞り込み前）の明細を SQLite のデータベースに一度だけ取り込み、
+ご利用日・取引内容・カテゴリ・法人取引フラグの索引を使って問い合わせます。取引先ごと・カテゴリごと・期間ごとの
+集計はデータベース上で行い、取引の行を読み出さずに集計結果（AggregateState）を作れます。
+取り込み済みのファイルは内容のハッシュ値で判定し、同じファイルを何度取り込んでも行は増えません。
+ほかの明細と重複する取引は取り込むときにフィンガープリントの索引で判定し、問い合わせの結果から除きます。
+重複する取引は、取り込んだ順によらずファイル名順で先の明細の取引として残します（CSV から読み込む場合と同じ）。
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from aggregation import AggregateState
+from classification_cache import master_hash, master_rule_keys
+from dedup import row_fingerprints
+from ingest_cache import file_digest
+
+# テーブルの構成、または前処理の内容を変更したら上げる（既存のデータベースは作り直される）
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    imported_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    file_id INTEGER NOT NULL REFERENCES files (id),
+    line INTEGER NOT NULL,
+    used_on TEXT,
+    description TEXT,
+    amount INTEGER NOT NULL,
+    local_amount REAL,
+    currency TEXT,
+    fingerprint INTEGER NOT NULL,
+    duplicate_of INTEGER,
+    PRIMARY KEY (file_id, line)
+);
+CREATE INDEX IF NOT EXISTS transactions_used_on ON transactions (used_on);
+CREATE INDEX IF NOT EXISTS transactions_description ON transactions (description);
+CREATE INDEX IF NOT EXISTS transactions_fingerprint ON transactions (fingerprint);
+CREATE TABLE IF NOT EXISTS classifications (
+    description TEXT PRIMARY KEY,
+    is_corporate INTEGER NOT NULL,
+    category TEXT,
+    rule TEXT
+);
+CREATE INDEX IF NOT EXISTS classifications_category ON classifications (category);
+CREATE INDEX IF NOT EXISTS classifications_is_corporate ON classifications (is_corporate);
+"""
+
+# 問い合わせ結果の列（法人取引判定済みの取引データと同じ列名・順序）
+COLUMNS = {
+    "ご利用日": "t.used_on",
+    "ご利用内容": "t.description",
+    "金額": "t.amount",
+    "現地通貨建て金額": "t.local_amount",
+    "通貨": "t.currency",
+    "is_corporate": "COALESCE(c.is_corporate, :default_is_corporate)",
+    "merchant_category": "COALESCE(c.category, :default_category)",
+    "matched_rule": "COALESCE(c.rule, :default_rule)",
+}
+
+# aggregate でデータベース上で集計する単位（期間ごとの集計のため、ご利用日ごとに集計する）
+GROUP_COLUMNS = ("ご利用内容", "merchant_category", "is_corporate", "ご利用日")
+
+STORE_DATE_FORMAT = "%Y-%m-%d"
+
+# フィンガープリントを1回の問い合わせで照合する件数（SQLite の変数の上限より小さくする）
+FINGERPRINT_BATCH_SIZE = 500
+
+
+class TransactionStore:
+    """
+    明細を取り込んだ SQLite のデータベース
+    """
+
+    def __init__(self, path, deduplicate=True):
+        """
+        Args:
+            path (str): データベースファイルのパス（":memory:" の場合はメモリ上に作成する）
+            deduplicate (bool): 問い合わせの結果から、先に取り込んだ明細と重複する取引を除くかどうか
+                （重複の判定は設定にかかわらず取り込み時に行う）
+        """
+        self.path = path
+        self.deduplicate = deduplicate
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self._pending = {}
+        self.imported = 0
+        self.replaced = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        if self._get("version") != str(SCHEMA_VERSION):
+            self._reset()
+
+    def _get(self, key):
+        row = self.conn.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _reset(self):
+        with self.conn:
+            if self.conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is not None:
+                print("取引データストアを作り直します: データベースの形式が変更されました")
+            for table in ("transactions", "files", "classifications", "metadata"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self._set("version", str(SCHEMA_VERSION))
+
+    def close(self):
+        self.conn.close()
+
+    def refresh(self, data_dir, files):
+        """
+        取り込み済みのファイルと照合し、取り込みが必要なファイルを返します。
+
+        サイズと更新日時が同じファイル、または内容のハッシュ値が同じファイルは取り込み済みとして扱います。
+        ストアから行を削除することはないため、データディレクトリからなくなったファイルの行も残ります。
+
+        Args:
+            data_dir (str): 明細CSVが格納されているディレクトリ
+            files (list): 明細CSVのファイル名
+
+        Returns:
+            list: 取り込みが必要なファイル名
+        """
+        entries = {
+            name: (size, mtime_ns, sha256)
+            for name, size, mtime_ns, sha256 in self.conn.execute(
+                "SELECT name, size, mtime_ns, sha256 FROM files"
+            )
+        }
+        stale = []
+        for file in files:
+            stat = os.stat(os.path.join(data_dir, file))
+            entry = entries.get(file)
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                self.unchanged += 1
+                continue
+
+            digest = file_digest(os.path.join(data_dir, file))
+            if entry is not None and entry[2] == digest:
+                # 内容は同じで更新日時だけが変わった
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE files SET size = ?, mtime_ns = ? WHERE name = ?",
+                        (stat.st_size, stat.st_mtime_ns, file),
+                    )
+                self.unchanged += 1
+                continue
+
+            self._pending[file] = (stat.st_size, stat.st_mtime_ns, digest)
+            stale.append(file)
+        return stale
+
+    def append(self, file, df):
+        """
+        refresh で返されたファイルの前処理済みデータを取り込みます。
+        同じ名前のファイルが取り込み済みの場合（明細が更新された場合）は、その行を置き換えます。
+
+        取り込み済みのほかの明細と重複する取引は、duplicate_of にファイル名順で先の明細を記録します
+        （ファイル名順で後の明細の取引として残していた取引は、この明細の取引に置き換えます）。
+        照合はフィンガープリントの索引で行うため、取り込み済みの行数によらず新しい行の数に比例した時間で済みます。
+        置き換えた明細と重複していた取引は、ほかに重複する明細がなければ問い合わせの結果に戻します。
+
+        Args:
+            file (str): 明細CSVのファイル名
+            df (pd.DataFrame): 前処理済み（対象年での絞り込み前）の取引データ
+        """
+        size, mtime_ns, digest = self._pending.pop(file)
+        rows = ()
+        fingerprints = []
+        # 行のないファイルは前処理されないため、ファイルの記録だけを残す
+        if len(df):
+            # SQLite の整数は符号付きのため、同じビット列の int64 として保存する
+            fingerprints = row_fingerprints(df)[0].view(np.int64).tolist()
+            rows = zip(
+                range(len(df)),
+                _nullable(df["ご利用日"].dt.strftime(STORE_DATE_FORMAT)),
+                _nullable(df["ご利用内容"]),
+                df["金額"].astype(np.int64).tolist(),
+                _nullable(df["現地通貨建て金額"]),
+                _nullable(df["通貨"]),
+                fingerprints,
+            )
+        # ファイル単位で1つのトランザクションにまとめ、途中で失敗した場合は取り込み前の状態に戻す
+        with self.conn:
+            row = self.conn.execute("SELECT id FROM files WHERE name = ?", (file,)).fetchone()
+            if row is not None:
+                self.conn.execute("DELETE FROM transactions WHERE file_id = ?", (row[0],))
+                self.conn.execute("DELETE FROM files WHERE id = ?", (row[0],))
+                self._release(row[0])
+                self.replaced += 1
+            file_id = self.conn.execute(
+                "INSERT INTO files (name, size, mtime_ns, sha256, rows, imported_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file, size, mtime_ns, digest, len(df), datetime.now().isoformat(timespec="seconds")),
+            ).lastrowid
+            owners = self._owners(fingerprints)
+            # ファイル名順で後の明細が残していた取引は、この明細の取引を残して重複として扱う
+            names = dict(self.conn.execute("SELECT id, name FROM files"))
+            taken = [fingerprint for fingerprint, owner in owners.items() if names[owner] > file]
+            for fingerprint in taken:
+                del owners[fingerprint]
+            self.conn.executemany(
+                "UPDATE transactions SET duplicate_of = ? WHERE fingerprint = ?",
+                ((file_id, fingerprint) for fingerprint in taken),
+            )
+            self.duplicates += len(taken) + sum(fingerprint in owners for fingerprint in fingerprints)
+            self.conn.executemany(
+                "INSERT INTO transactions "
+                "(file_id, line, used_on, description, amount, local_amount, currency, fingerprint, duplicate_of) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((file_id, *values, owners.get(values[-1])) for values in rows),
+            )
+        self.imported += 1
+
+    def _owners(self, fingerprints):
+        """
+        フィンガープリントごとに、その取引を問い合わせの結果に含めている（重複ではない）明細の ID を返します。
+        """
+        owners = {}
+        for start in range(0, len(fingerprints), FINGERPRINT_BATCH_SIZE):
+            batch = fingerprints[start : start + FINGERPRINT_BATCH_SIZE]
+            owners.update(
+                self.conn.execute(
+                    "SELECT fingerprint, file_id FROM transactions "
+                    f"WHERE duplicate_of IS NULL AND fingerprint IN ({', '.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+        return owners
+
+    def _release(self, file_id):
+        """
+        削除した明細と重複していた取引を、ファイル名順に照合し直します。
+        ほかに重複する明細がない取引は問い合わせの結果に戻します。
+        """
+        released = self.conn.execute(
+            "SELECT t.file_id, t.line, t.fingerprint FROM transactions t JOIN files f ON f.id = t.file_id "
+            "WHERE t.duplicate_of = ? ORDER BY f.name, t.line",
+            (file_id,),
+        ).fetchall()
+        owners = self._owners([fingerprint for _, _, fingerprint in released])
+        for other_id, line, fingerprint in released:
+            owner = owners.setdefault(fingerprint, other_id)
+            self.conn.execute(
+                "UPDATE transactions SET duplicate_of = ? WHERE file_id = ? AND line = ?",
+                (None if owner == other_id else owner, other_id, line),
+            )
+
+    def classify(self, merchants_df, classifier, normalizer=None):
+        """
+        法人取引判定がまだ行われていない取引内容を判定し、結果を保存します。
+
+        マスターデータまたは取引先名の正規化の設定が前回の判定時から変わっている場合は、
+        すべての取引内容を判定し直します。
+
+        Args:
+            merchants_df (pd.DataFrame): 法人取引マスターデータ（None の場合は判定しない）
+            classifier (callable): 「ご利用内容」列だけの DataFrame を受け取り、is_corporate・
+                merchant_category・matched_rule の列を付与して返す関数（identify_corporate_transactions）
+            normalizer (MerchantNormalizer): classifier が使う取引先名の正規化
+
+        Returns:
+            int: 判定した取引内容の数
+        """
+        master_key = "none" if merchants_df is None else master_hash(master_rule_keys(merchants_df))
+        if normalizer is not None:
+            master_key += f":{normalizer.signature}"
+        with self.conn:
+            if self._get("master_hash") != master_key:
+                self.conn.execute("DELETE FROM classifications")
+            descriptions = [
+                description
+                for (description,) in self.conn.execute(
+                    "SELECT DISTINCT t.description FROM transactions t "
+                    "LEFT JOIN classifications c ON c.description = t.description "
+                    "WHERE t.description IS NOT NULL AND c.description IS NULL"
+                )
+            ]
+            # 末尾に欠損値を加え、取引内容が空の行に付ける判定結果（既定値）も同じ関数で求める
+            frame = classifier(pd.DataFrame({"ご利用内容": descriptions + [np.nan]}, dtype=object))
+            flags = frame["is_corporate"].astype(np.int64).tolist()
+            categories = _nullable(frame["merchant_category"])
+            rules = _nullable(frame["matched_rule"])
+            self.conn.executemany(
+                "INSERT INTO classifications (description, is_corporate, category, rule) "
+                "VALUES (?, ?, ?, ?)",
+                zip(descriptions, flags[:-1], categories[:-1], rules[:-1]),
+            )
+            self._set("default_is_corporate", str(flags[-1]))
+            self._set("default_category", categories[-1])
+            self._set("default_rule", rules[-1])
+            self._set("master_hash", master_key)
+        return len(descriptions)
+
+    def query(self, period=None, description=None, category=None, is_corporate=None):
+        """
+        条件に一致する取引を、法人取引判定済みの取引データと同じ形式で返します。
+
+        行の順序は load_transaction_data と同じく、ご利用日・ファイル名・ファイル内の行の順です。
+
+        Args:
+            period (tuple): ご利用日の範囲 (開始日, 終了日)。両端を含む。None の場合は限定しない
+            description (str): 取引内容（前方一致）
+            category (str): 取引先カテゴリ
+            is_corporate (int): 法人取引フラグ
+
+        Returns:
+            pd.DataFrame: 取引データ
+        """
+        where, params = self._conditions(period, description, category, is_corporate)
+        select = ", ".join(f'{expression} AS "{name}"' for name, expression in COLUMNS.items())
+        df = pd.read_sql_query(
+            f"SELECT {select} FROM transactions t "
+            "JOIN files f ON f.id = t.file_id "
+            "LEFT JOIN classifications c ON c.description = t.description "
+            f"WHERE {where} "
+            "ORDER BY t.used_on IS NULL, t.used_on, f.name, t.line",
+            self.conn,
+            params=params,
+        )
+        df["ご利用日"] = pd.to_datetime(df["ご利用日"], format=STORE_DATE_FORMAT)
+        df["金額"] = df["金額"].astype(np.int64)
+        df["現地通貨建て金額"] = df["現地通貨建て金額"].astype(float)
+        df["is_corporate"] = df["is_corporate"].astype(np.int64)
+        # 欠損値は CSV から解析した場合と同じ NaN にする
+        for column in ("ご利用内容", "通貨", "merchant_category", "matched_rule"):
+            df[column] = df[column].astype(object).where(df[column].notna(), np.nan)
+        return df
+
+    def aggregate(self, period=None, periods=(), description=None, category=None, is_corporate=None):
+        """
+        条件に一致する取引を、取引内容・カテゴリ・法人取引フラグ・ご利用日ごとにデータベース上で集計し、
+        集計結果（grouped / corporate_summary / 期間ごとの集計の元になる途中結果）を返します。
+        取引の行は読み出さないため、読み出す行数は取引内容と日付の組み合わせの数で済みます。
+
+        Args:
+            period, description, category, is_corporate: query と同じ
+            periods (Iterable[str]): 期間ごとの集計の単位（"month", "week"）
+
+        Returns:
+            AggregateState: query の結果を AggregateState.from_frame で集計した場合と同じ途中結果
+                （海外取引の行は保持しない）
+        """
+        where, params = self._conditions(period, description, category, is_corporate)
+        select = ", ".join(f'{COLUMNS[name]} AS "{name}"' for name in GROUP_COLUMNS)
+        totals = pd.read_sql_query(
+            f'SELECT {select}, COUNT(*) AS "回数", SUM(t.amount) AS "合計金額" '
+            "FROM transactions t "
+            "LEFT JOIN classifications c ON c.description = t.description "
+            f"WHERE {where} AND t.description IS NOT NULL GROUP BY 1, 2, 3, 4",
+            self.conn,
+            params=params,
+        )
+        totals["ご利用日"] = pd.to_datetime(totals["ご利用日"], format=STORE_DATE_FORMAT)
+        totals = totals.astype({"is_corporate": np.int64, "回数": np.int64, "合計金額": np.int64})
+        totals["merchant_category"] = totals["merchant_category"].astype(object)
+        return AggregateState.from_totals(totals, periods)
+
+    def _conditions(self, period, description, category, is_corporate):
+        conditions = ["t.duplicate_of IS NULL"] if self.deduplicate else ["1"]
+        params = {
+            "default_is_corporate": int(self._get("default_is_corporate") or 0),
+            "default_category": self._get("default_category"),
+            "default_rule": self._get("default_rule"),
+        }
+        if period is not None:
+            conditions.append("t.used_on BETWEEN :start AND :end")
+            params["start"] = period[0].strftime(STORE_DATE_FORMAT)
+            params["end"] = period[1].strftime(STORE_DATE_FORMAT)
+        if description is not None:
+            # 索引を使えるよう、前方一致を範囲の条件で表す
+            conditions.append("t.description >= :prefix AND t.description < :prefix_end")
+            params["prefix"] = description
+            params["prefix_end"] = description + "\U0010ffff"
+        # 判定結果の索引を使えるよう、既定値（判定結果のない行の値）と異なる値は判定結果の列で絞り込む
+        if category is not None:
+            column = "merchant_category" if category == params["default_category"] else None
+            conditions.append(f"{COLUMNS[column] if column else 'c.category'} = :category")
+            params["category"] = category
+        if is_corporate is not None:
+            column = "is_corporate" if int(is_corporate) == params["default_is_corporate"] else None
+            conditions.append(f"{COLUMNS[column] if column else 'c.is_corporate'} = :is_corporate")
+            params["is_corporate"] = int(is_corporate)
+        return " AND ".join(conditions), params
+
+    def report(self):
+        """
+        取り込み・置き換え・取り込み済みのファイル数を表示します。
+        """
+        print(
+            f"取引データストア: 取り込み {self.imported}件（うち置き換え {self.replaced}件） / "
+            f"取り込み済み {self.unchanged}件 / 重複取引 {self.duplicates}件"
+        )
+
+
+def _nullable(series):
+    """
+    欠損値を None にした値のリストを返します。
+    """
+    return series.astype(object).where(series.notna(), None).tolist()
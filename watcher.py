@@ -0,0 +1,367 @@
+"""
+ウォッチモード
+
+データディレクトリと取引先マスターデータを監視し、変更があった場合だけ結果ファイルを更新します。
+読み込み・前処理・法人取引判定済みの取引データと集計の途中結果をファイルごとにメモリに保持するため、
+明細が追加された場合はそのファイルだけを読み込み、マスターデータが変更された場合は
+判定結果が変わりうる取引内容だけを判定し直します。
+
+    python cli.py --watch
+
+変更の検出はファイルのサイズと更新日時のポーリングで行います（追加の依存関係は不要です）。
+コピー途中のファイルを読み込まないよう、サイズと更新日時が2回続けて同じになってから読み込みます。
+"""
+
+import os
+import time
+
+import pandas as pd
+
+import main
+from aggregation import AggregateState
+from classification_cache import ClassificationCache
+from config import WATCH_INTERVAL
+from environment import check_production_environment, print_mode
+from ingest_cache import IngestCache, file_signature
+from instrumentation import RunProfiler
+
+# 法人取引判定で付与される列
+CLASSIFICATION_COLUMNS = ["is_corporate", "merchant_category", "matched_rule"]
+
+
+def concat_frames(frames):
+    """
+    取引データを結合します。
+
+    カテゴリ型の列は、ファイルごとに異なるカテゴリを和集合（compact_transaction_data と同じく文字列順）に
+    揃えてから結合するため、全データをまとめて compact_transaction_data で変換した場合と同じ型になります。
+    """
+    columns = {}
+    for column in frames[0].columns:
+        dtypes = [frame[column].dtype for frame in frames]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+            columns[column] = pd.CategoricalDtype(sorted(set().union(*(dtype.categories for dtype in dtypes))))
+    if columns:
+        frames = [frame.astype(columns) for frame in frames]
+    return pd.concat(frames)
+
+
+class StatementWatcher:
+    """
+    明細CSVと取引先マスターデータの変更を監視し、結果ファイルを更新します。
+    """
+
+    def __init__(self, data_dir, merchant_config, result_dir, period, metadata=None):
+        """
+        Args:
+            data_dir (str): 明細CSVが格納されているディレクトリ
+            merchant_config (str): 取引先マスターデータのパス
+            result_dir (str): 結果を出力するディレクトリ
+            period (tuple): 分析対象期間 (開始日, 終了日)。None の場合は期間を限定しない
+            metadata (dict): 実行レポートなどに記録する情報
+        """
+        self.data_dir = data_dir
+        self.merchant_config = merchant_config
+        self.result_dir = result_dir
+        self.period = period
+        self.metadata = {**(metadata or {}), "watch": True}
+        # マスターデータの変更で影響を受ける取引内容を求めるため、分類キャッシュは常に使う
+        # （CLASSIFICATION_CACHE_PATH が None の場合はメモリ上だけで保持する）
+        self.cache = ClassificationCache.load(
+            main.CLASSIFICATION_CACHE_PATH,
+            main.CLASSIFICATION_CACHE_MAX_ENTRIES,
+            main.merchant_normalizer(),
+        )
+        self.merchants_df = None
+        # ファイル名 -> 法人取引判定済みの取引データ / 集計の途中結果 / 読み込んだときのサイズと更新日時
+        self.frames = {}
+        self.states = {}
+        self.signatures = {}
+        self.master_signature = None
+        # 明細をまたいだ重複取引の除外（ファイルを読み込んだ順に、先に読み込んだ明細の取引を残す）。
+        # 取込キャッシュのディレクトリがあれば、判定結果をそこに保存して次回の起動時に使う
+        self.deduplicator = (
+            main.load_deduplicator(main.INGEST_CACHE_DIR, data_dir, period, "preprocessed")
+            if main.DEDUPLICATE_TRANSACTIONS
+            else None
+        )
+        # 前回の確認で見つかった、読み込み待ちのファイルのサイズと更新日時
+        self._pending = {}
+        self.updates = 0
+
+    def start(self):
+        """
+        マスターデータとすべての明細を読み込み、結果ファイルを書き出します。取込キャッシュがあれば使います。
+
+        Returns:
+            bool: 結果を書き出した場合は True、処理対象のデータがなかった場合は False
+        """
+        self.master_signature = file_signature(self.merchant_config)
+        self.merchants_df = main.load_merchant_config(self.cache, self.merchant_config)
+
+        files = self._list_files()
+        print(f"処理対象ファイル: {files}")
+        signatures = {file: file_signature(os.path.join(self.data_dir, file)) for file in files}
+        if main.INGEST_CACHE_DIR and files:
+            ingest_cache = IngestCache(main.INGEST_CACHE_DIR, rebuild=main.INGEST_CACHE_REBUILD)
+            results = main._load_transaction_files_with_cache(
+                self.data_dir, files, main.LOAD_WORKERS, ingest_cache, self.period
+            )
+        else:
+            results = main._read_transaction_files(
+                self.data_dir, files, main.LOAD_WORKERS, True, self.period
+            )
+        for file, result in zip(files, results):
+            self._add(file, signatures[file], *result)
+        return self._write()
+
+    def poll(self):
+        """
+        マスターデータとデータディレクトリの変更を1回確認し、変更があれば結果ファイルを更新します。
+
+        Returns:
+            bool: 結果ファイルを更新した場合は True
+        """
+        master_changed = self._master_changed()
+        files = self._list_files()
+        removed = [file for file in self.signatures if file not in files]
+        changed = []
+        for file in files:
+            signature = file_signature(os.path.join(self.data_dir, file))
+            if signature is None or signature == self.signatures.get(file):
+                continue
+            if self._settled(file, signature):
+                changed.append(file)
+        for name in list(self._pending):
+            if name not in files and name != self.merchant_config:
+                del self._pending[name]
+
+        if not (master_changed or removed or changed):
+            return False
+
+        if master_changed:
+            self._reclassify()
+        for file in removed:
+            print(f"削除されたファイルを結果から除きます: {file}")
+            self.signatures.pop(file, None)
+        released = self._release(removed + changed)
+        # 削除・変更されたファイルと重複していたため取引を除いていたファイルも読み込み直す
+        dependents = sorted(released - set(removed) - set(changed))
+        if dependents:
+            print(f"重複取引を除いていたファイルを読み込み直します: {dependents}")
+        if changed:
+            print(f"追加・変更されたファイルを読み込みます: {changed}")
+        if changed or dependents:
+            signatures = {file: self._pending.pop(file) for file in changed}
+            signatures.update({file: self.signatures[file] for file in dependents})
+            reread = sorted(changed + dependents)
+            results = main._read_transaction_files(
+                self.data_dir, reread, main.LOAD_WORKERS, True, self.period
+            )
+            for file, result in zip(reread, results):
+                self._add(file, signatures[file], *result)
+
+        self._write()
+        return True
+
+    def run(self, interval, cycles=None):
+        """
+        start() の後、interval 秒ごとに poll() を繰り返します。Ctrl+C で終了します。
+
+        Args:
+            interval (float): 変更を確認する間隔（秒）
+            cycles (int): 変更を確認する回数（None の場合は終了するまで繰り返す）
+        """
+        self.start()
+        print(f"{self.data_dir} と {self.merchant_config} の監視を開始しました（Ctrl+C で終了）。")
+        try:
+            count = 0
+            while cycles is None or count < cycles:
+                time.sleep(interval)
+                self.poll()
+                count += 1
+        except KeyboardInterrupt:
+            print("監視を終了しました。")
+
+    def _list_files(self):
+        return sorted(f for f in os.listdir(self.data_dir) if f.endswith(".csv"))
+
+    def _settled(self, name, signature):
+        """
+        サイズと更新日時が前回の確認から変わっていない場合に True を返します（書き込み途中のファイルを読まない）。
+        """
+        if self._pending.get(name) == signature:
+            return True
+        self._pending[name] = signature
+        return False
+
+    def _master_changed(self):
+        signature = file_signature(self.merchant_config)
+        if signature == self.master_signature or not self._settled(self.merchant_config, signature):
+            return False
+        del self._pending[self.merchant_config]
+        self.master_signature = signature
+        return True
+
+    def _add(self, file, signature, df, error):
+        """
+        読み込んだ明細を法人取引判定・集計して保持します。
+        """
+        self.signatures[file] = signature
+        if error is not None:
+            # ファイルが再度変更されるまで読み込み直さない
+            print(f"警告: ファイル {file} の読み込み中にエラーが発生しました: {error}")
+            return
+        if df is None or df.empty:
+            return
+        if self.deduplicator is not None:
+            self.deduplicator.begin(file, signature)
+            df = self.deduplicator.filter(df)
+            self.deduplicator.commit()
+        if main.COMPACT_DTYPES:
+            df = main.compact_transaction_data(df)
+        df = main.identify_corporate_transactions(df, self.merchants_df, self.cache)
+        self.frames[file] = df
+        self.states[file] = AggregateState.from_frame(df, main.ROLLUP_PERIODS, keep_foreign=False)
+
+    def _release(self, files):
+        """
+        ファイルの取引と集計の途中結果を破棄します。
+
+        Returns:
+            set: 破棄したファイル名。重複取引を除いている場合は、破棄したファイルと重複していたため
+                取引を除いていたファイル（読み込み直す必要がある）を含む
+        """
+        released = set()
+        pending = list(files)
+        while pending:
+            file = pending.pop()
+            if file in released:
+                continue
+            released.add(file)
+            self.frames.pop(file, None)
+            self.states.pop(file, None)
+            if self.deduplicator is not None:
+                pending.extend(self.deduplicator.remove(file))
+        return released
+
+    def _reclassify(self):
+        """
+        マスターデータを読み込み直し、判定結果が変わったファイルだけを集計し直します。
+
+        分類キャッシュがマスターデータの変更の影響を受ける取引内容だけを無効化するため、
+        照合し直すのはそれらの取引内容だけです。
+        """
+        print(f"取引先マスターデータが変更されました: {self.merchant_config}")
+        self.merchants_df = main.load_merchant_config(self.cache, self.merchant_config)
+        reaggregated = []
+        for file, df in self.frames.items():
+            classified = main.identify_corporate_transactions(
+                df.drop(columns=CLASSIFICATION_COLUMNS), self.merchants_df, self.cache
+            )
+            self.frames[file] = classified
+            if not all(
+                df[column].astype(object).equals(classified[column].astype(object))
+                for column in ("is_corporate", "merchant_category")
+            ):
+                self.states[file] = AggregateState.from_frame(
+                    classified, main.ROLLUP_PERIODS, keep_foreign=False
+                )
+                reaggregated.append(file)
+        print(f"判定結果が変わったため集計し直したファイル: {reaggregated}")
+
+    def _combine(self, files):
+        return concat_frames([self.frames[file] for file in files]).sort_values("ご利用日", kind="stable")
+
+    def _write(self):
+        """
+        保持している取引データと集計の途中結果を結合し、publish() で結果を更新します。
+        """
+        files = sorted(self.frames)
+        if not files:
+            print("警告: 処理対象のデータがありません。")
+            return False
+
+        profiler = RunProfiler()
+        # 読み込み時と同じく、ファイル名順に結合してからご利用日で安定ソートする
+        df = profiler.measure("combine", self._combine, files)
+        merged = profiler.measure(
+            "aggregate", AggregateState.merge, [self.states[file] for file in files]
+        )
+        state = AggregateState(merged.base, merged.periods, main.get_foreign_transactions(df))
+        self.publish(df, state, profiler)
+        main._save_classification_cache(self.cache)
+        if self.deduplicator is not None:
+            self.deduplicator.save()
+        self.updates += 1
+        print(f"結果を更新しました: {len(df)}件（{len(files)}ファイル）")
+        return True
+
+    def publish(self, df, state, profiler):
+        """
+        結合した取引データと集計結果から、結果ファイルと実行レポートを書き出します。
+        サブクラスで置き換えると、更新された結果の使い道を変えられます。
+
+        Args:
+            df (pd.DataFrame): ご利用日順に並んだ法人取引判定済みの取引データ
+            state (AggregateState): df の集計結果（海外取引の行を含む）
+            profiler (RunProfiler): 段階ごとの計測結果の記録先
+        """
+        main.write_analysis_results(df, self.result_dir, self.metadata, profiler, state)
+        main._save_run_report(profiler, self.result_dir, self.metadata)
+
+
+def watch(data_dir=None, merchant_config=None, result_dir=None, target_year=None, mode_test=None, interval=None):
+    """
+    ウォッチモードで実行します。引数を省略した場合は config.py の設定値を使用します。
+
+    Args:
+        data_dir (str): 明細CSVが格納されているディレクトリ
+        merchant_config (str): 取引先マスターデータのパス
+        result_dir (str): 結果を出力するディレクトリ
+        target_year (str): 分析対象年（空文字列の場合はすべての年）
+        mode_test (bool): テストモードで実行するかどうか
+        interval (float): 変更を確認する間隔（秒。None の場合は WATCH_INTERVAL）
+
+    Returns:
+        int: 終了コード（正常終了の場合は 0）
+    """
+    arguments = resolve_arguments(data_dir, merchant_config, target_year, mode_test)
+    if arguments is None:
+        return 1
+    data_dir, merchant_config, period, metadata = arguments
+    result_dir = result_dir or main.RESULT_DIR
+    os.makedirs(result_dir, exist_ok=True)
+
+    watcher = StatementWatcher(data_dir, merchant_config, result_dir, period, metadata)
+    watcher.run(WATCH_INTERVAL if interval is None else interval)
+    return 0
+
+
+def resolve_arguments(data_dir, merchant_config, target_year, mode_test):
+    """
+    監視する入力と分析対象期間を、main() と同じく引数と config.py の設定から求めます。
+    入力ファイルの確認に失敗した場合や、監視と組み合わせられない設定の場合は None を返します。
+
+    Returns:
+        tuple: (データディレクトリ, 取引先マスターデータ, 分析対象期間, 実行レポートなどに記録する情報)
+    """
+    if mode_test is None:
+        mode_test = main.MODE_TEST
+    default_data_dir, default_merchant_config = main.default_paths(mode_test)
+    data_dir = data_dir or default_data_dir
+    merchant_config = merchant_config or default_merchant_config
+
+    print_mode(mode_test)
+    if not mode_test and not check_production_environment(data_dir, merchant_config):
+        return None
+    if main.STREAMING or main.PARTITIONS:
+        print("警告: ウォッチモードではストリーミングモードと複数期間の一括分析は使用できません。")
+        return None
+    os.makedirs(data_dir, exist_ok=True)
+
+    period = main.analysis_period(target_year)
+    metadata = {"target_year": main.TARGET_YEAR if target_year is None else target_year}
+    if period is not None:
+        metadata["period"] = [period[0].isoformat(), period[1].isoformat()]
+    return data_dir, merchant_config, period, metadata